@@ -1,41 +1,225 @@
 import os
+import asyncio
+import contextvars
+import json
+import logging
+import threading
+import time
 import uuid
-import tempfile
-from typing import Dict, Any
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict
 
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
-from fastapi.responses import JSONResponse
+import numpy as np
 
-from pipeline_full import speech_to_text, extract_fields
-from validator import validate_data, build_message
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+from pipeline_full import transcribe_audio, aextract_fields, transcript_cache, extraction_cache
+from validator import validate_data, build_message, NO_SPEECH_MESSAGE
 from agent_utils import merge_data
 from plate_normalizer import normalize_license_plate
-from romanize import romanize_person
+from romanize import ROMANIZE_AHEAD, aromanize_names, aromanize_person, keep_current, names_to_prefetch, romanize_cache
+from stt_pool import STTQueueFull, JobStoreFull, get_stt_pool, get_job_store
+from stt_batcher import batcher_stats
+from model_loader import model_state, start_background_load
+from whisper_server import WHISPER_SERVER_SOCKET, remote_model_state
+from audio_io import AudioRejected, load_audio, AUDIO_MAX_BYTES, AUDIO_MAX_SECONDS
+from preprocess import NoSpeech, preprocess_audio, preprocess_stats
+from streaming import SegmentBuffer, provisional_fields
+from llm_client import LLMTimeout, request_deadline, aclose as close_llm_client
+from llm_scheduler import PRIORITY_COMPLETION, PRIORITY_SPECULATIVE, get_scheduler, notify_on_slot
+from session_store import create_session_store
+from decode_profiles import first_turn_profile, select_profile
+import metrics
+from metrics import request_timings, server_timing, span
+
+# โหลด Whisper ใน background ตอน start server (ปิดได้ด้วย WHISPER_PRELOAD=0)
+WHISPER_PRELOAD = os.getenv("WHISPER_PRELOAD", "1") == "1"
+
+# เวลารวมที่ยอมให้หนึ่ง request ใช้ (วินาที) LLM call จะได้ timeout เท่าที่เหลือ
+REQUEST_BUDGET_SECONDS = float(os.getenv("REQUEST_BUDGET_SECONDS", "120"))
+
+# log ของ pipeline (transcript, timing) ปิดได้ด้วย LOG_LEVEL=WARNING
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # ใช้ model server ร่วมกัน (WHISPER_SERVER_SOCKET) -> worker นี้ไม่ต้องโหลด Whisper
+    if WHISPER_PRELOAD and not WHISPER_SERVER_SOCKET:
+        start_background_load()
+    yield
+    await close_llm_client()
+
+app = FastAPI(title="Voice Input Validation API", version="1.0", lifespan=lifespan)
+
+# endpoint ที่รับไฟล์เสียง และส่วนของ body ที่ไม่ใช่ตัวไฟล์ (boundary / header ของ multipart / session_id)
+UPLOAD_PATHS = {"/process-audio", "/submit-audio"}
+UPLOAD_OVERHEAD_BYTES = 64 * 1024
+
+class UploadSizeLimit:
+    """
+    ปฏิเสธ upload ที่ใหญ่เกินก่อน Starlette spool body ทั้งก้อนลง memory / disk
+    (ตอน endpoint อ่าน UploadFile ทีละ chunk body ถูกรับครบไปแล้ว)
+    - Content-Length เกิน -> ตอบ 413 ทันทีโดยไม่อ่าน body
+    - ไม่มี Content-Length (chunked) -> นับ byte ระหว่างรับ เกินเมื่อไหร่ก็หยุดรับแล้วตอบ 413
+    """
+
+    def __init__(self, app, max_bytes: int = AUDIO_MAX_BYTES + UPLOAD_OVERHEAD_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in UPLOAD_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        detail = f"request body is larger than {self.max_bytes} bytes"
+        length = dict(scope["headers"]).get(b"content-length", b"")
+        if length.isdigit() and int(length) > self.max_bytes:
+            await JSONResponse({"detail": detail}, status_code=413)(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # raise ระหว่าง parse form -> FastAPI ส่งต่อ HTTPException เป็น 413
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+# เพิ่มก่อน timing_middleware: timing อยู่ชั้นนอกจึงนับ 413 ใน /metrics ด้วย
+app.add_middleware(UploadSizeLimit)
+
+@app.exception_handler(LLMTimeout)
+async def llm_timeout_handler(request, exc: LLMTimeout):
+    return JSONResponse({"detail": str(exc)}, status_code=504)
+
+class ClientDisconnected(Exception):
+    """client ตัดการเชื่อมต่อก่อน pipeline เสร็จ งานที่เหลือถูกยกเลิก"""
+
+@app.exception_handler(ClientDisconnected)
+async def client_disconnected_handler(request, exc: ClientDisconnected):
+    # client ไปแล้ว ไม่มีใครอ่านคำตอบนี้ (499 = client closed request) ใช้นับใน /metrics
+    return JSONResponse({"detail": str(exc)}, status_code=499)
+
+@app.middleware("http")
+async def timing_middleware(request: Request, call_next):
+    """
+    จับเวลาทั้ง request และเวลาแต่ละ stage (span) ข้างใน
+    - ส่ง breakdown กลับใน header Server-Timing (เช่น upload;dur=3.1, stt;dur=812.4, ...)
+    - นับ request / latency ต่อ endpoint ใน /metrics
+    """
+    start = time.perf_counter()
+    with request_timings() as timings:
+        response = await call_next(request)
+    elapsed = time.perf_counter() - start
 
-app = FastAPI(title="Voice Input Validation API", version="1.0")
+    route = request.scope.get("route")
+    endpoint = getattr(route, "path", "unmatched")
+    metrics.REQUESTS.inc(endpoint=endpoint, status=str(response.status_code))
+    metrics.REQUEST_SECONDS.observe(elapsed, endpoint=endpoint)
+
+    timings["total"] = elapsed
+    response.headers["Server-Timing"] = server_timing(timings)
+    return response
 
 # -------------------------
-# In-memory session store
+# Session store
 # -------------------------
-# sessions[session_id] = {
+# SESSION_STORE=memory (default) หรือ sqlite (ใช้ร่วมกันได้หลาย uvicorn worker)
+# sessions.get(session_id) -> {
 #   "data": {...},
 #   "missing_fields": [...],
+#   "language": "th",   # ภาษาที่ detect ได้ในรอบแรก ใช้ล็อกภาษาในรอบถัดไป
+#   "romanized": {"สมชาย": "Somchai"},   # ชื่อที่ romanize ล่วงหน้าไว้แล้ว (ดู _romanize_ahead)
 # }
-sessions: Dict[str, Dict[str, Any]] = {}
+sessions = create_session_store()
+
+# romanize ล่วงหน้าที่กำลังรันใน process นี้:
+# session_id -> (ชื่อที่ส่งไป, task ที่คืน {ชื่อไทย: ชื่ออังกฤษ}, event ที่ set เมื่อ task ได้ slot LLM)
+_romanize_tasks: Dict[str, tuple[list[str], asyncio.Task, threading.Event]] = {}
 
-def _save_upload_to_temp(upload: UploadFile) -> str:
+def _romanize_ahead(session_id: str, data: Dict[str, Any], known: Dict[str, str]) -> None:
     """
-    บันทึกไฟล์ upload ลง temp แล้วคืน path ออกมา
-    เหตุผล: faster-whisper ชอบทำงานกับ path ไฟล์
+    session ยังไม่ครบแต่ชื่อผ่าน validate_name แล้ว -> romanize ไว้ใน background (priority ต่ำสุด)
+    ผลเก็บไว้ใน session["romanized"] รอบที่ครบจะใช้ผลนี้แทนการรอ LLM
+    ชื่อที่ถูก merge_data เปลี่ยนทีหลังจะถูกทิ้ง (keep_current)
     """
-    suffix = os.path.splitext(upload.filename or "")[1] or ".wav"
-    fd, path = tempfile.mkstemp(suffix=suffix)
-    os.close(fd)
+    if not ROMANIZE_AHEAD:
+        return
+    names = names_to_prefetch(data, known)
+    running = _romanize_tasks.get(session_id)
+    if not names or (running is not None and running[0] == names and not running[1].done()):
+        return
+    started = threading.Event()
+
+    async def _run() -> Dict[str, str]:
+        try:
+            with notify_on_slot(started):
+                result = dict(zip(names, await aromanize_names(names, priority=PRIORITY_SPECULATIVE)))
+        except Exception as e:
+            logger.info("romanize ahead failed (session %s): %s", session_id, e)
+            return {}
+
+        # แก้เฉพาะ romanized ของ record ล่าสุดแบบ atomic: ไม่ทับรอบใหม่ที่ worker อื่นเขียน
+        # และไม่สร้าง session ที่จบ (ถูกลบ) ไปแล้วขึ้นมาใหม่
+        def _merge(record: Dict[str, Any]) -> Dict[str, Any] | None:
+            romanized = keep_current({**record.get("romanized", {}), **result}, record["data"])
+            if romanized == record.get("romanized", {}):
+                return None
+            return {**record, "romanized": romanized}
+
+        await sessions.aupdate(session_id, _merge)
+        return result
 
-    with open(path, "wb") as f:
-        f.write(upload.file.read())
+    # context ใหม่: ไม่ผูกกับ deadline / timing ของ request ที่เริ่มงานนี้
+    task = asyncio.get_running_loop().create_task(_run(), context=contextvars.Context())
+    _romanize_tasks[session_id] = (names, task, started)
 
-    return path
+    def _forget(t: asyncio.Task) -> None:
+        running = _romanize_tasks.get(session_id)
+        if running is not None and running[1] is t:
+            del _romanize_tasks[session_id]
+
+    task.add_done_callback(_forget)
+
+async def _romanized_so_far(session_id: str, data: Dict[str, Any]) -> Dict[str, str]:
+    """
+    ผล romanize ล่วงหน้าของชื่อใน data
+    task ที่ได้ slot LLM แล้ว -> รอผล (shield: request นี้หลุดก็ไม่ยกเลิกงานที่แชร์กับ session)
+    task ที่ยังรอคิว (priority ต่ำสุด) -> ยกเลิก ให้รอบที่ครบ romanize เองที่ PRIORITY_COMPLETION
+    แทนการรอหลัง extract รอบแรกของ user อื่นทั้งหมด
+    """
+    record = await sessions.aget(session_id) or {}
+    known = keep_current(record.get("romanized", {}), data)
+
+    running = _romanize_tasks.get(session_id)
+    if running is not None:
+        _, task, started = running
+        if task.done() or started.is_set():
+            known.update(keep_current(await asyncio.shield(task), data))
+        else:
+            task.cancel()
+    return known
+
+def _read_upload_audio(upload: UploadFile) -> np.ndarray:
+    """
+    อ่านไฟล์ upload ทีละ chunk แล้ว decode เป็น NumPy 16 kHz mono ในหน่วยความจำ
+    ไม่ต้องเขียน temp file (faster-whisper รับ array ได้โดยตรง)
+    ไฟล์ใหญ่/ยาวเกินกำหนดจะถูกปฏิเสธระหว่างอ่าน
+    """
+    try:
+        return load_audio(upload.file, upload.filename or "")
+    except AudioRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
 
 def _normalize_fields(data: Dict[str, Any]) -> Dict[str, Any]:
     """
@@ -45,88 +229,249 @@ def _normalize_fields(data: Dict[str, Any]) -> Dict[str, Any]:
         data["license_plate"] = normalize_license_plate(data["license_plate"])
     return data
 
-@app.post("/process-audio")
-def process_audio(audio: UploadFile = File(...)):
+async def _preprocess(audio: np.ndarray) -> np.ndarray:
+    """ตัดช่วงเงียบหัว/ท้าย และจำกัดความยาว ก่อนเข้าคิว STT (raise NoSpeech ถ้าไม่มีเสียงพูด)"""
+    with span("preprocess"):
+        audio, _ = await run_in_threadpool(preprocess_audio, audio)
+    return audio
+
+async def _transcribe(audio: np.ndarray, block: bool = False, profile: Dict[str, Any] | None = None) -> Dict[str, Any]:
     """
-    รอบแรก:
-    - รับไฟล์เสียง
-    - STT -> Extract (ทุก field) -> Normalize -> Validate
-    - ถ้าไม่ครบ: สร้าง session_id แล้วคืนให้
+    ส่งงาน STT เข้า worker pool คืน {"text", "language", "profile"}
+    รอผลแบบ await (decode อยู่ใน thread ของ pool ไม่ใช่ thread ของ request)
+    ถ้าคิวเต็มจะตอบ 503 พร้อม Retry-After ให้ client ลองใหม่
     """
-    temp_path = _save_upload_to_temp(audio)
+    try:
+        with span("stt"):
+            return await get_stt_pool().arun(transcribe_audio, audio, profile, block=block)
+    except STTQueueFull as e:
+        raise HTTPException(
+            status_code=503,
+            detail="STT queue is full, please retry later",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+def _submit_job(fn, *args) -> JSONResponse:
+    """
+    รับงานแบบ async: คืน job_id ทันที แล้วให้ client poll ที่ /jobs/{job_id}
+    ตัว pipeline (coroutine fn) ยังรันบน event loop นี้ thread ของ job store แค่รอผล
+    """
+    loop = asyncio.get_running_loop()
+
+    def _run(block: bool = True) -> Dict[str, Any]:
+        return asyncio.run_coroutine_threadsafe(fn(*args, block=block), loop).result()
 
     try:
-        transcript = speech_to_text(temp_path)
-        data = extract_fields(transcript, expected_fields=[])
+        job = get_job_store().submit(_run, block=True)
+    except JobStoreFull as e:
+        raise HTTPException(
+            status_code=429,
+            detail="too many pending jobs, please retry later",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+    return JSONResponse(job.to_dict(), status_code=202)
+
+async def _until_disconnected(request: Request, pipeline) -> Dict[str, Any]:
+    """
+    รัน pipeline เป็น task แยก และเฝ้า receive channel ของ request ไว้
+    ถ้า client ตัดการเชื่อมต่อ task จะถูก cancel ที่ await ถัดไป (ระหว่าง stage,
+    ระหว่างรอคิว STT / LLM หรือระหว่างอ่าน stream จาก Ollama) ไม่ต้องเสีย Whisper / LLM ต่อ
+    """
+    task = asyncio.ensure_future(pipeline)
+
+    async def _watch() -> None:
+        # body ถูกอ่านไปหมดแล้ว ข้อความถัดไปจะมีแค่ http.disconnect
+        while (await request.receive())["type"] != "http.disconnect":
+            pass
+        task.cancel()
+
+    watcher = asyncio.ensure_future(_watch())
+    try:
+        return await task
+    except asyncio.CancelledError:
+        if watcher.done() and not watcher.cancelled():
+            raise ClientDisconnected("client disconnected before the pipeline finished")
+        raise
+    finally:
+        watcher.cancel()
+
+# -------------------------
+# Server-Sent Events
+# -------------------------
+# emit(event, data): ส่งผลของแต่ละ stage ออกไปทันทีที่เสร็จ (ใช้กับ stream=true)
+Emit = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+async def _no_emit(event: str, data: Dict[str, Any]) -> None:
+    return None
+
+def _wants_event_stream(request: Request, stream: bool) -> bool:
+    return stream or "text/event-stream" in request.headers.get("accept", "")
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def _event_stream(pipeline: Callable[[Emit], Awaitable[Dict[str, Any]]]) -> StreamingResponse:
+    """
+    รัน pipeline แล้วส่ง event ของแต่ละ stage เป็น text/event-stream:
+    transcript -> fields -> validation -> romanized (เมื่อครบ) -> result (body เดียวกับแบบ JSON)
+    error ระหว่างทางส่งเป็น event "error" ({"status_code", "detail"})
+    client ตัดการเชื่อมต่อ: Starlette หยุด generator แล้ว pipeline ที่เหลือถูก cancel
+    """
+    events: asyncio.Queue = asyncio.Queue()
 
+    async def emit(event: str, data: Dict[str, Any]) -> None:
+        await events.put(_sse(event, data))
+
+    async def run() -> None:
+        try:
+            await emit("result", await pipeline(emit))
+        except HTTPException as e:
+            await emit("error", {"status_code": e.status_code, "detail": e.detail})
+        except LLMTimeout as e:
+            await emit("error", {"status_code": 504, "detail": str(e)})
+        except Exception:
+            logger.exception("event stream pipeline failed")
+            await emit("error", {"status_code": 500, "detail": "internal error"})
+        finally:
+            await events.put(None)
+
+    async def body():
+        task = asyncio.ensure_future(run())
+        try:
+            while (chunk := await events.get()) is not None:
+                yield chunk
+        finally:
+            task.cancel()
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def _process_first_turn(audio: np.ndarray, block: bool = False, emit: Emit = _no_emit) -> Dict[str, Any]:
+    """
+    รอบแรก: STT -> Extract (ทุก field) -> Normalize -> Validate
+    ถ้าไม่ครบจะเปิด session ใหม่
+    """
+    try:
+        audio = await _preprocess(audio)
+    except NoSpeech:
+        # ไม่มีเสียงพูด -> ให้พูดใหม่ทันที ไม่ต้องเสียคิว STT / LLM
+        return {"status": "no_speech", "message": NO_SPEECH_MESSAGE, "transcript": ""}
+
+    with request_deadline(REQUEST_BUDGET_SECONDS):
+        stt = await _transcribe(audio, block=block)
+        await _emit_transcript(emit, stt)
+        return await _first_turn_from_transcript(stt["text"], stt, emit)
+
+async def _emit_transcript(emit: Emit, stt: Dict[str, Any]) -> None:
+    await emit("transcript", {
+        "transcript": stt["text"],
+        "language": stt["language"],
+        "decode_profile": stt["profile"],
+        "stt_skipped_seconds": stt.get("skipped_seconds", 0.0),
+    })
+
+async def _first_turn_from_transcript(transcript: str, stt: Dict[str, Any], emit: Emit = _no_emit) -> Dict[str, Any]:
+    with span("extract"):
+        data = await aextract_fields(transcript, expected_fields=[])
+
+    with span("normalize"):
         data = _normalize_fields(data)
+    await emit("fields", {"data": data})
 
+    with span("validate"):
         status, missing = validate_data(data)
 
-        # ครบแล้ว -> romanize แล้วจบ
-        if status == "complete":
-            data = romanize_person(data)
-            return JSONResponse(
-                {
-                    "status": "complete",
-                    "data": data,
-                    "transcript": transcript, 
-                }
-            )
-
-        # ถ้าไม่ครบจะเปิด session
-        session_id = str(uuid.uuid4())
-        sessions[session_id] = {
+    # ครบแล้ว -> romanize แล้วจบ
+    if status == "complete":
+        await emit("validation", {"status": "complete", "missing_fields": []})
+        with span("romanize"):
+            data = await aromanize_person(data)
+        await emit("romanized", {"data": data})
+        return {
+            "status": "complete",
             "data": data,
-            "missing_fields": missing,
+            "transcript": transcript,
+            "decode_profile": stt["profile"],
         }
 
-        return JSONResponse(
-            {
-                "status": "incomplete",
-                "session_id": session_id,
-                "missing_fields": missing,
-                "message": build_message(missing),
-                "transcript": transcript,
-                "data_partial": data,
-            }
-        )
+    # ถ้าไม่ครบจะเปิด session
+    session_id = str(uuid.uuid4())
+    await sessions.aput(session_id, {
+        "data": data,
+        "missing_fields": missing,
+        "language": stt["language"],
+        "romanized": {},
+    })
+    _romanize_ahead(session_id, data, {})
+    await emit("validation", {
+        "status": "incomplete",
+        "session_id": session_id,
+        "missing_fields": missing,
+        "message": build_message(missing),
+    })
 
-    finally:
-        # ลบไฟล์ temp ทิ้ง
-        try:
-            os.remove(temp_path)
-        except OSError:
-            pass
+    return {
+        "status": "incomplete",
+        "session_id": session_id,
+        "missing_fields": missing,
+        "message": build_message(missing),
+        "transcript": transcript,
+        "data_partial": data,
+        "decode_profile": stt["profile"],
+    }
 
-
-@app.post("/submit-audio")
-def submit_audio(
-    session_id: str = Form(...),
-    audio: UploadFile = File(...),
-):
+async def _process_next_turn(
+    session_id: str, audio: np.ndarray, block: bool = False, emit: Emit = _no_emit
+) -> Dict[str, Any]:
     """
-    รอบถัดไป:
-    - รับ session_id + ไฟล์เสียงใหม่
-    - STT -> Extract เฉพาะ missing_fields -> Normalize -> Merge -> Validate
-    - ถ้าครบ: ลบ session
+    รอบถัดไป: STT -> Extract เฉพาะ missing_fields -> Normalize -> Merge -> Validate
+    ถ้าครบจะลบ session
+    STT ใช้ profile รอบถามกลับ (beam เล็ก, ภาษาเดียวกับรอบแรก, prompt ตาม field ที่ถาม)
     """
-    if session_id not in sessions:
+    current = await sessions.aget(session_id)
+    if current is None:
         raise HTTPException(status_code=404, detail="session_id not found")
 
-    temp_path = _save_upload_to_temp(audio)
-
     try:
-        # โหลด state เดิม
-        current = sessions[session_id]
-        current_data = current["data"]
-        missing = current["missing_fields"]
+        audio = await _preprocess(audio)
+    except NoSpeech:
+        # session ยังอยู่ ถาม field เดิมซ้ำ
+        return {
+            "status": "no_speech",
+            "session_id": session_id,
+            "missing_fields": current["missing_fields"],
+            "message": NO_SPEECH_MESSAGE,
+            "transcript": "",
+            "data_partial": current["data"],
+        }
 
-        transcript = speech_to_text(temp_path)
+    profile = select_profile(current["missing_fields"], current.get("language"))
+
+    with request_deadline(REQUEST_BUDGET_SECONDS):
+        stt = await _transcribe(audio, block=block, profile=profile)
+        await _emit_transcript(emit, stt)
+        return await _next_turn_from_transcript(session_id, stt["text"], stt, emit)
+
+async def _next_turn_from_transcript(
+    session_id: str, transcript: str, stt: Dict[str, Any], emit: Emit = _no_emit
+) -> Dict[str, Any]:
+    # โหลด state เดิม
+    current = await sessions.aget(session_id)
+    if current is None:
+        raise HTTPException(status_code=404, detail="session_id not found")
 
-        # จำกัดให้ extract เฉพาะ field ที่ถาม (ช่วยลดหลุด)
-        new_data = extract_fields(transcript, expected_fields=missing)
+    current_data = current["data"]
+    missing = current["missing_fields"]
 
+    # จำกัดให้ extract เฉพาะ field ที่ถาม (ช่วยลดหลุด)
+    with span("extract"):
+        new_data = await aextract_fields(transcript, expected_fields=missing)
+
+    with span("normalize"):
         new_data = _normalize_fields(new_data)
 
         # merge เฉพาะ field ที่ถาม
@@ -134,41 +479,322 @@ def submit_audio(
 
         # normalize ซ้ำหลัง merge (กันเคสได้ค่าแปลก)
         merged = _normalize_fields(merged)
+    await emit("fields", {"data": merged})
 
+    with span("validate"):
         status, missing2 = validate_data(merged)
 
-        if status == "complete":
-            merged = romanize_person(merged)
-            # จบแล้ว ลบ session
-            del sessions[session_id]
-
-            return JSONResponse(
-                {
-                    "status": "complete",
-                    "data": merged,
-                    "transcript": transcript,
-                }
-            )
-
-        # ถ้ายังไม่ครบจะ update session แล้วถามต่อ
-        sessions[session_id] = {
+    if status == "complete":
+        await emit("validation", {"status": "complete", "missing_fields": []})
+        with span("romanize"):
+            known = await _romanized_so_far(session_id, merged)
+            merged = await aromanize_person(merged, known=known, priority=PRIORITY_COMPLETION)
+        await emit("romanized", {"data": merged})
+        # จบแล้ว ลบ session
+        await sessions.adelete(session_id)
+
+        return {
+            "status": "complete",
             "data": merged,
-            "missing_fields": missing2,
+            "transcript": transcript,
+            "decode_profile": stt["profile"],
+            "stt_skipped_seconds": stt.get("skipped_seconds", 0.0),
         }
 
-        return JSONResponse(
+    # ถ้ายังไม่ครบจะ update session แล้วถามต่อ
+    # อ่าน romanized ใหม่ (task ล่วงหน้าอาจเขียนไว้ระหว่างรอบนี้) และทิ้งของชื่อที่เปลี่ยนไป
+    latest = await sessions.aget(session_id) or current
+    romanized = keep_current(latest.get("romanized", {}), merged)
+    await sessions.aput(session_id, {
+        "data": merged,
+        "missing_fields": missing2,
+        "language": current.get("language"),
+        "romanized": romanized,
+    })
+    _romanize_ahead(session_id, merged, romanized)
+    await emit("validation", {
+        "status": "incomplete",
+        "session_id": session_id,
+        "missing_fields": missing2,
+        "message": build_message(missing2),
+    })
+
+    return {
+        "status": "incomplete",
+        "session_id": session_id,
+        "missing_fields": missing2,
+        "message": build_message(missing2),
+        "transcript": transcript,
+        "data_partial": merged,
+        "decode_profile": stt["profile"],
+        "stt_skipped_seconds": stt.get("skipped_seconds", 0.0),
+    }
+
+@app.post("/process-audio")
+async def process_audio(
+    request: Request,
+    audio: UploadFile = File(...),
+    async_job: bool = Query(False),
+    stream: bool = Query(False),
+):
+    """
+    รอบแรก:
+    - รับไฟล์เสียง
+    - STT -> Extract (ทุก field) -> Normalize -> Validate
+    - ถ้าไม่ครบ: สร้าง session_id แล้วคืนให้
+    - async_job=true: คืน job_id (202) แล้วไปดึงผลที่ /jobs/{job_id}
+    - stream=true (หรือ Accept: text/event-stream): ตอบเป็น Server-Sent Events ทีละ stage
+    - client ตัดการเชื่อมต่อระหว่างทาง: ยกเลิกงานที่เหลือ
+    """
+    with span("upload"):
+        samples = await run_in_threadpool(_read_upload_audio, audio)
+
+    if async_job:
+        return _submit_job(_process_first_turn, samples)
+
+    if _wants_event_stream(request, stream):
+        return _event_stream(lambda emit: _process_first_turn(samples, emit=emit))
+
+    return JSONResponse(await _until_disconnected(request, _process_first_turn(samples)))
+
+
+@app.post("/submit-audio")
+async def submit_audio(
+    request: Request,
+    session_id: str = Form(...),
+    audio: UploadFile = File(...),
+    async_job: bool = Query(False),
+    stream: bool = Query(False),
+):
+    """
+    รอบถัดไป:
+    - รับ session_id + ไฟล์เสียงใหม่
+    - STT -> Extract เฉพาะ missing_fields -> Normalize -> Merge -> Validate
+    - ถ้าครบ: ลบ session
+    - async_job=true: คืน job_id (202) แล้วไปดึงผลที่ /jobs/{job_id}
+    - stream=true (หรือ Accept: text/event-stream): ตอบเป็น Server-Sent Events ทีละ stage
+    - client ตัดการเชื่อมต่อระหว่างทาง: ยกเลิกงานที่เหลือ
+    """
+    if await sessions.aget(session_id) is None:
+        raise HTTPException(status_code=404, detail="session_id not found")
+
+    with span("upload"):
+        samples = await run_in_threadpool(_read_upload_audio, audio)
+
+    if async_job:
+        return _submit_job(_process_next_turn, session_id, samples)
+
+    if _wants_event_stream(request, stream):
+        return _event_stream(lambda emit: _process_next_turn(session_id, samples, emit=emit))
+
+    return JSONResponse(await _until_disconnected(request, _process_next_turn(session_id, samples)))
+
+
+@app.websocket("/stream")
+async def stream(websocket: WebSocket, session_id: str | None = None):
+    """
+    Streaming transcription ผ่าน WebSocket
+    - client ส่ง binary frame เป็น PCM 16-bit mono 16 kHz ระหว่างพูด
+    - server ตัด segment ตามช่วงเงียบ แล้วถอดเสียงทีละ segment
+      ส่ง {"type": "partial", "transcript", "fields"} กลับทันทีที่ได้
+    - client ส่ง text {"type": "end"} เมื่อพูดจบ -> server ส่ง {"type": "final", ...}
+      (เนื้อหาเหมือน /process-audio หรือ /submit-audio ถ้าส่ง session_id มา)
+    """
+    await websocket.accept()
+
+    current = await sessions.aget(session_id) if session_id is not None else None
+    if session_id is not None and current is None:
+        await websocket.send_json({"type": "error", "detail": "session_id not found"})
+        await websocket.close(code=1008)
+        return
+
+    expected = current["missing_fields"] if current else None
+    if current:
+        profile = select_profile(expected, current.get("language"))
+    else:
+        profile = first_turn_profile()
+    buffer = SegmentBuffer()
+    parts = []
+    languages = []
+
+    async def _decode(segment: np.ndarray) -> None:
+        stt = await _transcribe(segment, True, profile)
+        text = stt["text"]
+        if not text:
+            return
+        parts.append(text)
+        languages.append(stt["language"])
+        transcript = " ".join(parts)
+        await websocket.send_json(
             {
-                "status": "incomplete",
-                "session_id": session_id,
-                "missing_fields": missing2,
-                "message": build_message(missing2),
+                "type": "partial",
                 "transcript": transcript,
-                "data_partial": merged,
+                "segment": text,
+                "fields": provisional_fields(transcript, expected),
             }
         )
 
-    finally:
-        try:
-            os.remove(temp_path)
-        except OSError:
-            pass
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+
+            if message.get("bytes"):
+                for segment in buffer.feed(message["bytes"]):
+                    await _decode(segment)
+
+                if buffer.total_seconds > AUDIO_MAX_SECONDS:
+                    await websocket.send_json(
+                        {"type": "error", "detail": f"audio is longer than {AUDIO_MAX_SECONDS:g} seconds"}
+                    )
+                    await websocket.close(code=1009)
+                    return
+
+            elif message.get("text"):
+                try:
+                    control = json.loads(message["text"])
+                except ValueError:
+                    control = None
+                if isinstance(control, dict) and control.get("type") == "end":
+                    break
+
+        tail = buffer.flush()
+        if tail is not None:
+            await _decode(tail)
+
+        transcript = " ".join(parts)
+        # ภาษาของ session = ภาษาของ segment แรกที่มีเสียงพูด
+        stt = {"text": transcript, "language": languages[0] if languages else None, "profile": profile}
+        with request_deadline(REQUEST_BUDGET_SECONDS):
+            if session_id is None:
+                result = await _first_turn_from_transcript(transcript, stt)
+            else:
+                result = await _next_turn_from_transcript(session_id, transcript, stt)
+
+        await websocket.send_json({"type": "final", **result})
+        await websocket.close()
+
+    except WebSocketDisconnect:
+        return
+    except HTTPException as e:
+        await websocket.send_json({"type": "error", "detail": e.detail})
+        await websocket.close(code=1011)
+
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str, wait: float = Query(0.0, ge=0.0, le=60.0)):
+    """
+    ดูสถานะ job (queued / running / done / failed)
+    wait > 0: รอผลได้สูงสุด wait วินาทีก่อนตอบ (long-poll)
+    """
+    job = get_job_store().get(job_id, wait=wait)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job_id not found")
+    return JSONResponse(job.to_dict())
+
+
+@app.get("/stt/stats")
+def stt_stats():
+    """สถานะ worker pool, คิว STT และ batching"""
+    stats = get_stt_pool().stats()
+    stats["batching"] = batcher_stats()
+    return JSONResponse(stats)
+
+
+@app.get("/llm/stats")
+def llm_stats():
+    """คิวของ LLM scheduler: งานที่กำลังส่ง / รอตาม priority / ถูกทิ้ง"""
+    return JSONResponse(get_scheduler().stats())
+
+
+@app.get("/audio/stats")
+def audio_stats():
+    """เสียงที่ถูกตัดก่อนเข้า STT (ช่วงเงียบหัว/ท้าย, ส่วนที่เกินความยาวสูงสุด) และจำนวนไฟล์ที่ไม่มีเสียงพูด"""
+    return JSONResponse(preprocess_stats())
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    """hit / miss ของ cache แต่ละชั้น"""
+    return JSONResponse(
+        {
+            "transcript": transcript_cache.stats(),
+            "extraction": extraction_cache.stats(),
+            "romanize": romanize_cache.stats(),
+        }
+    )
+
+
+@app.get("/sessions/stats")
+def session_stats():
+    """จำนวน session ที่ยังไม่หมดอายุ และ config ของ session store"""
+    return JSONResponse(sessions.stats())
+
+
+# ค่าที่อ่านสดตอน scrape /metrics
+metrics.register_callback(
+    "voice_active_sessions", "gauge", "Sessions waiting for a follow-up turn",
+    lambda: [({}, len(sessions))],
+)
+metrics.register_callback(
+    "voice_stt_queue_depth", "gauge", "STT jobs queued or decoding",
+    lambda: [({}, get_stt_pool().depth)],
+)
+metrics.register_callback(
+    "voice_async_jobs_pending", "gauge", "Async jobs not finished yet",
+    lambda: [({}, get_job_store().pending())],
+)
+metrics.register_callback(
+    "voice_llm_queue_depth", "gauge", "LLM calls waiting for a slot by priority",
+    lambda: [({"priority": name}, n) for name, n in get_scheduler().stats()["queued_by_priority"].items()],
+)
+metrics.register_callback(
+    "voice_llm_inflight", "gauge", "LLM calls currently sent to the backend",
+    lambda: [({}, get_scheduler().stats()["inflight"])],
+)
+metrics.register_callback(
+    "voice_stt_batch_pending", "gauge", "Requests waiting in the STT batcher",
+    lambda: [({}, (batcher_stats() or {}).get("pending", 0))],
+)
+
+_CACHES = {"transcript": transcript_cache, "extraction": extraction_cache, "romanize": romanize_cache}
+
+def _cache_samples(value):
+    return [({"cache": name}, value(cache.stats())) for name, cache in _CACHES.items()]
+
+metrics.register_callback(
+    "voice_cache_hits_total", "counter", "Cache hits (memory + disk)",
+    lambda: _cache_samples(lambda st: st["hits_memory"] + st["hits_disk"]),
+)
+metrics.register_callback(
+    "voice_cache_misses_total", "counter", "Cache misses",
+    lambda: _cache_samples(lambda st: st["misses"]),
+)
+metrics.register_callback(
+    "voice_cache_hit_ratio", "gauge", "Cache hit ratio since start",
+    lambda: _cache_samples(lambda st: st["hit_rate"]),
+)
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """metrics ในรูปแบบ Prometheus text exposition"""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/healthz")
+def healthz():
+    """process ยังทำงานอยู่ (liveness)"""
+    return JSONResponse({"status": "ok"})
+
+
+@app.get("/readyz")
+def readyz():
+    """
+    พร้อมรับ traffic เมื่อโหลด + warmup model เสร็จแล้ว (readiness)
+    ยังไม่พร้อมจะตอบ 503 เพื่อให้ load balancer ไม่ส่งงานมา
+    ใช้ model server: ถามสถานะจาก server (เชื่อมต่อไม่ได้ = ยังไม่พร้อม)
+    """
+    state = remote_model_state() if WHISPER_SERVER_SOCKET else model_state()
+    return JSONResponse(state, status_code=200 if state["status"] == "ready" else 503)
@@ -0,0 +1,183 @@
+import io
+import math
+import os
+import struct
+from typing import BinaryIO, Optional
+
+import numpy as np
+
+# =====================
+# Config
+# =====================
+SAMPLE_RATE = 16000
+CHUNK_SIZE = 64 * 1024
+
+# จำกัดขนาดไฟล์และความยาวเสียงที่รับ (ตรวจระหว่างอ่าน ไม่ต้องรอให้อ่านครบ)
+AUDIO_MAX_BYTES = int(os.getenv("AUDIO_MAX_BYTES", str(10 * 1024 * 1024)))
+AUDIO_MAX_SECONDS = float(os.getenv("AUDIO_MAX_SECONDS", "60"))
+
+# raw PCM (ไม่มี header) ถือว่าเป็น 16-bit little-endian, mono, 16 kHz
+RAW_PCM_EXTENSIONS = (".pcm", ".raw")
+
+
+class AudioRejected(Exception):
+    """ไฟล์เสียงไม่ผ่านเงื่อนไข (status_code ใช้ตอบกลับ HTTP ได้ตรง ๆ)"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _wav_declared_seconds(header: bytes) -> Optional[float]:
+    """
+    อ่านความยาวเสียงจาก header ของ WAV (RIFF) โดยไม่ต้องมีข้อมูลทั้งไฟล์
+    คืน None ถ้า header ยังไม่ครบหรือไม่ใช่ WAV
+    """
+    if len(header) < 12 or header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+        return None
+
+    pos = 12
+    byte_rate = None
+    while pos + 8 <= len(header):
+        chunk_id = header[pos:pos + 4]
+        chunk_size = struct.unpack("<I", header[pos + 4:pos + 8])[0]
+        if chunk_id == b"fmt " and pos + 20 <= len(header):
+            byte_rate = struct.unpack("<I", header[pos + 16:pos + 20])[0]
+        elif chunk_id == b"data":
+            # บาง encoder เขียน data size เป็น 0 / 0xFFFFFFFF ตอน stream -> ไม่เชื่อ
+            if not byte_rate or chunk_size in (0, 0xFFFFFFFF):
+                return None
+            return chunk_size / byte_rate
+        pos += 8 + chunk_size + (chunk_size & 1)
+
+    return None
+
+
+def read_stream(
+    fileobj: BinaryIO,
+    max_bytes: int = AUDIO_MAX_BYTES,
+    max_seconds: float = AUDIO_MAX_SECONDS,
+) -> bytes:
+    """
+    อ่านไฟล์ทีละ chunk แล้วปฏิเสธทันทีที่เกินขนาด
+    หรือเมื่อ header ของ WAV บอกว่าความยาวเกิน max_seconds
+    """
+    buf = bytearray()
+    checked_header = False
+
+    while True:
+        chunk = fileobj.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        buf.extend(chunk)
+
+        if len(buf) > max_bytes:
+            raise AudioRejected(413, f"audio file is larger than {max_bytes} bytes")
+
+        if not checked_header:
+            checked_header = True
+            declared = _wav_declared_seconds(bytes(buf[:4096]))
+            if declared is not None and declared > max_seconds:
+                raise AudioRejected(413, f"audio is longer than {max_seconds:g} seconds")
+
+    if not buf:
+        raise AudioRejected(400, "audio file is empty")
+
+    return bytes(buf)
+
+
+def resample(samples: np.ndarray, sample_rate: int, target_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """
+    resample ด้วย FFT (ตัด / เติม spectrum) ครั้งเดียวทั้งไฟล์
+    ตัดความถี่เหนือ Nyquist ใหม่ทิ้งให้เอง จึงไม่เกิด aliasing แบบ linear interpolation
+    """
+    if sample_rate == target_rate or not len(samples):
+        return samples
+
+    n_out = int(round(len(samples) * target_rate / sample_rate))
+
+    # เติมศูนย์ท้ายไฟล์ให้ยาวเท่ากับขนาดที่ FFT เร็ว (ตัวประกอบเล็ก) และหารลงตัวกับอัตราส่วน
+    # ความยาวที่เป็นจำนวนเฉพาะช้ากว่าเป็นสิบเท่า
+    step = sample_rate // math.gcd(sample_rate, target_rate)
+    n_in = _fast_length(len(samples), step)
+    n_pad = n_in * target_rate // sample_rate
+
+    spectrum = np.fft.rfft(samples, n_in)
+    keep = n_pad // 2 + 1
+    if keep <= len(spectrum):
+        spectrum = spectrum[:keep]
+    else:
+        spectrum = np.concatenate([spectrum, np.zeros(keep - len(spectrum), dtype=spectrum.dtype)])
+    out = np.fft.irfft(spectrum, n_pad)[:n_out] * (n_pad / n_in)
+    return out.astype(np.float32)
+
+
+def _fast_length(n: int, step: int) -> int:
+    """ค่าที่ >= n ในรูป step * k โดย k มีแต่ตัวประกอบ 2, 3, 5 (step มีแต่ตัวประกอบเล็กอยู่แล้ว เช่น 3, 441)"""
+    k = -(-n // step)
+    while True:
+        rest = k
+        for p in (2, 3, 5):
+            while rest % p == 0:
+                rest //= p
+        if rest == 1:
+            return k * step
+        k += 1
+
+
+def to_mono_16k(samples: np.ndarray, sample_rate: int) -> np.ndarray:
+    """downmix เป็น mono แล้ว resample เป็น 16 kHz (float32)"""
+    if samples.ndim == 2:
+        samples = samples.mean(axis=1)
+    samples = samples.astype(np.float32, copy=False)
+    return resample(samples, sample_rate)
+
+
+def decode_bytes(data: bytes, filename: str = "") -> np.ndarray:
+    """
+    แปลง bytes ของไฟล์เสียงเป็น NumPy float32 16 kHz mono โดยไม่แตะ disk
+    - WAV / FLAC / OGG: soundfile
+    - .pcm / .raw: 16-bit PCM 16 kHz mono
+    - รูปแบบอื่น: fallback ไปที่ decoder ของ faster-whisper (ffmpeg/av) ในหน่วยความจำ
+    """
+    if filename.lower().endswith(RAW_PCM_EXTENSIONS):
+        usable = len(data) - (len(data) % 2)
+        return np.frombuffer(data[:usable], dtype="<i2").astype(np.float32) / 32768.0
+
+    import soundfile as sf
+
+    try:
+        samples, sample_rate = sf.read(io.BytesIO(data), dtype="float32", always_2d=True)
+        return to_mono_16k(samples, sample_rate)
+    except (RuntimeError, TypeError):
+        pass
+
+    try:
+        from faster_whisper import decode_audio
+
+        return decode_audio(io.BytesIO(data), sampling_rate=SAMPLE_RATE)
+    except Exception:
+        raise AudioRejected(415, "unsupported or corrupted audio file")
+
+
+def decode_file(path: str) -> np.ndarray:
+    """decode_bytes() จาก path (ใช้กับ CLI ไม่จำกัดขนาด / ความยาว)"""
+    with open(path, "rb") as f:
+        return decode_bytes(f.read(), path)
+
+
+def load_audio(
+    fileobj: BinaryIO,
+    filename: str = "",
+    max_bytes: int = AUDIO_MAX_BYTES,
+    max_seconds: float = AUDIO_MAX_SECONDS,
+) -> np.ndarray:
+    """อ่าน + decode + ตรวจความยาวหลัง decode (กันไฟล์ที่ header ไม่บอกความยาว)"""
+    data = read_stream(fileobj, max_bytes=max_bytes, max_seconds=max_seconds)
+    audio = decode_bytes(data, filename)
+
+    if len(audio) > max_seconds * SAMPLE_RATE:
+        raise AudioRejected(413, f"audio is longer than {max_seconds:g} seconds")
+
+    return audio
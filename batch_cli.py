@@ -0,0 +1,292 @@
+"""
+Batch reprocessing ของไฟล์เสียงจำนวนมาก (เช่นหลังเปลี่ยน prompt / model)
+
+- input: directory (หา *.wav ทั้งหมด), glob pattern หรือ JSONL manifest
+  (แต่ละบรรทัดมี "audio" หรือ "audio_path" และอาจมี "id", "expected_fields")
+- STT รันใน process pool แต่ละ process โหลด Whisper ครั้งเดียว
+- LLM extraction รันใน thread pool แยก ทำงานซ้อนกับ STT ของไฟล์ถัดไป
+- ผลลัพธ์เขียนเป็น JSONL ทีละรายการ ถ้ารันซ้ำด้วย output เดิมจะข้ามรายการที่เสร็จแล้ว
+
+ตัวอย่าง:
+    python batch_cli.py recordings/ -o results.jsonl --stt-workers 4 --llm-workers 4
+    python batch_cli.py "recordings/**/*.wav" -o results.jsonl
+    python batch_cli.py manifest.jsonl -o results.jsonl --romanize
+"""
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterator, List, Optional
+
+
+# =====================
+# Input
+# =====================
+def iter_items(source: str) -> Iterator[Dict[str, Any]]:
+    """คืน {"id", "audio", "expected_fields"} จาก directory / glob / JSONL manifest"""
+    if os.path.isdir(source):
+        paths = sorted(glob.glob(os.path.join(source, "**", "*.wav"), recursive=True))
+    elif source.endswith(".jsonl") and os.path.isfile(source):
+        base = os.path.dirname(source)
+        with open(source, "r", encoding="utf-8") as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                row = json.loads(line)
+                audio = row.get("audio") or row.get("audio_path")
+                if not audio:
+                    continue
+                if not os.path.isabs(audio):
+                    audio = os.path.join(base, audio)
+                yield {
+                    "id": str(row.get("id") or row.get("request_id") or audio),
+                    "audio": audio,
+                    "expected_fields": row.get("expected_fields") or [],
+                }
+        return
+    else:
+        paths = sorted(glob.glob(source, recursive=True))
+
+    for path in paths:
+        yield {"id": path, "audio": path, "expected_fields": []}
+
+
+def load_checkpoint(output: str) -> set:
+    """id ที่มีผลอยู่แล้วใน output (บรรทัดที่เขียนไม่ครบตอนโดน kill จะถูกข้าม)"""
+    done = set()
+    if not os.path.isfile(output):
+        return done
+
+    with open(output, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except ValueError:
+                continue
+            if "error" not in row:
+                done.add(row["id"])
+    return done
+
+
+def repair_checkpoint(output: str) -> None:
+    """
+    ตัดบรรทัดท้ายที่เขียนไม่ครบ (process โดน kill ระหว่างเขียน) ออกก่อนเขียนต่อ
+    ไม่งั้นแถวแรกของรอบใหม่จะต่อท้ายบรรทัดที่ขาดแล้วหายไปทั้งบรรทัด
+    """
+    if not os.path.isfile(output):
+        return
+
+    with open(output, "rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        pos = end
+        while pos > 0:
+            size = min(1 << 16, pos)
+            f.seek(pos - size)
+            chunk = f.read(size)
+            newline = chunk.rfind(b"\n")
+            if newline != -1:
+                keep = pos - size + newline + 1
+                break
+            pos -= size
+        else:
+            keep = 0
+        if keep != end:
+            f.truncate(keep)
+
+
+# =====================
+# Workers
+# =====================
+def _init_stt_worker() -> None:
+    from whisper_server import WHISPER_SERVER_SOCKET
+
+    # ใช้ model server ร่วมกัน -> ไม่ต้องโหลด model ใน worker
+    if WHISPER_SERVER_SOCKET:
+        return
+
+    # โหลด model ครั้งเดียวต่อ process
+    from model_loader import get_model
+
+    get_model()
+
+
+def _stt_worker(audio_path: str) -> Dict[str, Any]:
+    from audio_io import decode_file
+    from pipeline_full import speech_to_text
+
+    start = time.perf_counter()
+    audio = decode_file(audio_path)
+    transcript = speech_to_text(audio)
+    return {
+        "transcript": transcript,
+        "audio_seconds": len(audio) / 16000,
+        "stt_seconds": time.perf_counter() - start,
+    }
+
+
+def _llm_worker(item: Dict[str, Any], stt: Dict[str, Any], romanize: bool) -> Dict[str, Any]:
+    from pipeline_full import extract_fields
+    from plate_normalizer import normalize_license_plate
+    from romanize import romanize_person
+    from validator import validate_data
+
+    start = time.perf_counter()
+    data = extract_fields(stt["transcript"], expected_fields=item["expected_fields"])
+    if data.get("license_plate") is not None:
+        data["license_plate"] = normalize_license_plate(data["license_plate"])
+
+    status, missing = validate_data(data)
+    if romanize and status == "complete":
+        data = romanize_person(data)
+
+    return {
+        "id": item["id"],
+        "audio": item["audio"],
+        "status": status,
+        "missing_fields": missing,
+        "data": data,
+        **stt,
+        "llm_seconds": time.perf_counter() - start,
+    }
+
+
+# =====================
+# Runner
+# =====================
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    idx = min(len(values) - 1, max(0, int(round(q / 100 * (len(values) - 1)))))
+    return values[idx]
+
+
+def run_batch(
+    source: str,
+    output: str,
+    stt_workers: int = 2,
+    llm_workers: int = 4,
+    romanize: bool = False,
+    limit: Optional[int] = None,
+) -> Dict[str, Any]:
+    repair_checkpoint(output)
+    done = load_checkpoint(output)
+    items = [item for item in iter_items(source) if item["id"] not in done]
+    if limit is not None:
+        items = items[:limit]
+
+    print(f"{len(done)} already done, {len(items)} to process", file=sys.stderr)
+
+    results: List[Dict[str, Any]] = []
+    errors = 0
+    started = time.perf_counter()
+
+    # spawn: ไม่ fork thread ของ process หลักติดไปด้วย
+    ctx = multiprocessing.get_context("spawn")
+
+    with open(output, "a", encoding="utf-8") as out, \
+            ProcessPoolExecutor(max_workers=stt_workers, mp_context=ctx, initializer=_init_stt_worker) as stt_pool, \
+            ThreadPoolExecutor(max_workers=llm_workers) as llm_pool:
+
+        def _write(row: Dict[str, Any]) -> None:
+            out.write(json.dumps(row, ensure_ascii=False) + "\n")
+            out.flush()
+
+        # ส่งงาน STT ไม่เกินที่ worker รับได้ + buffer เล็กน้อย กัน memory บวมตอนไฟล์เยอะ
+        pending_items = iter(items)
+        stt_futures: Dict[Any, Dict[str, Any]] = {}
+        llm_futures: Dict[Any, Dict[str, Any]] = {}
+
+        def _fill() -> None:
+            while len(stt_futures) < stt_workers * 2:
+                item = next(pending_items, None)
+                if item is None:
+                    return
+                stt_futures[stt_pool.submit(_stt_worker, item["audio"])] = item
+
+        _fill()
+        while stt_futures or llm_futures:
+            finished, _ = wait(list(stt_futures) + list(llm_futures), return_when=FIRST_COMPLETED)
+
+            for fut in finished:
+                if fut in stt_futures:
+                    item = stt_futures.pop(fut)
+                    try:
+                        stt = fut.result()
+                    except Exception as e:
+                        errors += 1
+                        _write({"id": item["id"], "audio": item["audio"], "error": f"stt: {e}"})
+                        continue
+                    llm_futures[llm_pool.submit(_llm_worker, item, stt, romanize)] = item
+                else:
+                    item = llm_futures.pop(fut)
+                    try:
+                        row = fut.result()
+                    except Exception as e:
+                        errors += 1
+                        _write({"id": item["id"], "audio": item["audio"], "error": f"llm: {e}"})
+                        continue
+                    results.append(row)
+                    _write(row)
+
+            _fill()
+
+    wall = time.perf_counter() - started
+    audio_total = sum(r["audio_seconds"] for r in results)
+    stt_times = [r["stt_seconds"] for r in results]
+    llm_times = [r["llm_seconds"] for r in results]
+
+    return {
+        "processed": len(results),
+        "errors": errors,
+        "skipped": len(done),
+        "wall_seconds": round(wall, 2),
+        "files_per_second": round(len(results) / wall, 3) if wall else 0.0,
+        "audio_seconds_per_second": round(audio_total / wall, 2) if wall else 0.0,
+        "complete": sum(1 for r in results if r["status"] == "complete"),
+        "stt_seconds": {
+            "p50": round(_percentile(stt_times, 50), 3),
+            "p95": round(_percentile(stt_times, 95), 3),
+            "max": round(max(stt_times, default=0.0), 3),
+        },
+        "llm_seconds": {
+            "p50": round(_percentile(llm_times, 50), 3),
+            "p95": round(_percentile(llm_times, 95), 3),
+            "max": round(max(llm_times, default=0.0), 3),
+        },
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Batch STT + extraction over many audio files")
+    parser.add_argument("source", help="directory, glob pattern or JSONL manifest")
+    parser.add_argument("-o", "--output", required=True, help="JSONL output (also the resume checkpoint)")
+    parser.add_argument("--stt-workers", type=int, default=max(1, (os.cpu_count() or 2) // 4))
+    parser.add_argument("--llm-workers", type=int, default=4)
+    parser.add_argument("--cpu-threads", type=int, default=None, help="Whisper cpu_threads per STT process")
+    parser.add_argument("--romanize", action="store_true", help="romanize names of complete records")
+    parser.add_argument("--limit", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    # process ลูกอ่าน config จาก env ตอน import model_loader
+    if args.cpu_threads is not None:
+        os.environ["WHISPER_CPU_THREADS"] = str(args.cpu_threads)
+
+    summary = run_batch(
+        args.source,
+        args.output,
+        stt_workers=args.stt_workers,
+        llm_workers=args.llm_workers,
+        romanize=args.romanize,
+        limit=args.limit,
+    )
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+"""
+Calibration: หา config ของ STT + LLM ที่เร็ว / ใช้ RAM น้อยที่สุดที่ยังแม่นพอ
+
+- รันชุดเสียงที่มีเฉลย (manifest JSONL) ผ่าน speech_to_text -> extract_fields ด้วย decode profile
+  เดียวกับ API (select_profile: fixture ที่มี expected_fields ใช้ profile รอบถามกลับ)
+  ทุกจุดใน grid ของ model size x compute type x beam size x จำนวน thread x LLM model
+  x model / beam ของรอบถามกลับ
+- ให้คะแนนราย field เทียบกับเฉลยที่ normalize แบบเดียวกับ API แล้วผ่าน validate_data
+  (ค่าที่ทายได้ต้องตรงกับเฉลย และผ่าน validator ด้วยถึงจะนับว่าถูก)
+- วัด latency ต่อไฟล์ (stt / extract / รวม) และ peak RSS ของ process
+  แต่ละ config รันใน subprocess แยก peak RSS จึงเป็นของ config นั้นจริง (ไม่รวม Ollama)
+- เลือก config บน Pareto front (ความแม่น, p95 latency, peak RSS) ที่เร็วที่สุดซึ่งแม่นถึง --min-accuracy
+  แล้วเขียนเป็นไฟล์ที่ service โหลดได้ตอน start ด้วย STT_CONFIG_PATH
+
+manifest (หนึ่งบรรทัดต่อไฟล์เสียง path อิงกับ directory ของ manifest):
+    {"audio": "001.wav", "fields": {"first_name": "สมชาย", "phone": "0812345678"}}
+    {"audio": "002.wav", "fields": {"license_plate": "กข1234"}, "expected_fields": ["license_plate"], "language": "th"}
+expected_fields: คำตอบรอบถามกลับ (decode ด้วย profile รอบถามกลับ และส่งให้ extract_fields เหมือน /submit-audio)
+language: ภาษาที่ session ล็อกไว้จากรอบแรก (ไม่ใส่ = ให้ Whisper detect เอง)
+
+รัน:
+    python -m benchmarks.calibrate labels.jsonl --models small medium large --beams 1 5 10 \\
+        --threads 4 8 --followup-models "" small --followup-beams 1 2 \\
+        --min-accuracy 0.95 -o stt_config.json --report calibration.json
+    STT_CONFIG_PATH=stt_config.json uvicorn api_server:app
+"""
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+from benchmarks.e2e_bench import _git_commit, summarize
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# key ใน config ที่ grid ปรับ -> env ที่ model_loader อ่าน
+GRID_ENV = {
+    "model_size": "WHISPER_MODEL_SIZE",
+    "compute_type": "WHISPER_COMPUTE_TYPE",
+    "beam_size": "WHISPER_BEAM_SIZE",
+    "cpu_threads": "WHISPER_CPU_THREADS",
+    "llm_model": "LLM_MODEL",
+    "followup_model_size": "WHISPER_FOLLOWUP_MODEL_SIZE",
+    "followup_beam_size": "WHISPER_FOLLOWUP_BEAM_SIZE",
+}
+
+
+# =====================
+# Fixtures
+# =====================
+def load_manifest(path: str) -> List[Dict[str, Any]]:
+    """อ่าน manifest แล้วเช็คว่าเฉลยทุก field ผ่าน validate_data หลัง normalize"""
+    from validator import validate_data
+
+    base = os.path.dirname(os.path.abspath(path))
+    items = []
+    with open(path, "r", encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            item["audio"] = os.path.join(base, item["audio"])
+            item["fields"] = normalize_fields(item["fields"])
+
+            _, invalid = validate_data(item["fields"])
+            bad = [field for field in item["fields"] if field in invalid]
+            if bad:
+                raise SystemExit(f"{path}:{lineno}: ground truth fails validate_data for {bad}")
+            if not os.path.isfile(item["audio"]):
+                raise SystemExit(f"{path}:{lineno}: audio file not found: {item['audio']}")
+            items.append(item)
+
+    if not items:
+        raise SystemExit(f"no fixtures in {path}")
+    return items
+
+
+def normalize_fields(data: Dict[str, Any]) -> Dict[str, Any]:
+    """normalize แบบเดียวกับ api_server ก่อน validate (ทะเบียน) และตัวพิมพ์ของเพศ"""
+    from plate_normalizer import normalize_license_plate
+
+    data = dict(data)
+    if data.get("license_plate") is not None:
+        data["license_plate"] = normalize_license_plate(data["license_plate"])
+    if isinstance(data.get("gender"), str):
+        data["gender"] = data["gender"].strip().lower()
+    return data
+
+
+def score(predicted: Dict[str, Any], truth: Dict[str, Any]) -> Dict[str, bool]:
+    """ถูก/ผิดราย field ที่มีเฉลย: ต้องผ่าน validate_data และตรงกับเฉลยหลัง normalize"""
+    from validator import validate_data
+
+    predicted = normalize_fields(predicted)
+    _, invalid = validate_data(predicted)
+    return {field: field not in invalid and predicted.get(field) == value for field, value in truth.items()}
+
+
+# =====================
+# One config (subprocess)
+# =====================
+def run_config(manifest: str) -> Dict[str, Any]:
+    """รันทุก fixture ด้วย config จาก env ปัจจุบัน (เรียกใน subprocess ที่ตั้ง env ไว้แล้ว)"""
+    import resource
+
+    from decode_profiles import select_profile
+    from model_loader import get_model
+    from pipeline_full import extract_fields, speech_to_text
+
+    items = load_manifest(manifest)
+    get_model()
+
+    def run_item(item: Dict[str, Any]) -> tuple[str, Dict[str, Any]]:
+        expected_fields = item.get("expected_fields") or []
+        profile = select_profile(expected_fields, item.get("language"))
+        start = time.perf_counter()
+        transcript = speech_to_text(item["audio"], profile)
+        stt_done = time.perf_counter()
+        predicted = extract_fields(transcript, expected_fields)
+        end = time.perf_counter()
+        return profile["name"], {"predicted": predicted, "stt": stt_done - start, "extract": end - stt_done, "total": end - start}
+
+    # รอบเปล่าก่อนวัด (warmup ของ Whisper ทั้งสอง profile, โหลด LLM เข้า Ollama, import lazy module)
+    for expect_follow_up in (False, True):
+        warmup = next((item for item in items if bool(item.get("expected_fields")) == expect_follow_up), None)
+        if warmup is not None:
+            run_item(warmup)
+
+    stt_seconds, extract_seconds, total_seconds = [], [], []
+    stt_by_profile: Dict[str, List[float]] = {}
+    correct: Dict[str, int] = {}
+    labeled: Dict[str, int] = {}
+    for item in items:
+        profile_name, result = run_item(item)
+        predicted = result["predicted"]
+
+        stt_seconds.append(result["stt"])
+        stt_by_profile.setdefault(profile_name, []).append(result["stt"])
+        extract_seconds.append(result["extract"])
+        total_seconds.append(result["total"])
+        for field, ok in score(predicted, item["fields"]).items():
+            labeled[field] = labeled.get(field, 0) + 1
+            correct[field] = correct.get(field, 0) + int(ok)
+
+    # Linux: ru_maxrss เป็น KB
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {
+        "accuracy": round(sum(correct.values()) / sum(labeled.values()), 4),
+        "field_accuracy": {field: round(correct[field] / labeled[field], 4) for field in sorted(labeled)},
+        "latency": {
+            "stt": summarize(stt_seconds),
+            "stt_by_profile": {name: summarize(values) for name, values in stt_by_profile.items()},
+            "extract": summarize(extract_seconds),
+            "total": summarize(total_seconds),
+        },
+        "peak_rss_mb": round(peak_rss_mb, 1),
+    }
+
+
+def _worker_env(config: Dict[str, Any]) -> Dict[str, str]:
+    env = dict(os.environ)
+    for key, env_name in GRID_ENV.items():
+        env[env_name] = str(config[key])
+
+    # วัดของจริงทุกรอบ: ปิด cache, ไม่ใช้ model server ร่วม, ไม่อ่าน config เดิม
+    for name in ("STT_CACHE_SIZE", "EXTRACT_CACHE_SIZE"):
+        env[name] = "0"
+    for name in ("STT_CACHE_PATH", "EXTRACT_CACHE_PATH", "WHISPER_SERVER_SOCKET", "STT_CONFIG_PATH"):
+        env.pop(name, None)
+    env["LOG_LEVEL"] = "WARNING"
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [REPO_ROOT, env.get("PYTHONPATH")]))
+    return env
+
+
+def measure(config: Dict[str, Any], manifest: str, timeout: float) -> Dict[str, Any]:
+    """รัน config หนึ่งจุดใน subprocess คืนผลวัด หรือ {"error": ...}"""
+    cmd = [sys.executable, "-m", "benchmarks.calibrate", os.path.abspath(manifest), "--run-one"]
+    try:
+        proc = subprocess.run(
+            cmd, env=_worker_env(config), cwd=REPO_ROOT, capture_output=True, text=True, timeout=timeout,
+        )
+    except subprocess.TimeoutExpired:
+        return {"error": f"timed out after {timeout:g}s"}
+
+    if proc.returncode != 0:
+        lines = proc.stderr.strip().splitlines()
+        return {"error": lines[-1] if lines else f"exit code {proc.returncode}"}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+# =====================
+# Pareto
+# =====================
+def _objectives(run: Dict[str, Any]) -> tuple:
+    # เลขน้อยดีกว่าทุกตัว
+    return (-run["accuracy"], run["latency"]["total"]["p95_ms"], run["peak_rss_mb"])
+
+
+def pareto_front(runs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """config ที่ไม่มี config อื่นดีกว่าหรือเท่ากันทุกด้าน (และดีกว่าอย่างน้อยหนึ่งด้าน)"""
+    front = []
+    for run in runs:
+        mine = _objectives(run)
+        dominated = any(
+            other is not run
+            and all(o <= m for o, m in zip(_objectives(other), mine))
+            and _objectives(other) != mine
+            for other in runs
+        )
+        if not dominated:
+            front.append(run)
+    return sorted(front, key=lambda r: r["latency"]["total"]["p95_ms"])
+
+
+def choose(front: List[Dict[str, Any]], min_accuracy: float) -> tuple[Optional[Dict[str, Any]], bool]:
+    """
+    config ที่เร็วที่สุด (p95 รวม แล้วตาม RAM) ที่แม่นถึงเกณฑ์
+    ไม่มีตัวไหนถึงเกณฑ์ -> ตัวที่แม่นที่สุด คืน (config, ถึงเกณฑ์ไหม)
+    """
+    if not front:
+        return None, False
+    passing = [r for r in front if r["accuracy"] >= min_accuracy]
+    if passing:
+        return min(passing, key=lambda r: (r["latency"]["total"]["p95_ms"], r["peak_rss_mb"])), True
+    return min(front, key=_objectives), False
+
+
+# =====================
+# Main
+# =====================
+def print_run(run: Dict[str, Any]) -> None:
+    config = run["config"]
+    name = (
+        f"{config['model_size']:<8} {config['compute_type']:<13} beam={config['beam_size']:<3} "
+        f"threads={config['cpu_threads']:<3} followup={config['followup_model_size'] or 'same'}/"
+        f"beam={config['followup_beam_size']:<3} llm={config['llm_model']}"
+    )
+    if "error" in run:
+        print(f"  {name}  ERROR {run['error']}")
+        return
+    total = run["latency"]["total"]
+    print(
+        f"  {name}  acc={run['accuracy']:.3f}  p50={total['p50_ms']:.0f}ms p95={total['p95_ms']:.0f}ms  "
+        f"rss={run['peak_rss_mb']:.0f}MB"
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    from llm_client import MODEL as LLM_MODEL
+    from model_loader import CONFIG
+
+    parser = argparse.ArgumentParser(description="Pick the fastest STT / LLM config that meets an accuracy target")
+    parser.add_argument("manifest", help="JSONL ของไฟล์เสียงพร้อมเฉลย")
+    parser.add_argument("--models", nargs="+", default=["small", "medium", CONFIG["model_size"]])
+    parser.add_argument("--compute-types", nargs="+", default=[CONFIG["compute_type"]])
+    parser.add_argument("--beams", type=int, nargs="+", default=[1, 5, CONFIG["beam_size"]])
+    parser.add_argument("--threads", type=int, nargs="+", default=[CONFIG["cpu_threads"]], help="0 = ค่า default ของ ctranslate2")
+    parser.add_argument("--llm-models", nargs="+", default=[LLM_MODEL])
+    parser.add_argument(
+        "--followup-models", nargs="+", default=[CONFIG["followup_model_size"]],
+        help='model ของรอบถามกลับ ("" = ใช้ model เดียวกับรอบแรก)',
+    )
+    parser.add_argument("--followup-beams", type=int, nargs="+", default=[CONFIG["followup_beam_size"]])
+    parser.add_argument("--min-accuracy", type=float, default=0.95, help="ความแม่นราย field ขั้นต่ำ (0-1)")
+    parser.add_argument("--timeout", type=float, default=3600.0, help="เวลาสูงสุดต่อ config (วินาที)")
+    parser.add_argument("-o", "--output", default="stt_config.json", help="ไฟล์ config ที่เลือก (ใช้กับ STT_CONFIG_PATH)")
+    parser.add_argument("--report", default=None, help="เขียนผลทุก config และ Pareto front เป็น JSON")
+    parser.add_argument("--run-one", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_one:
+        print(json.dumps(run_config(args.manifest), ensure_ascii=False))
+        return
+
+    items = load_manifest(args.manifest)
+    grid = [
+        dict(zip(GRID_ENV, values))
+        for values in itertools.product(
+            dict.fromkeys(args.models), dict.fromkeys(args.compute_types), sorted(set(args.beams)),
+            sorted(set(args.threads)), dict.fromkeys(args.llm_models),
+            dict.fromkeys(args.followup_models), sorted(set(args.followup_beams)),
+        )
+    ]
+    print(f"{len(items)} fixtures x {len(grid)} configs")
+
+    runs = []
+    for config in grid:
+        run = {"config": config, **measure(config, args.manifest, args.timeout)}
+        runs.append(run)
+        print_run(run)
+
+    front = pareto_front([r for r in runs if "error" not in r])
+    chosen, meets_target = choose(front, args.min_accuracy)
+
+    print("\nPareto front (accuracy / p95 latency / peak RSS):")
+    for run in front:
+        print_run(run)
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "commit": _git_commit(),
+                    "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                    "manifest": args.manifest,
+                    "fixtures": len(items),
+                    "min_accuracy": args.min_accuracy,
+                    "runs": runs,
+                    "pareto_front": front,
+                    "chosen": chosen,
+                },
+                f, ensure_ascii=False, indent=2,
+            )
+        print(f"\nwrote {args.report}")
+
+    if chosen is None:
+        raise SystemExit("every config failed, nothing written")
+
+    # key นอก DEFAULT_CONFIG (calibration) model_loader จะข้ามไป
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                **chosen["config"],
+                "calibration": {
+                    "accuracy": chosen["accuracy"],
+                    "field_accuracy": chosen["field_accuracy"],
+                    "p95_ms": chosen["latency"]["total"]["p95_ms"],
+                    "peak_rss_mb": chosen["peak_rss_mb"],
+                    "min_accuracy": args.min_accuracy,
+                    "fixtures": len(items),
+                    "commit": _git_commit(),
+                },
+            },
+            f, ensure_ascii=False, indent=2,
+        )
+
+    print(f"\nchose {chosen['config']} -> {args.output}")
+    if not meets_target:
+        print(f"WARNING: no config reached accuracy {args.min_accuracy:g}, wrote the most accurate one")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,366 @@
+"""
+End-to-end benchmark ของ api_server
+
+- รัน api_server (uvicorn) และ Ollama จำลอง (benchmarks.fake_ollama) ใน process เดียวกัน
+- ยิง /process-audio ด้วย WAV สังเคราะห์ (หรือไฟล์จริงใน --audio-dir) ที่ concurrency เพิ่มขึ้นเรื่อย ๆ
+  ถ้ารอบแรกไม่ครบจะยิง /submit-audio ต่อด้วย session_id ที่ได้
+- รายงาน latency (p50 / p95 / p99) ต่อ endpoint, throughput และเวลาแต่ละ stage
+  (upload, preprocess, stt, extract, normalize, validate, romanize)
+- เขียนผลเป็น JSON (--output) และเทียบกับผลเก่าได้ด้วย --baseline
+
+ปิด cache ทุกชั้นระหว่าง benchmark เพราะ fixture ถูกส่งซ้ำ
+ทุกบทสนทนาต้องจบที่ status complete ไม่งั้นจบด้วย exit code 1: fixture ที่ Whisper ถอดเป็นข้อความว่าง
+(no_speech) จะไม่ผ่าน extract / romanize ตัวเลขที่ได้จะวัดแค่ STT (ปิดได้ด้วย --allow-incomplete)
+
+รัน:
+    python -m benchmarks.e2e_bench --model tiny --concurrency 1 2 4 8 --requests 20 -o e2e.json
+    python -m benchmarks.e2e_bench --model tiny -o e2e_new.json --baseline e2e.json
+"""
+import argparse
+import functools
+import inspect
+import json
+import os
+import socket
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+
+from benchmarks.fake_ollama import FakeOllama
+from benchmarks.fixtures import load_fixtures
+
+# ชื่อใน api_server ที่ถูกห่อเพื่อจับเวลา -> ชื่อ stage
+STAGES = {
+    "_read_upload_audio": "upload",
+    "preprocess_audio": "preprocess",
+    "transcribe_audio": "stt",
+    "aextract_fields": "extract",
+    "_normalize_fields": "normalize",
+    "validate_data": "validate",
+    "aromanize_person": "romanize",
+}
+
+
+# =====================
+# Stage timing
+# =====================
+class StageTimer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples: Dict[str, List[float]] = {}
+
+    def record(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    def reset(self) -> Dict[str, List[float]]:
+        with self._lock:
+            samples, self.samples = self.samples, {}
+        return samples
+
+    def wrap(self, stage: str, fn: Callable) -> Callable:
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def timed_async(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    self.record(stage, time.perf_counter() - start)
+
+            return timed_async
+
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+
+        return timed
+
+
+def instrument(api_server, timer: StageTimer) -> None:
+    for attr, stage in STAGES.items():
+        if hasattr(api_server, attr):
+            setattr(api_server, attr, timer.wrap(stage, getattr(api_server, attr)))
+
+
+# =====================
+# Stats
+# =====================
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    idx = min(len(values) - 1, max(0, int(round(q / 100 * (len(values) - 1)))))
+    return values[idx]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values) * 1000, 1) if values else 0.0,
+        "p50_ms": round(percentile(values, 50) * 1000, 1),
+        "p95_ms": round(percentile(values, 95) * 1000, 1),
+        "p99_ms": round(percentile(values, 99) * 1000, 1),
+        "max_ms": round(max(values, default=0.0) * 1000, 1),
+    }
+
+
+# =====================
+# Server
+# =====================
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_api_server(port: int):
+    import uvicorn
+
+    import api_server
+
+    config = uvicorn.Config(api_server.app, host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, name="api-server", daemon=True)
+    thread.start()
+    return server, thread
+
+
+def wait_ready(base_url: str, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"{base_url}/readyz", timeout=2).status_code == 200:
+                return
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f"api_server not ready after {timeout:g}s (is the Whisper model available?)")
+
+
+# =====================
+# Load
+# =====================
+def run_conversation(base_url: str, name: str, audio: bytes, max_turns: int) -> Dict[str, Any]:
+    """รอบแรก + รอบถามกลับจนครบ (หรือครบ max_turns) คืนเวลาของแต่ละ call"""
+    calls = []
+    session = requests.Session()
+
+    start = time.perf_counter()
+    r = session.post(f"{base_url}/process-audio", files={"audio": (name, audio, "audio/wav")})
+    calls.append(("process-audio", r.status_code, time.perf_counter() - start))
+    body = r.json() if r.status_code == 200 else {}
+
+    turns = 1
+    while body.get("status") == "incomplete" and turns < max_turns:
+        start = time.perf_counter()
+        r = session.post(
+            f"{base_url}/submit-audio",
+            data={"session_id": body["session_id"]},
+            files={"audio": (name, audio, "audio/wav")},
+        )
+        calls.append(("submit-audio", r.status_code, time.perf_counter() - start))
+        body = r.json() if r.status_code == 200 else {}
+        turns += 1
+
+    return {"calls": calls, "status": body.get("status")}
+
+
+def run_level(
+    base_url: str,
+    fixtures: List[tuple],
+    concurrency: int,
+    n_requests: int,
+    max_turns: int,
+    timer: StageTimer,
+) -> Dict[str, Any]:
+    timer.reset()
+    jobs = [fixtures[i % len(fixtures)] for i in range(n_requests)]
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda f: run_conversation(base_url, f[0], f[1], max_turns), jobs))
+    wall = time.perf_counter() - started
+
+    latencies: Dict[str, List[float]] = {}
+    status_codes: Dict[str, int] = {}
+    for result in results:
+        for endpoint, code, seconds in result["calls"]:
+            status_codes[str(code)] = status_codes.get(str(code), 0) + 1
+            if code == 200:
+                latencies.setdefault(endpoint, []).append(seconds)
+
+    conversations = [sum(s for _, _, s in r["calls"]) for r in results]
+    return {
+        "concurrency": concurrency,
+        "conversations": n_requests,
+        "wall_seconds": round(wall, 3),
+        "conversations_per_second": round(n_requests / wall, 3) if wall else 0.0,
+        "complete": sum(1 for r in results if r["status"] == "complete"),
+        "final_status": {
+            str(status): sum(1 for r in results if r["status"] == status)
+            for status in sorted({r["status"] for r in results}, key=str)
+        },
+        "status_codes": status_codes,
+        "conversation": summarize(conversations),
+        "endpoints": {endpoint: summarize(values) for endpoint, values in sorted(latencies.items())},
+        "stages": {stage: summarize(values) for stage, values in sorted(timer.reset().items())},
+    }
+
+
+# =====================
+# Report
+# =====================
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        )
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_level(level: Dict[str, Any]) -> None:
+    conv = level["conversation"]
+    print(
+        f"\nconcurrency={level['concurrency']:<3} {level['conversations_per_second']:.2f} conv/s  "
+        f"p50={conv['p50_ms']:.0f}ms p95={conv['p95_ms']:.0f}ms p99={conv['p99_ms']:.0f}ms  "
+        f"status={level['status_codes']}"
+    )
+    for name, stats in list(level["endpoints"].items()) + list(level["stages"].items()):
+        print(
+            f"  {name:<14} n={stats['count']:<4} p50={stats['p50_ms']:>8.1f}ms "
+            f"p95={stats['p95_ms']:>8.1f}ms p99={stats['p99_ms']:>8.1f}ms"
+        )
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    print(f"\nvs baseline {baseline.get('commit')} (conversation latency, + = slower)")
+    old_levels = {lvl["concurrency"]: lvl for lvl in baseline.get("levels", [])}
+    for level in current["levels"]:
+        old = old_levels.get(level["concurrency"])
+        if old is None:
+            continue
+        parts = []
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            before, after = old["conversation"][key], level["conversation"][key]
+            change = (after - before) / before * 100 if before else 0.0
+            parts.append(f"{key[:-3]} {before:.0f} -> {after:.0f}ms ({change:+.1f}%)")
+        print(f"  concurrency={level['concurrency']:<3} " + "  ".join(parts))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="End-to-end latency / throughput benchmark of api_server")
+    parser.add_argument("--model", default="tiny", help="Whisper model size (WHISPER_MODEL_SIZE)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--requests", type=int, default=20, help="conversations per concurrency level")
+    parser.add_argument("--max-turns", type=int, default=3)
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0)
+    parser.add_argument("--llm-jitter-ms", type=float, default=50.0)
+    parser.add_argument("--incomplete-ratio", type=float, default=0.3)
+    parser.add_argument("--audio-dir", default=None, help="ใช้ไฟล์ *.wav จริงแทนเสียงสังเคราะห์")
+    parser.add_argument(
+        "--allow-incomplete", action="store_true",
+        help="ไม่ต้องจบด้วย error เมื่อมีบทสนทนาที่ไม่ถึง status complete",
+    )
+    parser.add_argument("--ready-timeout", type=float, default=600.0)
+    parser.add_argument("-o", "--output", default=None, help="เขียนผลเป็น JSON")
+    parser.add_argument("--baseline", default=None, help="ผล JSON เก่าที่จะเทียบ")
+    args = parser.parse_args(argv)
+
+    fake_llm = FakeOllama(
+        latency_ms=args.llm_latency_ms,
+        jitter_ms=args.llm_jitter_ms,
+        incomplete_ratio=args.incomplete_ratio,
+    ).start()
+
+    # ต้องตั้งก่อน import api_server (ทุก module อ่าน config ตอน import)
+    os.environ["OLLAMA_URL"] = fake_llm.url
+    os.environ["WHISPER_MODEL_SIZE"] = args.model
+    for name in ("STT_CACHE_SIZE", "EXTRACT_CACHE_SIZE", "ROMANIZE_CACHE_SIZE"):
+        os.environ[name] = "0"
+    os.environ["ROMANIZE_CACHE_PATH"] = ""
+    os.environ.pop("STT_CACHE_PATH", None)
+    os.environ.pop("EXTRACT_CACHE_PATH", None)
+
+    import api_server
+
+    timer = StageTimer()
+    instrument(api_server, timer)
+
+    port = _free_port()
+    server, thread = start_api_server(port)
+    base_url = f"http://127.0.0.1:{port}"
+    wait_ready(base_url, args.ready_timeout)
+
+    fixtures = load_fixtures(args.audio_dir)
+    from model_loader import CONFIG
+
+    print(f"model={CONFIG['model_size']} compute_type={CONFIG['compute_type']} fixtures={[f[0] for f in fixtures]}")
+
+    # 1 รอบเปล่าก่อนวัด (โหลด LLM client pool, import lazy module) และเช็คว่า fixture พาไปถึง complete จริง
+    for name, audio in fixtures:
+        warmup = run_conversation(base_url, name, audio, args.max_turns)
+        if warmup["status"] != "complete" and not args.allow_incomplete:
+            raise SystemExit(
+                f"{name}: conversation ended with status {warmup['status']!r} instead of 'complete' "
+                "(synthetic audio transcribes to little or no text; use --audio-dir with recorded speech)"
+            )
+
+    levels = []
+    for concurrency in args.concurrency:
+        level = run_level(base_url, fixtures, concurrency, args.requests, args.max_turns, timer)
+        levels.append(level)
+        print_level(level)
+
+    result = {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": {
+            "whisper": CONFIG,
+            "llm_latency_ms": args.llm_latency_ms,
+            "llm_jitter_ms": args.llm_jitter_ms,
+            "incomplete_ratio": args.incomplete_ratio,
+            "requests_per_level": args.requests,
+            "fixtures": [f[0] for f in fixtures],
+        },
+        "llm_requests": fake_llm.requests,
+        "levels": levels,
+    }
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\nwrote {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            compare(result, json.load(f))
+
+    server.should_exit = True
+    thread.join(timeout=10)
+
+    incomplete = [lvl for lvl in levels if lvl["complete"] < lvl["conversations"]]
+    if incomplete and not args.allow_incomplete:
+        for level in incomplete:
+            print(
+                f"concurrency={level['concurrency']}: {level['conversations'] - level['complete']} of "
+                f"{level['conversations']} conversations did not complete {level['final_status']}"
+            )
+        fake_llm.stop()
+        raise SystemExit(1)
+    fake_llm.stop()
+
+
+if __name__ == "__main__":
+    main()
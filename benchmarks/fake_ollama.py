@@ -0,0 +1,178 @@
+"""
+Ollama จำลองสำหรับ benchmark: ตอบ /api/chat ด้วย JSON สำเร็จรูป หลังหน่วงเวลาตามที่ตั้ง
+
+- prompt ของ extract_fields -> JSON object 5 field (รอบแรกบางส่วนจะไม่มี license_plate
+  ตาม incomplete_ratio เพื่อให้ benchmark ได้ยิงรอบถามกลับด้วย)
+- prompt ของ romanize (ทีละชื่อ / JSON array) -> ชื่ออังกฤษ
+- "stream": true -> ส่ง NDJSON ทีละ token (ประมาณ 4 ตัวอักษร) ห่างกัน token_ms
+
+รันแยกได้: python -m benchmarks.fake_ollama --port 11434 --latency-ms 300
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+
+RECORD = {
+    "first_name": "สมชาย",
+    "last_name": "ใจดี",
+    "gender": "male",
+    "phone": "0812345678",
+    "license_plate": "กข1234",
+}
+
+ROMANIZED = {"สมชาย": "Somchai", "ใจดี": "Jaidee"}
+
+
+def _extraction_response(system_prompt: str, incomplete_ratio: float, rng: random.Random) -> Dict[str, Any]:
+    data = dict(RECORD)
+
+    # รอบถามกลับ: ตอบเฉพาะ field ที่ prompt อนุญาต
+    if "ONLY allowed to fill" in system_prompt:
+        allowed = system_prompt.split("ONLY allowed to fill these fields:", 1)[1].split("\n", 1)[0]
+        return {k: (v if f"'{k}'" in allowed else None) for k, v in data.items()}
+
+    if rng.random() < incomplete_ratio:
+        data["license_plate"] = None
+    return data
+
+
+class FakeOllama:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency_ms: float = 300.0,
+        jitter_ms: float = 50.0,
+        incomplete_ratio: float = 0.3,
+        seed: int = 0,
+        token_ms: float = 5.0,
+    ):
+        self.latency = latency_ms / 1000.0
+        self.jitter = jitter_ms / 1000.0
+        self.token_seconds = token_ms / 1000.0
+        self.incomplete_ratio = incomplete_ratio
+        self.requests = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                response = fake.respond(payload)
+
+                if payload.get("stream"):
+                    self._stream(response)
+                    return
+
+                body = json.dumps(response, ensure_ascii=False).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _stream(self, response):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+                content = response["message"]["content"]
+                tokens = [content[i:i + 4] for i in range(0, len(content), 4)]
+                try:
+                    for token in tokens:
+                        self._chunk({"message": {"role": "assistant", "content": token}, "done": False})
+                        time.sleep(fake.token_seconds)
+                    self._chunk({"message": {"role": "assistant", "content": ""}, "done": True, "eval_count": len(tokens)})
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    # client ปิด connection เมื่อได้ JSON ครบแล้ว
+                    self.close_connection = True
+
+            def _chunk(self, message):
+                data = json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n"
+                self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/api/chat"
+
+    def respond(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        messages = payload.get("messages") or [{}]
+        system_prompt = messages[0].get("content", "")
+        user = messages[-1].get("content", "")
+
+        with self._lock:
+            self.requests += 1
+            delay = max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter))
+            rng_value = self._rng.random()
+
+        time.sleep(delay)
+
+        if "romanization" in system_prompt:
+            if "JSON array" in system_prompt:
+                names = json.loads(user)
+                content = json.dumps([ROMANIZED.get(n, n) for n in names], ensure_ascii=False)
+            else:
+                content = ROMANIZED.get(user.strip(), user.strip())
+        else:
+            data = _extraction_response(system_prompt, self.incomplete_ratio, random.Random(rng_value))
+            content = json.dumps(data, ensure_ascii=False)
+
+        return {
+            "model": payload.get("model"),
+            "message": {"role": "assistant", "content": content},
+            "done": True,
+        }
+
+    def start(self) -> "FakeOllama":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency-ms", type=float, default=300.0)
+    parser.add_argument("--jitter-ms", type=float, default=50.0)
+    parser.add_argument("--incomplete-ratio", type=float, default=0.3)
+    parser.add_argument("--token-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    server = FakeOllama(
+        args.host, args.port, args.latency_ms, args.jitter_ms, args.incomplete_ratio, token_ms=args.token_ms
+    ).start()
+    print(f"fake Ollama listening on {server.url}")
+    try:
+        server._thread.join()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
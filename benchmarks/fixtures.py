@@ -0,0 +1,57 @@
+"""
+เสียงสังเคราะห์สำหรับ benchmark (ไม่ต้องมีไฟล์เสียงจริงใน repo)
+
+เป็นแค่เสียง harmonic ไม่มีคำพูด Whisper อาจถอดเป็นข้อความว่าง (no_speech) หรือคำมั่ว
+ใช้วัดเวลา STT / preprocess ได้ แต่ถ้าจะวัดทั้ง pipeline (extract / romanize) ให้ใช้ไฟล์เสียงพูดจริง (--audio-dir)
+"""
+import glob
+import io
+import os
+from typing import List, Tuple
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+# ความยาว (วินาที) ของ fixture default: คำตอบสั้นรอบถามกลับ -> รอบแรกพูดยาว
+DEFAULT_DURATIONS = [2.0, 4.0, 8.0, 15.0]
+
+
+def synthetic_speech(seconds: float, seed: int = 0) -> np.ndarray:
+    """เสียงคล้ายเสียงพูด (harmonic + envelope ตามจังหวะพยางค์) ใช้วัดเวลาเท่านั้น"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    f0 = 120 + 40 * rng.random()
+    phase = 2 * np.pi * np.cumsum(f0 * (1 + 0.1 * np.sin(2 * np.pi * 0.7 * t))) / SAMPLE_RATE
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 20))
+    envelope = 0.5 * (1 + np.sin(2 * np.pi * 4 * t))
+    noise = 0.01 * rng.standard_normal(len(t))
+    return (0.2 * voiced * envelope + noise).astype(np.float32)
+
+
+def wav_bytes(samples: np.ndarray) -> bytes:
+    import soundfile as sf
+
+    buf = io.BytesIO()
+    sf.write(buf, samples, SAMPLE_RATE, format="WAV", subtype="PCM_16")
+    return buf.getvalue()
+
+
+def load_fixtures(audio_dir: str | None = None, durations: List[float] = DEFAULT_DURATIONS) -> List[Tuple[str, bytes]]:
+    """
+    คืน [(ชื่อ, WAV bytes)]
+    audio_dir: ใช้ไฟล์ *.wav จริงใน directory นี้แทนเสียงสังเคราะห์
+    """
+    if audio_dir:
+        fixtures = []
+        for path in sorted(glob.glob(os.path.join(audio_dir, "*.wav"))):
+            with open(path, "rb") as f:
+                fixtures.append((os.path.basename(path), f.read()))
+        if not fixtures:
+            raise SystemExit(f"no *.wav files in {audio_dir}")
+        return fixtures
+
+    return [
+        (f"synthetic_{seconds:g}s.wav", wav_bytes(synthetic_speech(seconds, seed)))
+        for seed, seconds in enumerate(durations)
+    ]
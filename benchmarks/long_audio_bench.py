@@ -0,0 +1,97 @@
+"""
+Benchmark ของ long_audio: decode chunk ทีละตัว vs พร้อมกันหลาย worker
+
+- สร้างเสียงยาวจาก chunk ละ --chunk-seconds วินาที จำนวน 1, 2, 4, 8, ... chunk
+  (ใช้ไฟล์เสียงพูดจริงด้วย --audio ไม่งั้นใช้เสียงสังเคราะห์)
+- วัด wall-clock ของ transcribe_chunks แบบ workers=1 เทียบกับ workers=--workers
+- วัดเวลาของ split_on_silence (VAD) บนเสียงที่มีช่วงเงียบคั่นแยกไว้ด้วย
+
+ต้องมี Whisper model (default: tiny) ตัว benchmark ตั้ง WHISPER_NUM_WORKERS ให้เท่ากับ
+--workers เอง เพื่อให้ ctranslate2 decode หลาย chunk พร้อมกันได้จริง
+
+รัน: python -m benchmarks.long_audio_bench [--model tiny] [--workers 4] [--audio testcase.wav]
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from benchmarks.fixtures import SAMPLE_RATE, synthetic_speech
+
+
+def make_chunk(source: np.ndarray | None, seconds: float, seed: int) -> np.ndarray:
+    if source is None:
+        return synthetic_speech(seconds, seed)
+    n = int(seconds * SAMPLE_RATE)
+    return np.resize(source, n).astype(np.float32)
+
+
+def timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="tiny")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--chunk-seconds", type=float, default=8.0)
+    parser.add_argument("--max-chunks", type=int, default=8)
+    parser.add_argument("--beam-size", type=int, default=5)
+    parser.add_argument("--audio", default=None, help="ไฟล์เสียงพูดจริงที่ใช้สร้างแต่ละ chunk")
+    args = parser.parse_args()
+
+    # ต้องตั้งก่อน import model_loader (อ่าน config ตอน import)
+    os.environ.setdefault("WHISPER_NUM_WORKERS", str(args.workers))
+    os.environ.setdefault("WHISPER_CPU_THREADS", str(max(1, (os.cpu_count() or 2) // args.workers)))
+    os.environ.setdefault("WHISPER_WARMUP", "1")
+
+    from long_audio import split_on_silence, transcribe_chunks
+    from model_loader import CONFIG, get_model
+
+    source = None
+    if args.audio:
+        from faster_whisper import decode_audio
+
+        source = decode_audio(args.audio)
+
+    model = get_model(args.model)
+    print(
+        f"model={args.model} compute_type={CONFIG['compute_type']} "
+        f"num_workers={CONFIG['num_workers']} cpu_threads={CONFIG['cpu_threads']} "
+        f"beam={args.beam_size} chunk={args.chunk_seconds:g}s"
+    )
+
+    counts = []
+    n = 1
+    while n <= args.max_chunks:
+        counts.append(n)
+        n *= 2
+
+    print(f"{'chunks':>6} {'sequential s':>13} {f'workers={args.workers} s':>14} {'speedup':>8}")
+    for count in counts:
+        chunks = [make_chunk(source, args.chunk_seconds, seed) for seed in range(count)]
+
+        def run(workers: int) -> None:
+            transcribe_chunks(model, chunks, args.beam_size, language="th", workers=workers)
+
+        sequential = timed(lambda: run(1))
+        parallel = timed(lambda: run(args.workers))
+        print(f"{count:>6} {sequential:>13.2f} {parallel:>14.2f} {sequential / parallel:>7.2f}x")
+
+    # ต้นทุน VAD: เสียงทุก chunk คั่นด้วยความเงียบ 2 วินาที
+    silence = np.zeros(2 * SAMPLE_RATE, dtype=np.float32)
+    chunks = [make_chunk(source, args.chunk_seconds, seed) for seed in range(counts[-1])]
+    long_audio = np.concatenate([x for c in chunks for x in (c, silence)])
+    found = []
+    vad = timed(lambda: found.extend(split_on_silence(long_audio)))
+    print(
+        f"VAD on {len(long_audio) / SAMPLE_RATE:.0f}s audio: {vad:.2f}s, "
+        f"{len(found)} speech chunks, {sum(len(c) for c in found) / SAMPLE_RATE:.1f}s speech kept"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Micro-benchmark ของ plate_normalizer.normalize_license_plate
+
+เทียบกับ implementation เดิม (replace ทีละคำ) ที่เก็บไว้ในไฟล์นี้เป็น reference
+- ตรวจว่าผลลัพธ์ตรงกับ golden set และตรงกับ implementation เดิมทุกรายการ
+- วัดเวลาต่อ call ของทั้งสองแบบ และของ normalize_many
+
+รัน: python -m benchmarks.plate_normalizer_bench [--number 20000]
+"""
+import argparse
+import random
+import re
+import timeit
+
+from plate_normalizer import FILLERS, THAI_SPELL_MAP, normalize_license_plate, normalize_many
+
+GOLDEN = [
+    ('กข1234', 'กข1234'),
+    ('กข 1234', 'กข1234'),
+    ('ก ข 1 2 3 4', 'กข1234'),
+    ('กอไก่ ขอไข่ 1 2 3 4', 'กข1234'),
+    ('กอไก่ขอไข่1234', 'กข1234'),
+    ('ทะเบียน กอไก่ ขอไข่ 1234 ครับ', 'กข1234'),
+    ('ป้ายทะเบียน ฮอนกฮูก 99', None),
+    ('ทะเบียนรถ 1กข 234', None),
+    ('ทะเบียนรถ ขอควาย ซอช้าง 567 กรุงเทพ', 'คช567'),
+    ('ก.ไก่ ข.ไข่ 1234', None),
+    ('กข-1234', 'กข1234'),
+    ('กข.1234.', 'กข1234'),
+    ('AB1234', 'AB1234'),
+    ('AB 1234', 'AB1234'),
+    ('ab-1234', 'AB1234'),
+    ('AB1234.', 'AB1234'),
+    ('ทะเบียน AB 12 ค่ะ', 'AB12'),
+    ('ABC 1', 'ABC1'),
+    ('ABCD 1234', None),
+    ('A 12345', None),
+    ('1234', None),
+    ('กขคง 1234', None),
+    ('พอพาน มอม้า 8888 กทม', 'พม8888'),
+    ('สอเสือ วอแหวน 12 จังหวัด เชียงใหม่', None),
+    ('กอไก่ กอไก่ 1', 'กก1'),
+    ('  กข1234  ', 'กข1234'),
+    ('', None),
+    (None, None),
+    ('ไม่ทราบครับ', None),
+    ('รถ AB-1234 ครับ', 'AB1234'),
+    ('ศอศาลา หอหีบ 4321', 'ศห4321'),
+    ('ยอยักษ์ รอเรือ ลอลิง 7', 'ยรล7'),
+    ('ทอทหาร 1 2', 'ท12'),
+    ('พอผึ้ง 55', 'ผ55'),
+    ('ZZ 99 ทะเบียน กข 1234', 'ZZ99'),
+]
+
+
+def legacy_normalize_license_plate(text):
+    """implementation ก่อนคอมไพล์ pattern (ใช้เป็น reference เท่านั้น)"""
+    if not text:
+        return None
+
+    s = text.strip()
+
+    s_up = s.upper()
+    for w in FILLERS:
+        s_up = s_up.replace(w.upper(), " ")
+
+    m_en = re.search(
+        r"(?<![A-Z0-9])([A-Z]{1,3})[\s\-\.]*([0-9]{1,4})(?![A-Z0-9])",
+        s_up
+    )
+    if m_en:
+        return f"{m_en.group(1)}{m_en.group(2)}"
+
+    s_th = s.strip()
+    for w in FILLERS:
+        s_th = s_th.replace(w, " ")
+
+    s_th = s_th.replace("-", " ").replace(".", " ")
+    s_th = re.sub(r"\s+", " ", s_th).strip().lower()
+
+    for k in sorted(THAI_SPELL_MAP.keys(), key=len, reverse=True):
+        s_th = s_th.replace(k, THAI_SPELL_MAP[k])
+
+    s_th = re.sub(r"[^0-9ก-๙]", "", s_th)
+    s_th = s_th.replace(" ", "")
+
+    m_th = re.fullmatch(r"([ก-ฮ]{1,3})(\d{1,4})", s_th)
+    if not m_th:
+        return None
+
+    return f"{m_th.group(1)}{m_th.group(2)}"
+
+
+def random_inputs(n: int, seed: int = 0) -> list[str]:
+    """สุ่มประโยคจากคำอ่านตัวอักษร ตัวเลข ฟิลเลอร์ และ EN plate"""
+    rng = random.Random(seed)
+    parts = list(THAI_SPELL_MAP) + list(FILLERS) + list("0123456789") + ["AB", "ab", "-", ".", "สมชาย", "กข", "1234"]
+    return [
+        "".join(rng.choice(parts) + rng.choice(["", " "]) for _ in range(rng.randint(1, 7)))
+        for _ in range(n)
+    ]
+
+
+def check(inputs: list[str]) -> None:
+    for text, expected in GOLDEN:
+        got = normalize_license_plate(text)
+        assert got == expected, f"{text!r}: expected {expected!r}, got {got!r}"
+
+    for text in inputs:
+        assert normalize_license_plate(text) == legacy_normalize_license_plate(text), text
+
+    assert normalize_many(inputs) == [legacy_normalize_license_plate(t) for t in inputs]
+
+
+def bench(fn, inputs: list[str], number: int) -> float:
+    """คืนเวลาเฉลี่ยต่อ call (microseconds)"""
+    n = len(inputs)
+    timer = timeit.Timer(lambda: [fn(inputs[i % n]) for i in range(number)])
+    best = min(timer.repeat(repeat=3, number=1))
+    return best / number * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args()
+
+    inputs = [t for t, _ in GOLDEN if t] + random_inputs(5000)
+    check(inputs)
+    print(f"outputs identical on {len(GOLDEN)} golden cases + {len(inputs) - len(GOLDEN) + 2} random inputs")
+
+    legacy = bench(legacy_normalize_license_plate, inputs, args.number)
+    current = bench(normalize_license_plate, inputs, args.number)
+
+    many_inputs = [inputs[i % len(inputs)] for i in range(args.number)]
+    many = min(timeit.repeat(lambda: normalize_many(many_inputs), repeat=3, number=1)) / args.number * 1e6
+
+    print(f"legacy                  : {legacy:8.2f} us/call")
+    print(f"normalize_license_plate : {current:8.2f} us/call  ({legacy / current:.1f}x)")
+    print(f"normalize_many          : {many:8.2f} us/item  ({legacy / many:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
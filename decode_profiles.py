@@ -0,0 +1,80 @@
+import os
+from typing import Any, Dict, List, Optional
+
+from model_loader import CONFIG
+
+# =====================
+# Decode profiles
+# =====================
+# รอบแรก: ไม่รู้ว่าผู้ใช้จะพูดอะไร ใช้ model/beam เต็ม และให้ Whisper detect ภาษาเอง
+# รอบถามกลับ: รู้จาก missing_fields ว่าคำตอบคือ field ไหน (สั้น ๆ เช่นเบอร์โทร / เพศ)
+#   -> beam เล็กลง, ใช้ model เล็กได้ (WHISPER_FOLLOWUP_MODEL_SIZE),
+#      ล็อกภาษาตามที่ detect ได้ในรอบแรก และใส่ initial_prompt ตาม field
+FIRST_TURN = "first_turn"
+FOLLOW_UP = "follow_up"
+
+# ใส่ initial_prompt ตาม field ที่ถาม (ปิดได้ด้วย WHISPER_FIELD_PROMPTS=0)
+WHISPER_FIELD_PROMPTS = os.getenv("WHISPER_FIELD_PROMPTS", "1") == "1"
+
+# บอกแค่ว่าคำตอบเป็น field อะไร / รูปแบบไหน ห้ามใส่ค่าตัวอย่างที่ผ่าน validator
+# (Whisper มักลอกข้อความใน prompt ออกมาเมื่อเสียงเงียบหรือไม่ชัด ค่าตัวอย่างอย่าง "0812345678"
+#  จะถูก rule รับเป็นคำตอบที่มั่นใจ และ early stop จะไม่ส่งไปให้ LLM ตรวจอีก)
+FIELD_PROMPTS = {
+    "first_name": "ชื่อจริง",
+    "last_name": "นามสกุล",
+    "gender": "เพศ ชาย หรือ หญิง",
+    "phone": "เบอร์โทรศัพท์ 10 หลัก",
+    "license_plate": "ทะเบียนรถ ตัวอักษรไทย และตัวเลข",
+}
+
+# รอบถามกลับ: เช็ค transcript ทีละ segment ด้วย rule (normalizer + validator)
+# ได้ค่าที่ valid ครบทุก field ที่ถามแล้วหยุด decode ไม่ต้องฟังคำลงท้ายที่เหลือ (ปิดได้ด้วย STT_EARLY_STOP=0)
+STT_EARLY_STOP = os.getenv("STT_EARLY_STOP", "1") == "1"
+
+# field ที่เช็คได้ด้วย rule ล้วน ชื่อ-นามสกุลต้องให้ LLM ดึง จึงหยุดก่อนไม่ได้
+EARLY_STOP_FIELDS = {"phone", "gender", "license_plate"}
+
+
+def first_turn_profile() -> Dict[str, Any]:
+    return {
+        "name": FIRST_TURN,
+        "model_size": CONFIG["model_size"],
+        "beam_size": CONFIG["beam_size"],
+        "language": None,
+        "initial_prompt": None,
+        "stop_when_fields": None,
+    }
+
+
+def follow_up_profile(expected_fields: List[str], language: Optional[str] = None) -> Dict[str, Any]:
+    prompt = None
+    if WHISPER_FIELD_PROMPTS:
+        prompt = " ".join(FIELD_PROMPTS[f] for f in expected_fields if f in FIELD_PROMPTS) or None
+
+    stop_when_fields = None
+    if STT_EARLY_STOP and expected_fields and EARLY_STOP_FIELDS.issuperset(expected_fields):
+        stop_when_fields = list(expected_fields)
+
+    return {
+        "name": FOLLOW_UP,
+        "model_size": CONFIG["followup_model_size"] or CONFIG["model_size"],
+        "beam_size": CONFIG["followup_beam_size"],
+        "language": language,
+        "initial_prompt": prompt,
+        "stop_when_fields": stop_when_fields,
+    }
+
+
+def select_profile(expected_fields: Optional[List[str]] = None, language: Optional[str] = None) -> Dict[str, Any]:
+    """
+    expected_fields ว่าง = รอบแรก (profile แม่นยำสูงสุด)
+    มี expected_fields = รอบถามกลับ
+    """
+    if not expected_fields:
+        return first_turn_profile()
+    return follow_up_profile(expected_fields, language)
+
+
+def is_default_profile(profile: Dict[str, Any]) -> bool:
+    """ตรงกับ config หลักทุกอย่าง (ใช้ batcher ร่วมกับ request อื่นได้)"""
+    return profile == first_turn_profile()
@@ -1,11 +1,46 @@
 import json
+import logging
 import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 
-from validator import validate_data, build_message
+from validator import validate_data, build_message, NO_SPEECH_MESSAGE
 from agent_utils import merge_data
 from pipeline_full import speech_to_text, extract_fields
-from romanize import romanize_person
+from romanize import ROMANIZE_AHEAD, keep_current, names_to_prefetch, romanize_names, romanize_person
+from llm_scheduler import PRIORITY_COMPLETION, PRIORITY_SPECULATIVE, notify_on_slot
 from plate_normalizer import normalize_license_plate
+from metrics import request_timings, server_timing, span
+
+logger = logging.getLogger(__name__)
+
+# romanize ชื่อล่วงหน้าระหว่างรอ user ส่งไฟล์รอบถัดไป (thread เดียวพอ ทีละ session)
+_romanize_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="romanize-ahead")
+
+_Ahead = tuple[list[str], Future, threading.Event]
+
+def _romanize_names_ahead(names: list[str], started: threading.Event) -> list[str]:
+    with notify_on_slot(started):
+        return romanize_names(names, PRIORITY_SPECULATIVE)
+
+def _romanize_ahead(data: dict, known: dict) -> _Ahead | None:
+    """ส่งชื่อที่ผ่าน validate_name แล้วไป romanize ใน background คืน (ชื่อ, future, event ที่ set เมื่อได้ slot) หรือ None"""
+    names = names_to_prefetch(data, known) if ROMANIZE_AHEAD else []
+    if not names:
+        return None
+    started = threading.Event()
+    return names, _romanize_executor.submit(_romanize_names_ahead, names, started), started
+
+def _collect_ahead(pending: _Ahead | None, known: dict) -> dict:
+    """รวมผลของงานล่วงหน้าที่เสร็จแล้วเข้า known (งานที่พังข้ามไป รอบที่ครบจะ romanize เอง)"""
+    if pending is None or not pending[1].done() or pending[1].cancelled():
+        return known
+    names, future, _ = pending
+    try:
+        return {**known, **dict(zip(names, future.result()))}
+    except Exception as e:
+        logger.info("romanize ahead failed: %s", e)
+        return known
 
 def run_interactive_agent(first_audio_path: str) -> dict:
     """
@@ -16,20 +51,33 @@ def run_interactive_agent(first_audio_path: str) -> dict:
     """
 
     # ---------- Round 1 ----------
-    transcript = speech_to_text(first_audio_path)
-    data = extract_fields(transcript, expected_fields=[])
-    
-    # ✅ normalize หลัง extract
-    if data.get("license_plate") is not None:
-        data["license_plate"] = normalize_license_plate(data["license_plate"])
-    
-    # ✅ validate หลัง normalize
-    status, missing = validate_data(data)   
+    with request_timings() as timings:
+        with span("stt"):
+            transcript = speech_to_text(first_audio_path)
+        with span("extract"):
+            data = extract_fields(transcript, expected_fields=[])
+        
+        # ✅ normalize หลัง extract
+        with span("normalize"):
+            if data.get("license_plate") is not None:
+                data["license_plate"] = normalize_license_plate(data["license_plate"])
+        
+        # ✅ validate หลัง normalize
+        with span("validate"):
+            status, missing = validate_data(data)   
+
+        # ถ้าครบตั้งแต่รอบแรก -> romanize แล้วจบ
+        if status == "complete":
+            with span("romanize"):
+                data = romanize_person(data)
+    logger.info("round 1 timings: %s", server_timing(timings))
 
-    # ถ้าครบตั้งแต่รอบแรก -> romanize แล้วจบ
     if status == "complete":
-        data = romanize_person(data)
         return {"status": "complete", "data": data}
+
+    # ชื่อผ่านแล้วแต่ยังขาด field อื่น -> romanize ไว้ระหว่างที่ user ตอบรอบถัดไป
+    romanized: dict = {}
+    pending = _romanize_ahead(data, romanized)
     
 
     # ---------- Multi-turn ----------
@@ -64,27 +112,56 @@ def run_interactive_agent(first_audio_path: str) -> dict:
             continue
 
         # ---------- Next round ----------
-        transcript_i = speech_to_text(next_path)
+        with request_timings() as timings:
+            with span("stt"):
+                transcript_i = speech_to_text(next_path)
+            if not transcript_i:
+                # ไม่มีเสียงพูด: ไม่ต้อง extract / validate ถามไฟล์ใหม่เหมือน status no_speech ของ API
+                print(NO_SPEECH_MESSAGE)
+                continue
 
-        # สำคัญ: ส่ง expected_fields=missing เพื่อรองรับ implicit answer
-        new_data = extract_fields(transcript_i, expected_fields=missing)
-        
-        # normalize license plate จากคำตอบใหม่
-        if new_data.get("license_plate") is not None:
-            new_data["license_plate"] = normalize_license_plate(new_data["license_plate"])
+            # สำคัญ: ส่ง expected_fields=missing เพื่อรองรับ implicit answer
+            with span("extract"):
+                new_data = extract_fields(transcript_i, expected_fields=missing)
+            
+            # normalize license plate จากคำตอบใหม่
+            with span("normalize"):
+                if new_data.get("license_plate") is not None:
+                    new_data["license_plate"] = normalize_license_plate(new_data["license_plate"])
+
+            # merge เฉพาะ field ที่ระบบถาม
+            data = merge_data(data, new_data, missing)
 
-        # merge เฉพาะ field ที่ระบบถาม
-        data = merge_data(data, new_data, missing)
+            # validate ใหม่
+            with span("validate"):
+                status, missing = validate_data(data)
 
-        # validate ใหม่
-        status, missing = validate_data(data)
+            # ---------- Complete ----------
+            if status == "complete":
+                with span("romanize"):
+                    # งานล่วงหน้าของชื่อชุดเดิมได้ slot LLM แล้ว: รอผลแทนการยิง LLM ซ้ำ
+                    # ถ้ายังรอคิวอยู่ (priority ต่ำสุด) ไม่รอ romanize เองที่ PRIORITY_COMPLETION
+                    if pending is not None and set(pending[0]) <= set(names_to_prefetch(data, {})):
+                        if pending[2].is_set():
+                            wait([pending[1]])
+                        else:
+                            pending[1].cancel()
+                    # ทิ้งผลของชื่อที่ merge_data เปลี่ยนไป
+                    romanized = keep_current(_collect_ahead(pending, romanized), data)
+                    data = romanize_person(data, known=romanized, priority=PRIORITY_COMPLETION)
+            else:
+                romanized = keep_current(_collect_ahead(pending, romanized), data)
+                if pending is None or pending[1].done():
+                    pending = _romanize_ahead(data, romanized)
+        logger.info("round timings: %s", server_timing(timings))
 
-    # ---------- Complete ----------
-    data = romanize_person(data)
     return {"status": "complete", "data": data}
 
 
 if __name__ == "__main__":
+    # ปิด log (transcript / timings) ได้ด้วย LOG_LEVEL=WARNING
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(message)s")
+
     first = input("ใส่ path ไฟล์เสียงรอบแรก (เช่น input.wav): ").strip()
     if not os.path.isfile(first):
         print(f"ไม่พบไฟล์: {first}")
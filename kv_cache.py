@@ -0,0 +1,170 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+_MISSING = object()
+
+
+class TieredCache:
+    """
+    Cache 2 ชั้น
+    - ชั้นแรก: LRU ในหน่วยความจำ (จำกัดจำนวน entry)
+    - ชั้นสอง (ถ้าระบุ disk_path): sqlite บน disk อยู่รอดข้ามการ restart
+      จำกัดจำนวนแถว และ evict แถวที่ถูกใช้ล่าสุดนานที่สุดก่อน
+      เปิดไฟล์ตอนใช้งานครั้งแรก (import module ที่สร้าง cache ไม่สร้างไฟล์)
+    ttl (วินาที) ใช้กับทั้งสองชั้น ถ้าเป็น None คือไม่หมดอายุ
+    ค่าที่เก็บต้อง serialize เป็น JSON ได้
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_entries: int = 1024,
+        ttl: Optional[float] = None,
+        disk_path: Optional[str] = None,
+        max_disk_entries: int = 100_000,
+    ):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_disk_entries = max_disk_entries
+
+        self._mem: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.disk_path = disk_path or None
+        self._db: Optional[sqlite3.Connection] = None
+        self._writes_since_trim = 0
+
+    # ---------- disk tier ----------
+    def _disk(self) -> Optional[sqlite3.Connection]:
+        """connection ของชั้น disk (เปิดครั้งแรกที่เรียก เรียกขณะถือ lock) None = ไม่มีชั้น disk"""
+        if self._db is None and self.disk_path:
+            self._open_disk(self.disk_path)
+        return self._db
+
+    def _open_disk(self, path: str) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        db = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " created REAL NOT NULL,"
+            " accessed REAL NOT NULL)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache(accessed)")
+        db.commit()
+        self._db = db
+
+    def _disk_get(self, key: str) -> Any:
+        row = self._db.execute("SELECT value, created FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return _MISSING
+
+        value, created = row
+        if self._expired(created):
+            self._db.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._db.commit()
+            return _MISSING
+
+        self._db.execute("UPDATE cache SET accessed = ? WHERE key = ?", (time.time(), key))
+        self._db.commit()
+        return json.loads(value)
+
+    def _disk_put(self, key: str, value: Any, created: float) -> None:
+        self._db.execute(
+            "INSERT OR REPLACE INTO cache (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value, ensure_ascii=False), created, created),
+        )
+        self._writes_since_trim += 1
+
+        # ไม่ต้องนับแถวทุกครั้งที่เขียน
+        if self._writes_since_trim >= 100:
+            self._writes_since_trim = 0
+            count = self._db.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            overflow = count - self.max_disk_entries
+            if overflow > 0:
+                self._db.execute(
+                    "DELETE FROM cache WHERE key IN "
+                    "(SELECT key FROM cache ORDER BY accessed ASC LIMIT ?)",
+                    (overflow,),
+                )
+                self.evictions += overflow
+        self._db.commit()
+
+    # ---------- public ----------
+    def _expired(self, created: float) -> bool:
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            item = self._mem.get(key)
+            if item is not None:
+                created, value = item
+                if not self._expired(created):
+                    self._mem.move_to_end(key)
+                    self.hits_memory += 1
+                    return value
+                del self._mem[key]
+
+            if self._disk() is not None:
+                value = self._disk_get(key)
+                if value is not _MISSING:
+                    self.hits_disk += 1
+                    self._mem_put(key, value, time.time())
+                    return value
+
+            self.misses += 1
+            return default
+
+    def _mem_put(self, key: str, value: Any, created: float) -> None:
+        self._mem[key] = (created, value)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+            self.evictions += 1
+
+    def put(self, key: str, value: Any) -> None:
+        now = time.time()
+        with self._lock:
+            self._mem_put(key, value, now)
+            if self._disk() is not None:
+                self._disk_put(key, value, now)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._mem.clear()
+            if self._disk() is not None:
+                self._db.execute("DELETE FROM cache")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits_memory + self.hits_disk + self.misses
+            hits = self.hits_memory + self.hits_disk
+            return {
+                "name": self.name,
+                "entries_memory": len(self._mem),
+                "max_entries": self.max_entries,
+                "hits_memory": self.hits_memory,
+                "hits_disk": self.hits_disk,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "disk": self.disk_path is not None,
+            }
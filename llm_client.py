@@ -0,0 +1,415 @@
+import asyncio
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import LLM_REQUESTS, record_llm_response
+from llm_scheduler import PRIORITY_FIRST_TURN, LLMQueueTimeout, get_scheduler
+from model_loader import CONFIG
+
+# =====================
+# Config
+# =====================
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434/api/chat")
+# LLM_MODEL หรือ llm_model ในไฟล์ STT_CONFIG_PATH (เช่นผลจาก benchmarks.calibrate)
+MODEL = CONFIG["llm_model"]
+
+# ให้ Ollama เก็บ model ไว้ในหน่วยความจำ (-1 = ไม่ evict, หรือระบุเป็น "30m")
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "-1")
+
+# timeout สูงสุดต่อ call (วินาที) ถ้า request มี budget เหลือน้อยกว่าจะใช้ค่าที่เหลือแทน
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "3"))
+
+# retry เฉพาะกรณี connection หลุด / ถูก reset
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "2"))
+LLM_BACKOFF = 0.2
+
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "16"))
+
+
+class LLMTimeout(Exception):
+    """budget ของ request หมดก่อน LLM ตอบ"""
+
+
+def _keep_alive_value() -> Any:
+    try:
+        return int(OLLAMA_KEEP_ALIVE)
+    except ValueError:
+        return OLLAMA_KEEP_ALIVE
+
+
+# =====================
+# Request deadline
+# =====================
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("llm_deadline", default=None)
+
+
+@contextmanager
+def request_deadline(seconds: float):
+    """
+    กำหนด budget ของทั้ง request ทุก LLM call ข้างในจะได้ timeout
+    เท่ากับเวลาที่เหลือ แทนการใช้ timeout คงที่
+    """
+    token = _deadline.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_budget() -> Optional[float]:
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def _call_timeout() -> float:
+    remaining = remaining_budget()
+    if remaining is None:
+        return LLM_TIMEOUT
+    if remaining <= 0:
+        raise LLMTimeout("request budget exhausted before LLM call")
+    return min(LLM_TIMEOUT, remaining)
+
+
+def _backoff(attempt: int) -> float:
+    delay = LLM_BACKOFF * (2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def build_payload(
+    messages: List[Dict[str, str]],
+    options: Optional[Dict[str, Any]] = None,
+    model: str = MODEL,
+    **extra: Any,
+) -> Dict[str, Any]:
+    payload: Dict[str, Any] = {
+        "model": model,
+        "messages": messages,
+        "stream": False,
+        "keep_alive": _keep_alive_value(),
+    }
+    if options:
+        payload["options"] = options
+    payload.update(extra)
+    return payload
+
+
+# =====================
+# Sync client
+# =====================
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """requests.Session ที่ใช้ร่วมกัน (connection pool + keep-alive)"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=LLM_POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
+
+
+def _sync_retry(call: Callable[[float], Any], priority: int) -> Any:
+    """
+    เรียก call(timeout) พร้อม retry แบบ jitter เมื่อ connection ถูก reset
+    - แต่ละครั้งต้องรอ slot จาก scheduler ก่อน (จำกัดงานที่ส่งไป backend พร้อมกัน)
+    - timeout ของแต่ละครั้งมาจาก budget ที่เหลือของ request หลังรอคิวแล้ว
+    """
+    scheduler = get_scheduler()
+    for attempt in range(LLM_RETRIES + 1):
+        try:
+            with scheduler.slot(priority, _deadline.get()):
+                return call(_call_timeout())
+        except LLMQueueTimeout as e:
+            raise LLMTimeout(str(e))
+        except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError):
+            LLM_REQUESTS.inc(outcome="connection_error")
+            if attempt == LLM_RETRIES:
+                raise
+            delay = _backoff(attempt)
+            remaining = remaining_budget()
+            if remaining is not None and remaining <= delay:
+                raise
+            time.sleep(delay)
+        except requests.Timeout:
+            LLM_REQUESTS.inc(outcome="timeout")
+            if remaining_budget() is not None:
+                raise LLMTimeout("LLM call exceeded request budget")
+            raise
+
+    raise RuntimeError("unreachable")
+
+
+def chat(
+    messages: List[Dict[str, str]],
+    options: Optional[Dict[str, Any]] = None,
+    model: str = MODEL,
+    priority: int = PRIORITY_FIRST_TURN,
+    **extra: Any,
+) -> str:
+    """
+    เรียก Ollama /api/chat แล้วคืน message.content
+    - ใช้ connection pool ร่วมกันทั้ง process
+    - เข้าคิวของ scheduler ตาม priority (ดู llm_scheduler)
+    - timeout มาจาก budget ที่เหลือของ request (request_deadline)
+    - retry พร้อม jitter เมื่อ connection ถูก reset
+    """
+    payload = build_payload(messages, options, model, **extra)
+    session = get_session()
+
+    def _call(timeout: float) -> str:
+        start = time.perf_counter()
+        r = session.post(OLLAMA_URL, json=payload, timeout=(LLM_CONNECT_TIMEOUT, timeout))
+        r.raise_for_status()
+        data = r.json()
+        record_llm_response(data, time.perf_counter() - start)
+        return data["message"]["content"]
+
+    return _sync_retry(_call, priority)
+
+
+def chat_json(
+    messages: List[Dict[str, str]],
+    schema: Dict[str, Any],
+    options: Optional[Dict[str, Any]] = None,
+    model: str = MODEL,
+    priority: int = PRIORITY_FIRST_TURN,
+    **extra: Any,
+) -> Dict[str, Any]:
+    """
+    เรียก Ollama แบบ stream โดยบังคับรูปแบบผลด้วย JSON schema (format)
+    แล้วประกอบ JSON ทีละ chunk ได้ object ครบเมื่อไหร่ปิด connection ทันที
+    ไม่ต้องรอ token ที่เหลือ / ข้อความ done ตอนท้าย
+    """
+    payload = build_payload(messages, options, model, format=schema, **extra)
+    payload["stream"] = True
+    session = get_session()
+
+    def _call(timeout: float) -> Dict[str, Any]:
+        start = time.perf_counter()
+        assembler = JSONObjectAssembler()
+        with session.post(
+            OLLAMA_URL, json=payload, timeout=(LLM_CONNECT_TIMEOUT, timeout), stream=True
+        ) as r:
+            r.raise_for_status()
+            for line in r.iter_lines():
+                if _feed_stream_line(assembler, line):
+                    break
+        return _finish_json(assembler, time.perf_counter() - start, messages)
+
+    return _sync_retry(_call, priority)
+
+
+# =====================
+# Incremental JSON
+# =====================
+class JSONObjectAssembler:
+    """
+    รับข้อความทีละ chunk จนได้ JSON object ชั้นนอกสุดครบหนึ่งก้อน
+    นับวงเล็บ {} โดยข้ามวงเล็บที่อยู่ใน string
+    """
+
+    def __init__(self):
+        self._parts: List[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self.started = False
+        self.complete = False
+        self.chunks = 0
+
+    def feed(self, text: str) -> bool:
+        """คืน True เมื่อ object ครบแล้ว (ข้อความหลังจากนั้นถูกทิ้ง)"""
+        self.chunks += 1
+        if self.complete:
+            return True
+        if not self.started:
+            start = text.find("{")
+            if start < 0:
+                return False
+            self.started = True
+            text = text[start:]
+        return self._scan(text)
+
+    def _scan(self, text: str) -> bool:
+        for i, ch in enumerate(text):
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._parts.append(text[:i + 1])
+                    self.complete = True
+                    return True
+        self._parts.append(text)
+        return False
+
+    def text(self) -> str:
+        return "".join(self._parts)
+
+
+def _feed_stream_line(assembler: JSONObjectAssembler, line: bytes | str) -> bool:
+    """หนึ่งบรรทัดของ NDJSON stream จาก Ollama คืน True เมื่อควรหยุดอ่าน"""
+    if not line:
+        return False
+    remaining = remaining_budget()
+    if remaining is not None and remaining <= 0:
+        raise LLMTimeout("LLM call exceeded request budget")
+
+    message = json.loads(line)
+    if assembler.feed(message.get("message", {}).get("content", "")):
+        return True
+    return bool(message.get("done"))
+
+
+def estimate_prompt_tokens(messages: List[Dict[str, str]]) -> int:
+    """
+    ประมาณจำนวน token ของ prompt จากขนาด UTF-8 (~4 byte ต่อ token)
+    อังกฤษ ~4 ตัวอักษร / token, ไทย (3 byte ต่อตัว) ~1.3 ตัวอักษร / token ใกล้เคียง tokenizer ของ Qwen
+    """
+    return max(1, round(sum(len(m.get("content", "").encode("utf-8")) for m in messages) / 4))
+
+
+def _finish_json(assembler: JSONObjectAssembler, seconds: float, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+    if not assembler.complete:
+        LLM_REQUESTS.inc(outcome="incomplete_json")
+        raise ValueError(f"LLM stream ended before the JSON object was complete: {assembler.text()!r}")
+
+    # ปิด stream ก่อนข้อความ done จึงไม่มี eval_count / prompt_eval_count จาก Ollama
+    # ใช้จำนวน chunk (~token) แทนฝั่ง out และค่าประมาณจากขนาด prompt ฝั่ง in (นับแยกเป็น in_estimated)
+    record_llm_response({"eval_count": assembler.chunks}, seconds, estimate_prompt_tokens(messages))
+    return json.loads(assembler.text())
+
+
+# =====================
+# Async client
+# =====================
+_async_client = None
+_async_client_loop = None
+
+
+def get_async_client():
+    """
+    httpx.AsyncClient ที่ใช้ร่วมกัน (สร้างครั้งแรกภายใน event loop ที่เรียก)
+    connection ผูกกับ loop ถ้าถูกเรียกจาก loop อื่น (เช่น TestClient) จะสร้างใหม่
+    """
+    global _async_client, _async_client_loop
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client_loop is not loop:
+        import httpx
+
+        _async_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=LLM_POOL_SIZE, max_keepalive_connections=LLM_POOL_SIZE),
+        )
+        _async_client_loop = loop
+    return _async_client
+
+
+async def _async_retry(call: Callable[[Any], Awaitable[Any]], priority: int) -> Any:
+    """_sync_retry แบบ async (call รับ httpx.Timeout)"""
+    import httpx
+
+    scheduler = get_scheduler()
+    for attempt in range(LLM_RETRIES + 1):
+        try:
+            async with scheduler.aslot(priority, _deadline.get()):
+                timeout = httpx.Timeout(_call_timeout(), connect=LLM_CONNECT_TIMEOUT)
+                return await call(timeout)
+        except LLMQueueTimeout as e:
+            raise LLMTimeout(str(e))
+        except (httpx.ConnectError, httpx.ReadError, httpx.RemoteProtocolError):
+            LLM_REQUESTS.inc(outcome="connection_error")
+            if attempt == LLM_RETRIES:
+                raise
+            delay = _backoff(attempt)
+            remaining = remaining_budget()
+            if remaining is not None and remaining <= delay:
+                raise
+            await asyncio.sleep(delay)
+        except httpx.TimeoutException:
+            LLM_REQUESTS.inc(outcome="timeout")
+            if remaining_budget() is not None:
+                raise LLMTimeout("LLM call exceeded request budget")
+            raise
+
+    raise RuntimeError("unreachable")
+
+
+async def achat(
+    messages: List[Dict[str, str]],
+    options: Optional[Dict[str, Any]] = None,
+    model: str = MODEL,
+    priority: int = PRIORITY_FIRST_TURN,
+    **extra: Any,
+) -> str:
+    """chat() แบบ async สำหรับ API server"""
+    payload = build_payload(messages, options, model, **extra)
+    client = get_async_client()
+
+    async def _call(timeout) -> str:
+        start = time.perf_counter()
+        r = await client.post(OLLAMA_URL, json=payload, timeout=timeout)
+        r.raise_for_status()
+        data = r.json()
+        record_llm_response(data, time.perf_counter() - start)
+        return data["message"]["content"]
+
+    return await _async_retry(_call, priority)
+
+
+async def achat_json(
+    messages: List[Dict[str, str]],
+    schema: Dict[str, Any],
+    options: Optional[Dict[str, Any]] = None,
+    model: str = MODEL,
+    priority: int = PRIORITY_FIRST_TURN,
+    **extra: Any,
+) -> Dict[str, Any]:
+    """chat_json() แบบ async"""
+    payload = build_payload(messages, options, model, format=schema, **extra)
+    payload["stream"] = True
+    client = get_async_client()
+
+    async def _call(timeout) -> Dict[str, Any]:
+        start = time.perf_counter()
+        assembler = JSONObjectAssembler()
+        async with client.stream("POST", OLLAMA_URL, json=payload, timeout=timeout) as r:
+            r.raise_for_status()
+            async for line in r.aiter_lines():
+                if _feed_stream_line(assembler, line):
+                    break
+        return _finish_json(assembler, time.perf_counter() - start, messages)
+
+    return await _async_retry(_call, priority)
+
+
+async def aclose() -> None:
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
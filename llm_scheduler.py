@@ -0,0 +1,220 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+from metrics import LLM_QUEUE_SECONDS, LLM_REQUESTS
+
+# =====================
+# Config
+# =====================
+# จำนวน LLM call ที่ส่งไป backend พร้อมกันได้ ควรเท่ากับ OLLAMA_NUM_PARALLEL ของ server
+# ส่งเกินกว่านี้ Ollama ก็แค่ต่อคิวเอง (FIFO) ทำให้งานสั้นของ user ที่คุยค้างอยู่ต้องรอ
+LLM_MAX_INFLIGHT = int(os.getenv("LLM_MAX_INFLIGHT", os.getenv("OLLAMA_NUM_PARALLEL", "1")))
+
+# ระยะห่างของการเช็ค deadline ระหว่างรอคิว (วินาที)
+LLM_QUEUE_POLL = 0.1
+
+# priority เลขน้อยได้ก่อน
+PRIORITY_COMPLETION = 0   # romanize ตอนจบ session (user รอผลสุดท้าย)
+PRIORITY_FOLLOW_UP = 1    # extract รอบถามกลับ (prompt สั้น, user คุยค้างอยู่)
+PRIORITY_FIRST_TURN = 2   # extract รอบแรก
+PRIORITY_SPECULATIVE = 3  # romanize ล่วงหน้าระหว่าง session ยังไม่ครบ (ไม่มี user รอผลนี้)
+
+PRIORITY_NAMES = {
+    PRIORITY_COMPLETION: "completion",
+    PRIORITY_FOLLOW_UP: "follow_up",
+    PRIORITY_FIRST_TURN: "first_turn",
+    PRIORITY_SPECULATIVE: "speculative",
+}
+
+
+class LLMQueueTimeout(TimeoutError):
+    """budget ของ request หมดระหว่างรอคิว LLM"""
+
+
+# =====================
+# Slot notification
+# =====================
+# งานเบื้องหลัง (เช่น romanize ล่วงหน้า) ตั้ง event ไว้ เพื่อให้คนที่จะรอผลรู้ว่างานได้ slot แล้วหรือยัง
+_slot_event: contextvars.ContextVar[Optional[threading.Event]] = contextvars.ContextVar(
+    "llm_slot_event", default=None
+)
+
+
+@contextmanager
+def notify_on_slot(event: threading.Event):
+    """set event เมื่องาน LLM ข้างในได้ slot (งานที่ยังรอคิวอยู่ event จะยังไม่ถูก set)"""
+    token = _slot_event.set(event)
+    try:
+        yield
+    finally:
+        _slot_event.reset(token)
+
+
+# =====================
+# Scheduler
+# =====================
+class _Waiter:
+    __slots__ = ("key", "priority", "granted", "abandoned", "_notify")
+
+    def __init__(self, priority: int, deadline: Optional[float], seq: int, notify: Callable[[], None]):
+        self.key = (priority, deadline if deadline is not None else math.inf, seq)
+        self.priority = priority
+        self.granted = False
+        self.abandoned = False
+        self._notify = notify
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return self.key < other.key
+
+
+class LLMScheduler:
+    """
+    คิวหน้า LLM backend
+    - ส่งงานพร้อมกันได้ไม่เกิน max_inflight
+    - งานที่รอเรียงตาม (priority, deadline, ลำดับที่เข้า)
+    - งานที่ budget หมด / task ถูกยกเลิก (client หลุด) ระหว่างรอ จะถูกทิ้งโดยไม่ส่งไป backend
+    ใช้ได้ทั้งจาก thread (slot) และ event loop (aslot)
+    """
+
+    def __init__(self, max_inflight: int = LLM_MAX_INFLIGHT):
+        self.max_inflight = max(1, max_inflight)
+        self._lock = threading.Lock()
+        self._heap: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._inflight = 0
+        self.completed = 0
+        self.dropped = 0
+
+    # ---------- internal ----------
+    def _enqueue(self, priority: int, deadline: Optional[float], notify: Callable[[], None]) -> _Waiter:
+        waiter = _Waiter(priority, deadline, next(self._seq), notify)
+        with self._lock:
+            heapq.heappush(self._heap, waiter)
+            self._dispatch()
+        return waiter
+
+    def _dispatch(self) -> None:
+        """ให้ slot กับงานหัวคิว (เรียกขณะถือ lock)"""
+        while self._inflight < self.max_inflight and self._heap:
+            waiter = heapq.heappop(self._heap)
+            if waiter.abandoned:
+                continue
+            waiter.granted = True
+            self._inflight += 1
+            waiter._notify()
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """ถอนงานออกจากคิว คืน False ถ้างานได้ slot ไปแล้ว (ต้อง release เอง)"""
+        with self._lock:
+            if waiter.granted:
+                return False
+            if not waiter.abandoned:
+                waiter.abandoned = True
+                self.dropped += 1
+        return True
+
+    def _check(self, waiter: _Waiter, deadline: Optional[float]) -> None:
+        if deadline is not None and time.monotonic() >= deadline and self._abandon(waiter):
+            LLM_REQUESTS.inc(outcome="dropped_deadline")
+            raise LLMQueueTimeout("request budget exhausted while waiting for an LLM slot")
+
+    def release(self) -> None:
+        with self._lock:
+            self._inflight -= 1
+            self.completed += 1
+            self._dispatch()
+
+    def _granted(self, waiter: _Waiter, start: float) -> None:
+        name = PRIORITY_NAMES.get(waiter.priority, str(waiter.priority))
+        LLM_QUEUE_SECONDS.observe(time.perf_counter() - start, priority=name)
+        event = _slot_event.get()
+        if event is not None:
+            event.set()
+
+    # ---------- public ----------
+    @contextmanager
+    def slot(self, priority: int = PRIORITY_FIRST_TURN, deadline: Optional[float] = None):
+        """
+        รอจนได้ slot แล้วค่อยรันงานข้างใน (สำหรับ thread)
+        deadline: เวลา (time.monotonic) ที่ request หมด budget
+        """
+        start = time.perf_counter()
+        event = threading.Event()
+        waiter = self._enqueue(priority, deadline, event.set)
+        try:
+            while not event.wait(LLM_QUEUE_POLL):
+                self._check(waiter, deadline)
+        except BaseException:
+            if self._abandon(waiter):
+                raise
+            # ได้ slot มาพร้อมกับ exception (เช่น KeyboardInterrupt) คืน slot ก่อน
+            self.release()
+            raise
+
+        self._granted(waiter, start)
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def aslot(self, priority: int = PRIORITY_FIRST_TURN, deadline: Optional[float] = None):
+        """slot() สำหรับ coroutine (ไม่ block event loop ระหว่างรอ)"""
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+        waiter = self._enqueue(priority, deadline, lambda: loop.call_soon_threadsafe(event.set))
+        try:
+            while not event.is_set():
+                try:
+                    await asyncio.wait_for(event.wait(), LLM_QUEUE_POLL)
+                except asyncio.TimeoutError:
+                    self._check(waiter, deadline)
+        except BaseException:
+            # รวมถึง CancelledError เมื่อ task ของ request ถูกยกเลิก
+            if self._abandon(waiter):
+                raise
+            self.release()
+            raise
+
+        self._granted(waiter, start)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            queued: Dict[str, int] = {name: 0 for name in PRIORITY_NAMES.values()}
+            for waiter in self._heap:
+                if not waiter.abandoned:
+                    name = PRIORITY_NAMES.get(waiter.priority, str(waiter.priority))
+                    queued[name] = queued.get(name, 0) + 1
+            return {
+                "max_inflight": self.max_inflight,
+                "inflight": self._inflight,
+                "queued": sum(queued.values()),
+                "queued_by_priority": queued,
+                "completed": self.completed,
+                "dropped": self.dropped,
+            }
+
+
+_scheduler: Optional[LLMScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> LLMScheduler:
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler()
+        return _scheduler
@@ -0,0 +1,120 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# =====================
+# Config
+# =====================
+SAMPLE_RATE = 16000
+
+# เสียงที่ยาวเกินนี้ (วินาที) จะตัดตามช่วงเงียบแล้วถอดเสียงหลาย chunk พร้อมกัน (0 = ปิด)
+# ค่า default = หน้าต่างเดียวของ Whisper เสียงสั้นกว่านี้ decode รอบเดียวจบอยู่แล้ว
+STT_LONG_AUDIO_SECONDS = float(os.getenv("STT_LONG_AUDIO_SECONDS", "30"))
+
+# จำนวน chunk ที่ decode พร้อมกัน (ได้ผลจริงเมื่อ WHISPER_NUM_WORKERS >= ค่านี้)
+STT_LONG_AUDIO_WORKERS = int(os.getenv("STT_LONG_AUDIO_WORKERS", "4"))
+
+# ความยาวเสียงพูดสูงสุดต่อ chunk และช่วงเงียบขั้นต่ำที่ใช้ตัด
+STT_CHUNK_SECONDS = float(os.getenv("STT_CHUNK_SECONDS", "10"))
+STT_CHUNK_MIN_SILENCE_MS = int(os.getenv("STT_CHUNK_MIN_SILENCE_MS", "500"))
+
+
+def is_long_audio(audio: np.ndarray, threshold: float = STT_LONG_AUDIO_SECONDS) -> bool:
+    return threshold > 0 and len(audio) > threshold * SAMPLE_RATE
+
+
+def split_on_silence(
+    audio: np.ndarray,
+    chunk_seconds: float = STT_CHUNK_SECONDS,
+    min_silence_ms: int = STT_CHUNK_MIN_SILENCE_MS,
+) -> List[np.ndarray]:
+    """
+    ใช้ Silero VAD (ตัวเดียวกับ vad_filter ของ faster-whisper) หาช่วงที่มีเสียงพูด
+    ทิ้งช่วงเงียบทั้งหมด แล้วรวมช่วงพูดที่ติดกันเป็น chunk ยาวไม่เกิน chunk_seconds
+    คืน list ของ chunk ตามลำดับเวลา
+    """
+    from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+    options = VadOptions(
+        min_silence_duration_ms=min_silence_ms,
+        max_speech_duration_s=chunk_seconds,
+    )
+    speech = get_speech_timestamps(audio, options, sampling_rate=SAMPLE_RATE)
+
+    max_samples = int(chunk_seconds * SAMPLE_RATE)
+    chunks: List[np.ndarray] = []
+    current: List[np.ndarray] = []
+    current_len = 0
+
+    for ts in speech:
+        piece = audio[ts["start"]:ts["end"]]
+        if current and current_len + len(piece) > max_samples:
+            chunks.append(np.concatenate(current))
+            current, current_len = [], 0
+        current.append(piece)
+        current_len += len(piece)
+
+    if current:
+        chunks.append(np.concatenate(current))
+    return chunks
+
+
+def transcribe_long(
+    model,
+    audio: np.ndarray,
+    beam_size: int,
+    language: Optional[str] = None,
+    initial_prompt: Optional[str] = None,
+    workers: int = STT_LONG_AUDIO_WORKERS,
+) -> Tuple[str, Optional[str], Dict[str, Any]]:
+    """
+    ถอดเสียงยาว: ตัดตามช่วงเงียบ -> decode แต่ละ chunk พร้อมกัน -> ต่อข้อความตามลำดับเดิม
+    คืน (ข้อความ, ภาษา, สถิติการตัด)
+    """
+    chunks = split_on_silence(audio)
+    speech_samples = sum(len(c) for c in chunks)
+    stats = {
+        "chunks": len(chunks),
+        "audio_seconds": round(len(audio) / SAMPLE_RATE, 2),
+        "speech_seconds": round(speech_samples / SAMPLE_RATE, 2),
+    }
+
+    if not chunks:
+        return "", language, stats
+
+    text, language = transcribe_chunks(model, chunks, beam_size, language, initial_prompt, workers)
+    return text, language, stats
+
+
+def transcribe_chunks(
+    model,
+    chunks: List[np.ndarray],
+    beam_size: int,
+    language: Optional[str] = None,
+    initial_prompt: Optional[str] = None,
+    workers: int = STT_LONG_AUDIO_WORKERS,
+) -> Tuple[str, Optional[str]]:
+    """decode chunk พร้อมกันสูงสุด workers ตัว แล้วต่อข้อความตามลำดับ chunk"""
+    # detect ภาษาครั้งเดียวจาก chunk ที่ยาวที่สุด ทุก chunk จะได้ภาษาเดียวกัน
+    if language is None:
+        language, _, _ = model.detect_language(max(chunks, key=len))
+
+    def _decode(chunk: np.ndarray) -> str:
+        segments, _ = model.transcribe(
+            chunk,
+            beam_size=beam_size,
+            language=language,
+            initial_prompt=initial_prompt,
+            vad_filter=False,  # ตัดช่วงเงียบไปแล้ว
+        )
+        return " ".join(seg.text.strip() for seg in segments)
+
+    if workers <= 1 or len(chunks) == 1:
+        texts = [_decode(c) for c in chunks]
+    else:
+        with ThreadPoolExecutor(max_workers=min(workers, len(chunks)), thread_name_prefix="stt-chunk") as pool:
+            texts = list(pool.map(_decode, chunks))
+
+    return " ".join(t for t in texts if t), language
@@ -0,0 +1,262 @@
+"""
+Metrics แบบ Prometheus (text exposition format 0.0.4) โดยไม่ต้องพึ่ง prometheus_client
+
+- Counter / Histogram: เก็บค่าในหน่วยความจำของ process
+- register_callback(): ค่าที่อ่านสด ๆ ตอน scrape (เช่นจำนวน session, ความลึกคิว, hit rate ของ cache)
+- span(stage): จับเวลาแต่ละ stage -> histogram voice_stage_seconds{stage=...}
+  และเก็บลง breakdown ของ request ปัจจุบัน (ถ้าอยู่ใน request_timings())
+"""
+import contextvars
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+LabelKey = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelKey:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type_name}"]
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # key -> ([count ต่อ bucket], sum, count)
+        self._values: Dict[LabelKey, Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total, n = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value, n + 1)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, (list(c), s, n)) for k, (c, s, n) in self._values.items())
+
+        lines = self.header()
+        for key, (counts, total, n) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {n}")
+        return lines
+
+
+class _Callback:
+    """ค่าที่คำนวณตอน scrape: fn คืน [(labels, value)]"""
+
+    def __init__(self, name: str, type_name: str, help_text: str, fn: Callable[[], List[Tuple[Dict[str, str], float]]]):
+        self.name = name
+        self.type_name = type_name
+        self.help = help_text
+        self.fn = fn
+
+    def render(self) -> List[str]:
+        try:
+            samples = self.fn()
+        except Exception:
+            logger.exception("metrics callback %s failed", self.name)
+            return []
+
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type_name}"]
+        for labels, value in samples:
+            if value is None:
+                continue
+            lines.append(f"{self.name}{_format_labels(list(labels), list(labels.values()))} {_format_value(value)}")
+        return lines
+
+
+# =====================
+# Registry
+# =====================
+_registry: List[object] = []
+_registry_lock = threading.Lock()
+
+
+def _register(metric):
+    with _registry_lock:
+        _registry.append(metric)
+    return metric
+
+
+def counter(name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+    return _register(Counter(name, help_text, labelnames))
+
+
+def histogram(name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return _register(Histogram(name, help_text, labelnames, buckets))
+
+
+def register_callback(name: str, type_name: str, help_text: str, fn: Callable[[], List[Tuple[Dict[str, str], float]]]) -> None:
+    _register(_Callback(name, type_name, help_text, fn))
+
+
+def render() -> str:
+    with _registry_lock:
+        metrics = list(_registry)
+    lines: List[str] = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# =====================
+# Metrics ของระบบ
+# =====================
+STAGE_SECONDS = histogram("voice_stage_seconds", "Time spent in each pipeline stage", ["stage"])
+REQUESTS = counter("voice_http_requests_total", "HTTP requests by endpoint and status code", ["endpoint", "status"])
+REQUEST_SECONDS = histogram("voice_http_request_seconds", "HTTP request latency by endpoint", ["endpoint"])
+
+AUDIO_SECONDS = histogram(
+    "voice_audio_duration_seconds", "Duration of decoded audio",
+    buckets=(1, 2, 5, 10, 15, 20, 30, 45, 60, 120, 300),
+)
+STT_RTF = histogram(
+    "voice_stt_real_time_factor", "STT decode time divided by audio duration",
+    buckets=(0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 5.0),
+)
+
+STT_EARLY_STOP_SECONDS = counter(
+    "voice_stt_early_stop_skipped_seconds_total", "Estimated audio left undecoded by early stop (audio more than one 30 s window past the stopping segment)"
+)
+
+AUDIO_TRIMMED_SECONDS = counter(
+    "voice_audio_trimmed_seconds_total", "Audio removed before STT (part=head/tail: silence, truncated: over the cap)", ["part"]
+)
+AUDIO_REJECTED = counter("voice_audio_rejected_total", "Clips answered with 'please repeat' without decoding", ["reason"])
+
+LLM_TOKENS = counter(
+    "voice_llm_tokens_total",
+    "LLM tokens (direction=in: prompt, in_estimated: prompt estimated from its size when the stream was closed early, out: generated)",
+    ["direction"],
+)
+LLM_REQUESTS = counter("voice_llm_requests_total", "LLM calls by outcome", ["outcome"])
+LLM_SECONDS = histogram("voice_llm_request_seconds", "LLM call latency")
+LLM_QUEUE_SECONDS = histogram("voice_llm_queue_wait_seconds", "Time spent waiting for an LLM slot", ["priority"])
+
+
+def record_llm_response(data: dict, seconds: float, prompt_tokens_estimate: Optional[int] = None) -> None:
+    """
+    บันทึก token / เวลา จาก response ของ Ollama /api/chat
+    ไม่มี prompt_eval_count (ปิด stream ก่อนข้อความ done) -> นับ prompt_tokens_estimate เป็น direction=in_estimated
+    """
+    LLM_REQUESTS.inc(outcome="ok")
+    LLM_SECONDS.observe(seconds)
+    if data.get("prompt_eval_count") is not None:
+        LLM_TOKENS.inc(data["prompt_eval_count"], direction="in")
+    elif prompt_tokens_estimate is not None:
+        LLM_TOKENS.inc(prompt_tokens_estimate, direction="in_estimated")
+    LLM_TOKENS.inc(data.get("eval_count") or 0, direction="out")
+
+
+# =====================
+# Spans
+# =====================
+_timings: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar("stage_timings", default=None)
+
+
+@contextmanager
+def request_timings() -> Iterator[Dict[str, float]]:
+    """breakdown เวลาของ request ปัจจุบัน {stage: วินาที} ทุก span ข้างในจะถูกบวกเข้ามา"""
+    timings: Dict[str, float] = {}
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        timings = _timings.get()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + elapsed
+        logger.debug("stage %s took %.1f ms", stage, elapsed * 1000)
+
+
+def server_timing(timings: Dict[str, float]) -> str:
+    """ค่า header Server-Timing เช่น 'stt;dur=812.3, extract;dur=402.1'"""
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items())
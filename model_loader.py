@@ -0,0 +1,147 @@
+import json
+import os
+import threading
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+# =====================
+# Config
+# =====================
+# ลำดับความสำคัญ: ค่า default < ไฟล์ config (STT_CONFIG_PATH) < environment variable
+DEFAULT_CONFIG: Dict[str, Any] = {
+    "model_size": "large",
+    "device": "cpu",
+    "compute_type": "int8",
+    "cpu_threads": 0,
+    "num_workers": 1,
+    "beam_size": 10,
+    # รอบถามกลับ (คำตอบสั้น ๆ ตาม missing_fields) ดู decode_profiles.py
+    "followup_beam_size": 2,
+    "followup_model_size": "",  # ว่าง = ใช้ model เดียวกับ model_size
+    # model ของ Ollama ที่ใช้ extract / romanize (llm_client) อยู่ในไฟล์เดียวกันเพื่อให้ benchmarks.calibrate
+    # เขียน config ที่เลือกได้ครบในไฟล์เดียว
+    "llm_model": "qwen2.5:7b-instruct",
+}
+
+ENV_KEYS = {
+    "model_size": ("WHISPER_MODEL_SIZE", str),
+    "device": ("WHISPER_DEVICE", str),
+    "compute_type": ("WHISPER_COMPUTE_TYPE", str),
+    "cpu_threads": ("WHISPER_CPU_THREADS", int),
+    "num_workers": ("WHISPER_NUM_WORKERS", int),
+    "beam_size": ("WHISPER_BEAM_SIZE", int),
+    "followup_beam_size": ("WHISPER_FOLLOWUP_BEAM_SIZE", int),
+    "followup_model_size": ("WHISPER_FOLLOWUP_MODEL_SIZE", str),
+    "llm_model": ("LLM_MODEL", str),
+}
+
+# decode เสียงเงียบสั้น ๆ หนึ่งรอบหลังโหลด เพื่อให้ request แรกไม่ต้องจ่ายค่า init
+WHISPER_WARMUP = os.getenv("WHISPER_WARMUP", "1") == "1"
+WARMUP_SECONDS = 1.0
+
+
+def load_config(path: Optional[str] = None) -> Dict[str, Any]:
+    config = dict(DEFAULT_CONFIG)
+
+    path = path or os.getenv("STT_CONFIG_PATH")
+    if path and os.path.isfile(path):
+        with open(path, "r", encoding="utf-8") as f:
+            file_config = json.load(f)
+        config.update({k: v for k, v in file_config.items() if k in DEFAULT_CONFIG})
+
+    for key, (env_name, cast) in ENV_KEYS.items():
+        value = os.getenv(env_name)
+        if value:
+            config[key] = cast(value)
+
+    return config
+
+
+CONFIG = load_config()
+
+
+# =====================
+# Lazy model loading
+# =====================
+_models: Dict[str, Any] = {}
+_lock = threading.Lock()
+_state = {"status": "idle", "error": None}
+
+
+def get_model(model_size: Optional[str] = None):
+    """
+    คืน WhisperModel (โหลดครั้งแรกที่เรียกใช้ ไม่ใช่ตอน import)
+    model_size=None ใช้ขนาดจาก config
+    """
+    size = model_size or CONFIG["model_size"]
+    model = _models.get(size)
+    if model is not None:
+        return model
+
+    with _lock:
+        model = _models.get(size)
+        if model is not None:
+            return model
+
+        is_default = size == CONFIG["model_size"]
+        if is_default:
+            _state["status"] = "loading"
+
+        try:
+            from faster_whisper import WhisperModel
+
+            model = WhisperModel(
+                size,
+                device=CONFIG["device"],
+                compute_type=CONFIG["compute_type"],
+                cpu_threads=CONFIG["cpu_threads"],
+                num_workers=CONFIG["num_workers"],
+            )
+            if WHISPER_WARMUP:
+                warmup(model)
+        except Exception as e:
+            if is_default:
+                _state["status"] = "failed"
+                _state["error"] = str(e)
+            raise
+
+        _models[size] = model
+        if is_default:
+            _state["status"] = "ready"
+            _state["error"] = None
+        return model
+
+
+def warmup(model) -> None:
+    """decode เสียงเงียบที่สร้างในหน่วยความจำ 1 รอบ"""
+    silence = np.zeros(int(16000 * WARMUP_SECONDS), dtype=np.float32)
+    segments, _ = model.transcribe(silence, beam_size=1)
+    list(segments)
+
+
+def start_background_load() -> threading.Thread:
+    """เริ่มโหลด model default ใน background (ใช้ตอน server start)"""
+
+    def _load():
+        try:
+            get_model()
+        except Exception:
+            pass  # สถานะ failed ถูกเก็บไว้ใน _state แล้ว
+
+    t = threading.Thread(target=_load, name="whisper-loader", daemon=True)
+    t.start()
+    return t
+
+
+def is_ready() -> bool:
+    return _state["status"] == "ready"
+
+
+def model_state() -> Dict[str, Any]:
+    return {
+        "status": _state["status"],
+        "error": _state["error"],
+        "config": CONFIG,
+        "loaded_models": list(_models),
+    }
@@ -1,66 +1,323 @@
+import hashlib
 import json
+import logging
+import os
 import re
-import requests
-from faster_whisper import WhisperModel
+import time
+import numpy as np
 from validator import validate_data, build_message
 from romanize import romanize_person
 from plate_normalizer import normalize_license_plate
+from stt_batcher import get_batcher
+from model_loader import CONFIG, get_model
+from decode_profiles import first_turn_profile, is_default_profile
+from long_audio import STT_LONG_AUDIO_SECONDS, is_long_audio, transcribe_long
+from llm_client import achat_json, chat_json
+from llm_client import MODEL as LLM_MODEL
+from llm_scheduler import PRIORITY_FIRST_TURN, PRIORITY_FOLLOW_UP
+from rule_extractor import ALL_FIELDS, confident_fields
+from kv_cache import TieredCache
+from metrics import AUDIO_SECONDS, STT_EARLY_STOP_SECONDS, STT_RTF, request_timings, server_timing, span
+from audio_io import decode_file
+from preprocess import NoSpeech, preprocess_audio
+from whisper_server import WHISPER_SERVER_SOCKET, remote_transcribe
+
+logger = logging.getLogger(__name__)
 
 # =====================
 # STT
 # =====================
 
-model = WhisperModel("large", device="cpu", compute_type="int8")
+# model จะถูกโหลดตอนเรียก speech_to_text ครั้งแรก (ดู model_loader.py)
+BEAM_SIZE = CONFIG["beam_size"]
 
-def speech_to_text(audio_path: str) -> str:
-    
+# Whisper decode ทีละหน้าต่าง 30 วินาที (generate ครั้งเดียวต่อหน้าต่าง)
+# หน้าต่างถัดไปเริ่มที่ timestamp สุดท้ายของหน้าต่างก่อน และเมื่อเปิด vad_filter หน้าต่างนับบนเสียงที่ตัดช่วงเงียบแล้ว
+# จุดที่ decoder หยุดจริงจึงดูจากภายนอกไม่ได้ ใช้ประมาณการแบบไม่เกินจริงแทน (ดู transcribe_local)
+WHISPER_WINDOW_SECONDS = 30.0
 
-    segments, _ = model.transcribe(
-        audio_path,
-        beam_size=10,
-        vad_filter=True
-    )
+# cache: hash ของเสียง -> transcript (client retry / QA replay ไม่ต้อง decode ซ้ำ)
+transcript_cache = TieredCache(
+    "transcript",
+    max_entries=int(os.getenv("STT_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("STT_CACHE_TTL", "3600")),
+    disk_path=os.getenv("STT_CACHE_PATH") or None,
+)
+
+def _audio_digest(audio: str | np.ndarray) -> str:
+    h = hashlib.sha256()
+    if isinstance(audio, str):
+        with open(audio, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+    else:
+        h.update(np.ascontiguousarray(audio, dtype=np.float32).tobytes())
+    return h.hexdigest()
+
+def _transcript_cache_key(audio: str | np.ndarray, profile: dict) -> str:
+    # เปลี่ยน model / compute type / beam / ภาษา / prompt แล้ว key จะเปลี่ยนตาม
+    prompt = profile["initial_prompt"] or ""
+    return "|".join([
+        profile["model_size"],
+        CONFIG["compute_type"],
+        str(profile["beam_size"]),
+        profile["language"] or "auto",
+        hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16],
+        ",".join(profile.get("stop_when_fields") or []),
+        _audio_digest(audio),
+    ])
+
+def transcribe_audio(audio: str | np.ndarray, profile: dict | None = None) -> dict:
+    """
+    audio: path ของไฟล์เสียง หรือ NumPy float32 16 kHz mono (จาก audio_io.load_audio)
+    profile: decode profile จาก decode_profiles.select_profile (None = รอบแรก)
+    คืน {"text", "language", "skipped_seconds", "profile"}
+    skipped_seconds: ประมาณการเสียงท้ายที่ไม่ได้ decode เพราะได้ field ที่ถามครบแล้ว (ดู decode_profiles.STT_EARLY_STOP)
+        นับเฉพาะเสียงที่เลยจุดจบของ segment ที่หยุดไปอีกหนึ่งหน้าต่าง (30 วินาที) ไม่ใช่ค่าที่วัดจาก decoder
+    ตั้ง WHISPER_SERVER_SOCKET: ส่งไปถอดเสียงที่ model server (whisper_server.py) ไม่โหลด model ใน process นี้
+    """
+    profile = profile or first_turn_profile()
+
+    if WHISPER_SERVER_SOCKET:
+        if isinstance(audio, str):
+            audio = decode_file(audio)
+        result = remote_transcribe(audio, profile)
+        return {
+            "text": result["text"],
+            "language": result["language"],
+            "skipped_seconds": result.get("skipped_seconds", 0.0),
+            "profile": profile,
+        }
+
+    return transcribe_local(audio, profile)
+
+def _collect_segments(segments, stop_when_fields: list[str] | None) -> tuple[list[str], float | None]:
+    """
+    ดึงข้อความจาก generator ของ model.transcribe (decode ไปทีละช่วงตามที่ดึง)
+    มี stop_when_fields: เช็คข้อความสะสมหลังแต่ละ segment ถ้า rule ได้ค่าที่ valid ครบทุก field แล้วหยุด decode
+    คืน (ข้อความแต่ละ segment, เวลาจบของ segment สุดท้าย หรือ None ถ้า decode จนจบไฟล์)
+    """
+    parts = []
+    for seg in segments:
+        parts.append(seg.text.strip())
+        if stop_when_fields and len(confident_fields(" ".join(parts), stop_when_fields)) == len(stop_when_fields):
+            close = getattr(segments, "close", None)
+            if close is not None:
+                close()
+            return parts, seg.end
+    return parts, None
+
+def transcribe_local(audio: str | np.ndarray, profile: dict | None = None) -> dict:
+    """ถอดเสียงด้วย model ใน process นี้ (cache, batching, เสียงยาว) whisper_server ก็เรียกตัวนี้"""
+    profile = profile or first_turn_profile()
+
+    cache_key = _transcript_cache_key(audio, profile)
+    cached = transcript_cache.get(cache_key)
+    if cached is not None:
+        return {**cached, "profile": profile}
+
+    model = get_model(profile["model_size"])
+    start = time.perf_counter()
+
+    # รวม request ที่เข้ามาพร้อมกันเป็น batch (เปิดด้วย STT_BATCH_MAX_SIZE > 1)
+    # batcher ใช้ model/beam หลัก จึงรับเฉพาะ profile รอบแรก
+    batcher = get_batcher() if is_default_profile(profile) else None
+    stop_when_fields = profile.get("stop_when_fields")
+    skipped_seconds = 0.0
+
+    # path -> decode ก่อน เพื่อเช็คความยาว / ส่งเข้า batch
+    if isinstance(audio, str) and (batcher is not None or STT_LONG_AUDIO_SECONDS > 0):
+        from faster_whisper import decode_audio
+
+        audio = decode_audio(audio)
+
+    # early stop ต้อง decode ตามลำดับเวลา จึงไม่ใช้ทางเสียงยาว (decode หลาย chunk พร้อมกัน)
+    if is_long_audio(audio) and not stop_when_fields:
+        # เสียงยาว -> ตัดตามช่วงเงียบแล้ว decode หลาย chunk พร้อมกัน
+        raw_text, language, chunk_stats = transcribe_long(
+            model,
+            audio,
+            beam_size=profile["beam_size"],
+            language=profile["language"],
+            initial_prompt=profile["initial_prompt"],
+        )
+        logger.info("long audio split: %s", chunk_stats)
+    elif batcher is not None and batcher.accepts(audio):
+        # เสียงสั้น -> เข้า batch ร่วมกับ request อื่นที่มาพร้อมกัน
+        raw_text, language = batcher.transcribe_with_language(audio)
+    else:
+        segments, info = model.transcribe(
+            audio,
+            beam_size=profile["beam_size"],
+            language=profile["language"],
+            initial_prompt=profile["initial_prompt"],
+            vad_filter=True
+        )
+
+        parts, stopped_at = _collect_segments(segments, stop_when_fields)
+        raw_text = " ".join(parts)
+        language = info.language
+
+        if stopped_at is not None:
+            # ประมาณการ: หน้าต่างที่มี segment ที่หยุดถูก decode ไปทั้งหน้าต่างแล้ว และจบไม่เกิน 30 วินาทีหลัง segment นั้น
+            # (ไม่อิงขอบ 30 วินาทีของ timeline เดิม เพราะหน้าต่างไม่ได้เริ่มที่เลขคูณ 30)
+            skipped_seconds = max(0.0, info.duration - (stopped_at + WHISPER_WINDOW_SECONDS))
+            STT_EARLY_STOP_SECONDS.inc(skipped_seconds)
+            logger.info("early stop at %.2fs: %s captured, skipped %.2fs", stopped_at, stop_when_fields, skipped_seconds)
 
-    parts = [seg.text.strip() for seg in segments]
-    raw_text = " ".join(parts)
+    duration = info.duration if isinstance(audio, str) else len(audio) / 16000
+    if duration > 0:
+        AUDIO_SECONDS.observe(duration)
+        STT_RTF.observe((time.perf_counter() - start) / duration)
 
     # normalize spacing
     final_text = re.sub(r"\s+", " ", raw_text).strip()
-    
-    print("\n=== TRANSCRIPT ===")
-    print(final_text)
-    return final_text
+
+    logger.info("transcript (%s): %s", profile["name"], final_text)
+
+    result = {"text": final_text, "language": language, "skipped_seconds": round(skipped_seconds, 3)}
+    transcript_cache.put(cache_key, result)
+    return {**result, "profile": profile}
+
+def speech_to_text(audio: str | np.ndarray, profile: dict | None = None) -> str:
+    """
+    audio: path ของไฟล์เสียง หรือ NumPy float32 16 kHz mono (จาก audio_io.load_audio)
+    decode / ตัดช่วงเงียบก่อน (preprocess) ไฟล์ที่ไม่มีเสียงพูดคืน "" โดยไม่ต้องถอดเสียง
+    """
+    if isinstance(audio, str):
+        audio = decode_file(audio)
+
+    try:
+        audio, stats = preprocess_audio(audio)
+    except NoSpeech as e:
+        logger.info("no speech (%s), skipped STT: %s", e.reason, e.stats)
+        return ""
+
+    logger.debug("preprocess: %s", stats)
+    return transcribe_audio(audio, profile)["text"]
 
 
 # =====================
 # LLM Extraction
 # =====================
-OLLAMA_URL = "http://localhost:11434/api/chat"
-MODEL = "qwen2.5:7b-instruct"
+# การเชื่อมต่อ Ollama (pool, keep-alive, timeout, retry) อยู่ใน llm_client.py
+
+# cache: (transcript, expected_fields, model, prompt) -> ผล extract
+# key มี hash ของ system prompt จริงที่ใช้ แก้ prompt เมื่อไหร่ entry เก่าจะไม่ถูกใช้อีก
+extraction_cache = TieredCache(
+    "extraction",
+    max_entries=int(os.getenv("EXTRACT_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("EXTRACT_CACHE_TTL", "86400")),
+    disk_path=os.getenv("EXTRACT_CACHE_PATH") or None,
+)
+
+def _extraction_cache_key(transcript: str, expected_fields: list[str], system_prompt: str) -> str:
+    # prompt + schema ที่บังคับรูปแบบผล เปลี่ยนอย่างใดอย่างหนึ่ง entry เก่าจะไม่ถูกใช้
+    schema = json.dumps(EXTRACTION_SCHEMA, sort_keys=True)
+    prompt_version = hashlib.sha256((system_prompt + schema).encode("utf-8")).hexdigest()[:16]
+    return json.dumps(
+        [LLM_MODEL, prompt_version, sorted(expected_fields), transcript],
+        ensure_ascii=False,
+    )
 
 def extract_fields(transcript: str, expected_fields: list[str] | None = None) -> dict:
-    expected_fields = expected_fields or []
+    """
+    ดึง field จาก transcript
+    - phone / gender / license_plate ที่ rule-based มั่นใจจะไม่ส่งให้ LLM
+    - LLM ถูกเรียกเฉพาะ field ที่ rule ยังหาไม่ได้ (ถ้าครบแล้วไม่เรียกเลย)
+    """
+    resolved, llm_fields, priority = _plan_extraction(transcript, expected_fields or [])
+    llm_data = {} if llm_fields is None else _extract_fields_llm(transcript, llm_fields, priority)
+    return _merge_extraction(resolved, llm_data)
 
-    base_rules = (
-        "Return ONLY valid JSON with exactly these keys:\n"
-        "first_name, last_name, gender, phone, license_plate.\n"
-        "- Always return all keys.\n"
-        "- Use null if a field is missing or unclear.\n"
-        "- Do NOT hallucinate.\n\n"
 
-        "The input text may be in Thai or English, or mixed.\n\n"
+async def aextract_fields(transcript: str, expected_fields: list[str] | None = None) -> dict:
+    """extract_fields() แบบ async (LLM call ผ่าน achat_json ไม่ถือ thread ระหว่างรอ)"""
+    resolved, llm_fields, priority = _plan_extraction(transcript, expected_fields or [])
+    llm_data = {} if llm_fields is None else await _aextract_fields_llm(transcript, llm_fields, priority)
+    return _merge_extraction(resolved, llm_data)
+
+
+def _plan_extraction(transcript: str, expected_fields: list[str]) -> tuple[dict, list[str] | None, int]:
+    """
+    คืน (field ที่ rule-based ได้แล้ว, field ที่ต้องถาม LLM หรือ None ถ้าไม่ต้องเรียก, priority ของ LLM call)
+    """
+    wanted = expected_fields or ALL_FIELDS
+
+    # ไม่มีเสียงพูด -> ไม่ต้องถาม LLM
+    if not transcript.strip():
+        return {}, None, PRIORITY_FIRST_TURN
+
+    resolved = confident_fields(transcript, wanted)
+    remaining = [f for f in wanted if f not in resolved]
 
+    # รอบถามกลับได้คิว LLM ก่อนรอบแรก (user คุยค้างอยู่ และ prompt สั้นกว่า)
+    priority = PRIORITY_FOLLOW_UP if expected_fields else PRIORITY_FIRST_TURN
+
+    if not remaining:
+        return resolved, None, priority
+    if resolved:
+        # rule ได้บาง field แล้ว -> ให้ LLM เติมเฉพาะที่เหลือ
+        return resolved, remaining, priority
+    return resolved, expected_fields, priority
+
+
+def _merge_extraction(resolved: dict, llm_data: dict) -> dict:
+    return {
+        field: resolved.get(field, llm_data.get(field))
+        for field in ALL_FIELDS
+    }
+
+
+# Ollama format: บังคับให้ผลเป็น object 5 key เสมอ (ไม่ต้องตัด ``` หรือเดา JSON)
+EXTRACTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "first_name": {"type": ["string", "null"]},
+        "last_name": {"type": ["string", "null"]},
+        "gender": {"enum": ["male", "female", None]},
+        "phone": {"type": ["string", "null"]},
+        "license_plate": {"type": ["string", "null"]},
+    },
+    "required": ALL_FIELDS,
+    "additionalProperties": False,
+}
+
+# ผลมีแค่ 5 key ค่าสั้น ๆ จำกัด token ที่ generate กัน model วนไม่จบ
+EXTRACT_NUM_PREDICT = int(os.getenv("EXTRACT_NUM_PREDICT", "160"))
+
+# กฎเฉพาะ field (ชื่อ-นามสกุลไม่มีกฎเพิ่ม) รอบถามกลับจะใส่เฉพาะของ field ที่ถาม
+FIELD_RULES = {
+    "gender": (
         "Gender rules:\n"
         "- male: ชาย, ผู้ชาย, man, male\n"
         "- female: หญิง, ผู้หญิง, woman, female\n"
         "- Otherwise: null\n\n"
-
+    ),
+    "phone": (
         "Phone rules:\n"
         "- Digits only (no spaces, no hyphens).\n"
         "- Thai or English speech may be used "
         "(e.g., 'ศูนย์หกหนึ่งแปดห้า หนึ่งศูนย์หกหนึ่งแปด', "
         "'zero six one eight five one zero six one eight').\n"
         "- If unclear, set null.\n\n"
+    ),
+    "license_plate": (
+        "License plate rules:\n"
+        "- Thai spelled letters must be converted to Thai characters.\n"
+        "  Example: 'กอไก่ ขอไข่ 1 2 3 4' -> 'กข1234'\n"
+        "- English license plates are allowed.\n"
+        "  Example: 'AB 1 2 3 4' -> 'AB1234'\n"
+        "- Keep license_plate as a compact string (no spaces).\n"
+        "- If unclear, set null.\n\n"
+    ),
+}
+
+def build_extraction_prompt(expected_fields: list[str]) -> str:
+    base_rules = (
+        "You extract structured fields from speech transcripts.\n"
+        "The input text may be in Thai or English, or mixed.\n"
+        "Use null if a field is missing or unclear. Do NOT hallucinate.\n\n"
     )
 
     # โหมดรอบถามกลับ: จำกัดให้เติมเฉพาะ field ที่ถาม
@@ -68,56 +325,59 @@ def extract_fields(transcript: str, expected_fields: list[str] | None = None) ->
         focus_rules = (
             f"You are ONLY allowed to fill these fields: {expected_fields}.\n"
             "All other fields MUST be null.\n"
-            "You may infer implicitly if transcript matches the requested field(s).\n"
+            "You may infer implicitly if transcript matches the requested field(s).\n\n"
         )
     else:
         # โหมดรอบแรก: ให้พยายามเติมทุก field ตาม transcript
         focus_rules = (
             "Fill as many fields as you can from the transcript.\n"
-            "If a field is not explicitly present, set it to null.\n"
+            "If a field is not explicitly present, set it to null.\n\n"
         )
 
-    license_rules = (
-        "License plate rules:\n"
-        "- Thai spelled letters must be converted to Thai characters.\n"
-        "  Example: 'กอไก่ ขอไข่ 1 2 3 4' -> 'กข1234'\n"
-        "- English license plates are allowed.\n"
-        "  Example: 'AB 1 2 3 4' -> 'AB1234'\n"
-        "- Keep license_plate as a compact string (no spaces).\n"
-        "- If unclear, set null.\n\n"
-    )
+    fields = expected_fields or ALL_FIELDS
+    rules = "".join(FIELD_RULES[f] for f in fields if f in FIELD_RULES)
+    return (base_rules + focus_rules + rules).strip()
 
-    system_prompt = (
-        "You extract structured fields from Thai speech transcripts.\n"
-        "You extract structured fields from speech transcripts.\n\n"
-        + base_rules
-        + focus_rules
-        + license_rules
-        + "No explanation, no markdown.\n"
-    )
 
-    payload = {
-        "model": MODEL,
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": f"Transcript:\n{transcript}"},
-        ],
-        "stream": False,
-        "options": {  
-            "temperature": 0,
-            "top_p": 1
-        }
+def _extraction_request(transcript: str, expected_fields: list[str]) -> tuple[str, list[dict], dict]:
+    """คืน (cache key, messages, options) ของ LLM call"""
+    system_prompt = build_extraction_prompt(expected_fields)
+    cache_key = _extraction_cache_key(transcript, expected_fields, system_prompt)
+
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": f"Transcript:\n{transcript}"},
+    ]
+    options = {
+        "temperature": 0,
+        "top_p": 1,
+        "num_predict": EXTRACT_NUM_PREDICT,
     }
+    return cache_key, messages, options
 
-    r = requests.post(OLLAMA_URL, json=payload, timeout=120)
-    r.raise_for_status()
 
-    content = r.json()["message"]["content"].strip()
-    content = re.sub(r"^```(?:json)?\s*", "", content)
-    content = re.sub(r"\s*```$", "", content)
+def _extract_fields_llm(transcript: str, expected_fields: list[str], priority: int = PRIORITY_FIRST_TURN) -> dict:
+    cache_key, messages, options = _extraction_request(transcript, expected_fields)
+    cached = extraction_cache.get(cache_key)
+    if cached is not None:
+        return cached
 
-    raw = json.loads(content)
+    # stream + schema: ปิด connection ทันทีที่ได้ object ครบ
+    raw = chat_json(messages, EXTRACTION_SCHEMA, options, priority=priority)
+    return _store_extraction(cache_key, raw)
 
+
+async def _aextract_fields_llm(transcript: str, expected_fields: list[str], priority: int = PRIORITY_FIRST_TURN) -> dict:
+    cache_key, messages, options = _extraction_request(transcript, expected_fields)
+    cached = extraction_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    raw = await achat_json(messages, EXTRACTION_SCHEMA, options, priority=priority)
+    return _store_extraction(cache_key, raw)
+
+
+def _store_extraction(cache_key: str, raw: dict) -> dict:
     normalized = {
         "first_name": raw.get("first_name"),
         "last_name": raw.get("last_name"),
@@ -126,6 +386,7 @@ def extract_fields(transcript: str, expected_fields: list[str] | None = None) ->
         "license_plate": raw.get("license_plate"),
     }
 
+    extraction_cache.put(cache_key, normalized)
     return normalized
 
 
@@ -133,21 +394,33 @@ def extract_fields(transcript: str, expected_fields: list[str] | None = None) ->
 # FULL PIPELINE 
 # =====================
 def run_pipeline(audio_path: str) -> dict:
+    with request_timings() as timings:
+        result = _run_pipeline(audio_path)
+    logger.info("timings: %s", server_timing(timings))
+    return result
+
+
+def _run_pipeline(audio_path: str) -> dict:
     # Step 1: STT
-    transcript = speech_to_text(audio_path)
+    with span("stt"):
+        transcript = speech_to_text(audio_path)
 
     # Step 2: LLM extraction
-    data = extract_fields(transcript)
+    with span("extract"):
+        data = extract_fields(transcript)
     
-    if data.get("license_plate") is not None:
-        data["license_plate"] = normalize_license_plate(data["license_plate"])
+    with span("normalize"):
+        if data.get("license_plate") is not None:
+            data["license_plate"] = normalize_license_plate(data["license_plate"])
         
     # Step 3: Validation
-    status, missing = validate_data(data)
+    with span("validate"):
+        status, missing = validate_data(data)
 
     # Step 4: Final output 
     if status == "complete":
-        data_en = romanize_person(data)
+        with span("romanize"):
+            data_en = romanize_person(data)
         return {
             "status": "complete",
             "data": data_en
@@ -161,6 +434,11 @@ def run_pipeline(audio_path: str) -> dict:
 
 
 if __name__ == "__main__":
-    result = run_pipeline("testcase_eng_2.wav")
-    print(json.dumps(result, ensure_ascii=False, indent=2))
+    import sys
 
+    # ปิด log (transcript / timings) ได้ด้วย LOG_LEVEL=WARNING
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(message)s")
+
+    # หลายไฟล์ใช้ batch_cli.py แทน
+    result = run_pipeline(sys.argv[1] if len(sys.argv) > 1 else "testcase_eng_2.wav")
+    print(json.dumps(result, ensure_ascii=False, indent=2))
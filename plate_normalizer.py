@@ -1,4 +1,5 @@
 import re
+from typing import Iterable
 
 # map คำอ่านเป็นตัวอักษรไทย
 THAI_SPELL_MAP = {
@@ -37,49 +38,67 @@ THAI_SPELL_MAP = {
 
 FILLERS = ["ทะเบียน", "ป้ายทะเบียน", "ทะเบียนรถ", "รถ", "จังหวัด", "กรุงเทพ", "กทม", "ครับ", "ค่ะ"]
 
+# =====================
+# Compiled patterns (สร้างครั้งเดียวตอน import)
+# =====================
+# เดิมลบฟิลเลอร์ทีละคำตามลำดับใน FILLERS คำที่มีฟิลเลอร์ก่อนหน้าอยู่ข้างใน
+# (เช่น "ป้ายทะเบียน" มี "ทะเบียน") จะไม่มีทาง match แล้ว จึงตัดออก
+# เพื่อให้ regex เดียวได้ผลเหมือนการ replace ทีละคำ
+_EFFECTIVE_FILLERS = [
+    w for i, w in enumerate(FILLERS)
+    if not any(prev in w for prev in FILLERS[:i])
+]
+_FILLER_RE = re.compile("|".join(re.escape(w) for w in _EFFECTIVE_FILLERS))
+
+# คำอ่านยาวก่อน (ลำดับเดียวกับการ replace แบบเดิม)
+_SPELL_RE = re.compile(
+    "|".join(re.escape(k) for k in sorted(THAI_SPELL_MAP.keys(), key=len, reverse=True))
+)
+
+_EN_PLATE_RE = re.compile(r"(?<![A-Z0-9])([A-Z]{1,3})[\s\-\.]*([0-9]{1,4})(?![A-Z0-9])")
+_NON_TH_PLATE_RE = re.compile(r"[^0-9ก-๙]")
+_TH_PLATE_RE = re.compile(r"([ก-ฮ]{1,3})(\d{1,4})")
+
+
+def _spell_to_letter(m: re.Match) -> str:
+    return THAI_SPELL_MAP[m.group(0)]
+
+
 def normalize_license_plate(text: str | None) -> str | None:
     if not text:
         return None
 
-    s = text.strip()
-    
-    # ลบคำฟิลเลอร์แบบไม่ทำลายรูปประโยค
-    s_up = s.upper()
-    for w in FILLERS:
-        s_up = s_up.replace(w.upper(), " ")
+    # ลบคำฟิลเลอร์แบบไม่ทำลายรูปประโยค (ฟิลเลอร์เป็นภาษาไทย ใช้ผลเดียวกันได้ทั้งสองฝั่ง)
+    s = _FILLER_RE.sub(" ", text.strip())
 
     # EN plate: รองรับ AB1234 / AB 1234 / AB-1234 / AB1234.
     #  ใช้ boundary กันตัวอักษรแปลก ๆ ติดหน้า-ท้าย
-    m_en = re.search(
-        r"(?<![A-Z0-9])([A-Z]{1,3})[\s\-\.]*([0-9]{1,4})(?![A-Z0-9])",
-        s_up
-    )
+    m_en = _EN_PLATE_RE.search(s.upper())
     if m_en:
         return f"{m_en.group(1)}{m_en.group(2)}"
 
     # TH plate: กข1234 / ก.ไก่ ข.ไข่ 1 2 3 4 (ผ่าน map)
-    s_th = s.strip()
+    # แปลงคำอ่านเป็นตัวอักษรไทยในรอบเดียว แล้วเก็บเฉพาะ ไทย+เลข
+    # (ตัวคั่น - . และช่องว่างถูกตัดทิ้งในขั้นนี้อยู่แล้ว)
+    s_th = _SPELL_RE.sub(_spell_to_letter, s)
+    s_th = _NON_TH_PLATE_RE.sub("", s_th)
 
-    # ลบฟิลเลอร์อีกรอบฝั่งไทย
-    for w in FILLERS:
-        s_th = s_th.replace(w, " ")
-
-    # normalize separators
-    s_th = s_th.replace("-", " ").replace(".", " ")
-    s_th = re.sub(r"\s+", " ", s_th).strip().lower()
-
-    # แปลงคำอ่านเป็นตัวอักษรไทย 
-    for k in sorted(THAI_SPELL_MAP.keys(), key=len, reverse=True):
-        s_th = s_th.replace(k, THAI_SPELL_MAP[k])
-
-    # ดึงเฉพาะ ไทย+เลข แล้วเอามาต่อกัน
-    s_th = re.sub(r"[^0-9ก-๙]", "", s_th)
-    
-    s_th = s_th.replace(" ", "")
-
-    m_th = re.fullmatch(r"([ก-ฮ]{1,3})(\d{1,4})", s_th)
+    m_th = _TH_PLATE_RE.fullmatch(s_th)
     if not m_th:
         return None
 
     return f"{m_th.group(1)}{m_th.group(2)}"
 
+
+def normalize_many(texts: Iterable[str | None]) -> list[str | None]:
+    """
+    normalize ทีละหลายรายการ (เช่น reprocess ข้อมูลย้อนหลัง)
+    ค่าที่ซ้ำกันจะคำนวณครั้งเดียว
+    """
+    memo: dict[str | None, str | None] = {}
+    out = []
+    for text in texts:
+        if text not in memo:
+            memo[text] = normalize_license_plate(text)
+        out.append(memo[text])
+    return out
@@ -0,0 +1,150 @@
+"""
+เตรียมเสียงก่อนส่งเข้า Whisper (NumPy ล้วน)
+
+เสียงที่เข้ามาถูก downmix / resample เป็น 16 kHz mono แล้วตั้งแต่ตอน decode (audio_io)
+ขั้นนี้:
+- ตัดช่วงเงียบหัว / ท้ายด้วย energy gate ต่อ frame (เหลือ padding ไว้กันพยางค์ขาด)
+- เสียงว่าง / เงียบเกือบทั้งไฟล์ -> NoSpeech ให้ตอบ "กรุณาพูดอีกครั้ง" ทันทีโดยไม่ต้อง decode
+- จำกัดความยาวเสียงพูดที่ส่งเข้า Whisper (ตัดส่วนเกินท้ายไฟล์)
+"""
+import os
+import threading
+from typing import Any, Dict, Tuple
+
+import numpy as np
+
+from audio_io import AUDIO_MAX_SECONDS, SAMPLE_RATE
+from metrics import AUDIO_REJECTED, AUDIO_TRIMMED_SECONDS
+
+# =====================
+# Config
+# =====================
+AUDIO_TRIM_SILENCE = os.getenv("AUDIO_TRIM_SILENCE", "1") == "1"
+
+# gate = 10% ของ RMS frame ที่ดังที่สุด (-20 dB) แต่อยู่ระหว่างสองค่านี้
+# ไฟล์ที่ frame ดังสุดยังต่ำกว่า AUDIO_MIN_RMS ถือว่าเงียบทั้งไฟล์
+AUDIO_SILENCE_RMS = float(os.getenv("AUDIO_SILENCE_RMS", "0.01"))
+AUDIO_MIN_RMS = float(os.getenv("AUDIO_MIN_RMS", "0.003"))
+
+# เสียงพูดรวมน้อยกว่านี้ (ms) ถือว่าไม่มีเสียงพูด
+AUDIO_MIN_SPEECH_MS = int(os.getenv("AUDIO_MIN_SPEECH_MS", "250"))
+
+# ความยาวเสียงสูงสุดที่ส่งเข้า Whisper หลังตัดช่วงเงียบ (วินาที)
+AUDIO_MAX_SPEECH_SECONDS = float(os.getenv("AUDIO_MAX_SPEECH_SECONDS", str(AUDIO_MAX_SECONDS)))
+
+FRAME_MS = 30
+TRIM_PAD_MS = 200
+
+
+class NoSpeech(Exception):
+    """เสียงว่างหรือเงียบจนไม่มีอะไรให้ถอด"""
+
+    def __init__(self, reason: str, stats: Dict[str, Any]):
+        super().__init__(f"no speech in audio ({reason})")
+        self.reason = reason
+        self.stats = stats
+
+
+# =====================
+# Stats
+# =====================
+_totals = {
+    "clips": 0,
+    "rejected": 0,
+    "input_seconds": 0.0,
+    "output_seconds": 0.0,
+    "trimmed_seconds": 0.0,
+    "truncated_seconds": 0.0,
+}
+_totals_lock = threading.Lock()
+
+
+def _record(stats: Dict[str, Any]) -> None:
+    with _totals_lock:
+        _totals["clips"] += 1
+        _totals["rejected"] += 1 if stats["rejected"] else 0
+        _totals["input_seconds"] += stats["input_seconds"]
+        _totals["output_seconds"] += stats["output_seconds"]
+        _totals["trimmed_seconds"] += stats["trimmed_head_seconds"] + stats["trimmed_tail_seconds"]
+        _totals["truncated_seconds"] += stats["truncated_seconds"]
+
+    AUDIO_TRIMMED_SECONDS.inc(stats["trimmed_head_seconds"], part="head")
+    AUDIO_TRIMMED_SECONDS.inc(stats["trimmed_tail_seconds"], part="tail")
+    AUDIO_TRIMMED_SECONDS.inc(stats["truncated_seconds"], part="truncated")
+    if stats["rejected"]:
+        AUDIO_REJECTED.inc(reason=stats["rejected"])
+
+
+def preprocess_stats() -> Dict[str, Any]:
+    """ยอดรวมตั้งแต่ start: เสียงเข้า / ส่งต่อให้ Whisper / ตัดทิ้ง"""
+    with _totals_lock:
+        totals = dict(_totals)
+    saved = totals["input_seconds"] - totals["output_seconds"]
+    totals["saved_ratio"] = round(saved / totals["input_seconds"], 4) if totals["input_seconds"] else 0.0
+    for key in ("input_seconds", "output_seconds", "trimmed_seconds", "truncated_seconds"):
+        totals[key] = round(totals[key], 3)
+    return totals
+
+
+# =====================
+# Preprocess
+# =====================
+def frame_rms(audio: np.ndarray, frame_samples: int = SAMPLE_RATE * FRAME_MS // 1000) -> np.ndarray:
+    """RMS ต่อ frame (frame สุดท้ายที่ไม่เต็มเติมศูนย์)"""
+    n_frames = -(-len(audio) // frame_samples)
+    padded = np.zeros(n_frames * frame_samples, dtype=np.float32)
+    padded[:len(audio)] = audio
+    frames = padded.reshape(n_frames, frame_samples)
+    return np.sqrt(np.einsum("ij,ij->i", frames, frames) / frame_samples)
+
+
+def preprocess_audio(audio: np.ndarray) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """
+    audio: float32 16 kHz mono
+    คืน (เสียงที่ตัดแล้ว, stats) หรือ raise NoSpeech
+    """
+    audio = np.ascontiguousarray(audio, dtype=np.float32)
+    stats: Dict[str, Any] = {
+        "input_seconds": len(audio) / SAMPLE_RATE,
+        "output_seconds": 0.0,
+        "speech_seconds": 0.0,
+        "trimmed_head_seconds": 0.0,
+        "trimmed_tail_seconds": 0.0,
+        "truncated_seconds": 0.0,
+        "rejected": None,
+    }
+
+    if not len(audio):
+        stats["rejected"] = "empty"
+        _record(stats)
+        raise NoSpeech("empty", stats)
+
+    frame_samples = SAMPLE_RATE * FRAME_MS // 1000
+    rms = frame_rms(audio, frame_samples)
+    peak = float(rms.max())
+    gate = min(AUDIO_SILENCE_RMS, max(AUDIO_MIN_RMS, 0.1 * peak))
+    speech = np.flatnonzero(rms >= gate)
+    stats["speech_seconds"] = len(speech) * FRAME_MS / 1000
+
+    if peak < AUDIO_MIN_RMS or len(speech) * FRAME_MS < AUDIO_MIN_SPEECH_MS:
+        stats["rejected"] = "silent"
+        _record(stats)
+        raise NoSpeech("silent", stats)
+
+    start, end = 0, len(audio)
+    if AUDIO_TRIM_SILENCE:
+        pad = SAMPLE_RATE * TRIM_PAD_MS // 1000
+        start = max(0, int(speech[0]) * frame_samples - pad)
+        end = min(len(audio), (int(speech[-1]) + 1) * frame_samples + pad)
+        stats["trimmed_head_seconds"] = start / SAMPLE_RATE
+        stats["trimmed_tail_seconds"] = (len(audio) - end) / SAMPLE_RATE
+
+    max_samples = int(AUDIO_MAX_SPEECH_SECONDS * SAMPLE_RATE)
+    if end - start > max_samples:
+        stats["truncated_seconds"] = (end - start - max_samples) / SAMPLE_RATE
+        end = start + max_samples
+
+    out = audio[start:end]
+    stats["output_seconds"] = len(out) / SAMPLE_RATE
+    _record(stats)
+    return out, stats
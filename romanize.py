@@ -1,57 +1,240 @@
+import json
+import os
 import re
-import requests
+import unicodedata
 
-OLLAMA_URL = "http://localhost:11434/api/chat"
-MODEL = "qwen2.5:7b-instruct"
+from llm_client import achat, chat, MODEL
+from llm_scheduler import PRIORITY_COMPLETION
+from kv_cache import TieredCache
+from validator import validate_name
 
-def romanize_thai_name(th_name: str) -> str:
-    """
-    Convert Thai personal name to common English romanization.
-    If conversion is uncertain, return the original Thai name.
-    """
-    system_prompt = (
-        "You convert Thai personal names to English romanization.\n"
-        "Rules:\n"
-        "- Use common Thai-to-English spelling.\n"
-        "- Return ONLY the romanized name (no explanation).\n"
-        "- If uncertain, return the original Thai name.\n"
-        "- Capitalize the first letter."
-    )
-
-    payload = {
-        "model": MODEL,
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": th_name},
-        ],
-        "stream": False
-    }
-
-    r = requests.post(OLLAMA_URL, json=payload, timeout=120)
-    r.raise_for_status()
-
-    out = r.json()["message"]["content"].strip()
+# =====================
+# Cache
+# =====================
+# ชื่อไทยซ้ำกันบ่อยมาก เก็บผล romanize ไว้ในหน่วยความจำ และบน disk (อยู่ข้าม restart)
+# ไฟล์ถูกเปิดตอนใช้ครั้งแรก ไม่ใช่ตอน import ปิด disk ได้ด้วย ROMANIZE_CACHE_PATH=""
+ROMANIZE_CACHE_SIZE = int(os.getenv("ROMANIZE_CACHE_SIZE", "4096"))
+ROMANIZE_CACHE_PATH = os.getenv("ROMANIZE_CACHE_PATH", ".cache/romanize.sqlite3")
+ROMANIZE_CACHE_DISK_SIZE = int(os.getenv("ROMANIZE_CACHE_DISK_SIZE", "200000"))
+
+# romanize ชื่อที่ผ่าน validate_name แล้วไว้ล่วงหน้าระหว่างที่ session ยังถามต่อ (ปิดได้ด้วย ROMANIZE_AHEAD=0)
+# รอบที่ครบจะได้ผลทันทีโดยไม่ต้องรอ LLM
+ROMANIZE_AHEAD = os.getenv("ROMANIZE_AHEAD", "1") == "1"
+
+romanize_cache = TieredCache(
+    "romanize",
+    max_entries=ROMANIZE_CACHE_SIZE,
+    disk_path=ROMANIZE_CACHE_PATH or None,
+    max_disk_entries=ROMANIZE_CACHE_DISK_SIZE,
+)
+
+SYSTEM_PROMPT = (
+    "You convert Thai personal names to English romanization.\n"
+    "Rules:\n"
+    "- Use common Thai-to-English spelling.\n"
+    "- Return ONLY the romanized name (no explanation).\n"
+    "- If uncertain, return the original Thai name.\n"
+    "- Capitalize the first letter."
+)
+
+BATCH_SYSTEM_PROMPT = (
+    "You convert Thai personal names to English romanization.\n"
+    "The input is a JSON array of Thai names.\n"
+    "Rules:\n"
+    "- Use common Thai-to-English spelling.\n"
+    "- Return ONLY a JSON array of romanized names, same length and order as the input.\n"
+    "- If uncertain about a name, return the original Thai name in its place.\n"
+    "- Capitalize the first letter of each name."
+)
+
+
+def _cache_key(th_name: str) -> str:
+    normalized = unicodedata.normalize("NFC", re.sub(r"\s+", " ", th_name).strip())
+    return f"{MODEL}|{normalized}"
+
+
+def _clean_output(out: str, th_name: str) -> str:
+    out = out.strip()
     out = re.sub(r"^```.*?\n", "", out)
     out = re.sub(r"\n```$", "", out)
     out = out.strip()
-    out = out.replace(" ", "") 
-    
+    out = out.replace(" ", "")
+
     if not out or any(ch in out for ch in "{}[]:"):
         return th_name
 
     return out
 
 
-def romanize_person(data: dict) -> dict:
+def _single_messages(th_name: str) -> list[dict]:
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": th_name},
+    ]
+
+
+def _batch_messages(th_names: list[str]) -> list[dict]:
+    return [
+        {"role": "system", "content": BATCH_SYSTEM_PROMPT},
+        {"role": "user", "content": json.dumps(th_names, ensure_ascii=False)},
+    ]
+
+
+def _parse_batch(content: str, th_names: list[str]) -> list[str] | None:
+    """ผลของ batch call -> รายชื่อ หรือ None ถ้า parse ไม่ได้ / จำนวนไม่ตรง"""
+    content = content.strip()
+    content = re.sub(r"^```(?:json)?\s*", "", content)
+    content = re.sub(r"\s*```$", "", content)
+
+    try:
+        out = json.loads(content)
+    except ValueError:
+        out = None
+
+    if not isinstance(out, list) or len(out) != len(th_names) or not all(isinstance(x, str) for x in out):
+        return None
+
+    return [_clean_output(x, name) for x, name in zip(out, th_names)]
+
+
+# romanize ตอน session ครบแล้ว user รอผลสุดท้ายอยู่ จึงได้คิว LLM ก่อนงานอื่น (PRIORITY_COMPLETION)
+# romanize ล่วงหน้าใช้ PRIORITY_SPECULATIVE ไม่แย่งคิวงานที่มี user รออยู่
+def _romanize_llm(th_name: str, priority: int = PRIORITY_COMPLETION) -> str:
+    return _clean_output(chat(_single_messages(th_name), priority=priority), th_name)
+
+
+def _romanize_llm_batch(th_names: list[str], priority: int = PRIORITY_COMPLETION) -> list[str]:
+    """
+    romanize หลายชื่อใน LLM call เดียว
+    ถ้า parse ผลไม่ได้จะ fallback ไปทำทีละชื่อ
+    """
+    content = chat(_batch_messages(th_names), priority=priority)
+    out = _parse_batch(content, th_names)
+    if out is None:
+        return [_romanize_llm(name, priority) for name in th_names]
+    return out
+
+
+async def _aromanize_llm(th_name: str, priority: int = PRIORITY_COMPLETION) -> str:
+    content = await achat(_single_messages(th_name), priority=priority)
+    return _clean_output(content, th_name)
+
+
+async def _aromanize_llm_batch(th_names: list[str], priority: int = PRIORITY_COMPLETION) -> list[str]:
+    content = await achat(_batch_messages(th_names), priority=priority)
+    out = _parse_batch(content, th_names)
+    if out is None:
+        return [await _aromanize_llm(name, priority) for name in th_names]
+    return out
+
+
+def romanize_thai_name(th_name: str) -> str:
+    """
+    Convert Thai personal name to common English romanization.
+    If conversion is uncertain, return the original Thai name.
+    """
+    return romanize_names([th_name])[0]
+
+
+def _cached(th_names: list[str], known: dict | None = None) -> tuple[list[str | None], list[str]]:
+    """
+    คืน (ผลจาก cache ตามลำดับ, ชื่อที่ยังต้องถาม LLM โดยไม่ซ้ำ)
+    known: ผลที่ romanize ไว้แล้ว {ชื่อไทย: ชื่ออังกฤษ} (เช่นที่เก็บไว้กับ session) ใช้ก่อน cache
+    """
+    known = known or {}
+    results: list[str | None] = [known.get(name) or romanize_cache.get(_cache_key(name)) for name in th_names]
+
+    # ชื่อซ้ำใน request เดียวกันส่งไปแค่ครั้งเดียว
+    todo = list(dict.fromkeys(name for name, res in zip(th_names, results) if res is None))
+    return results, todo
+
+
+_THAI_CHAR_RE = re.compile(r"[\u0e00-\u0e7f]")
+
+
+def _fill(th_names: list[str], results: list[str | None], todo: list[str], fresh: list[str]) -> list[str]:
+    resolved = dict(zip(todo, fresh))
+    for name, value in resolved.items():
+        # ชื่อไทยที่คืนมาเหมือนเดิม (LLM ไม่แน่ใจ / ผลใช้ไม่ได้) ไม่เก็บ ให้รอบหน้าลองใหม่
+        if not _THAI_CHAR_RE.search(value):
+            romanize_cache.put(_cache_key(name), value)
+
+    return [res if res is not None else resolved[name] for name, res in zip(th_names, results)]
+
+
+def romanize_names(th_names: list[str], priority: int = PRIORITY_COMPLETION, known: dict | None = None) -> list[str]:
+    """
+    Romanize several names, using known results and the cache first.
+    Names that miss the cache are sent to the LLM together in one request.
+    """
+    results, todo = _cached(th_names, known)
+    if not todo:
+        return results
+
+    if len(todo) == 1:
+        fresh = [_romanize_llm(todo[0], priority)]
+    else:
+        fresh = _romanize_llm_batch(todo, priority)
+    return _fill(th_names, results, todo, fresh)
+
+
+async def aromanize_names(th_names: list[str], priority: int = PRIORITY_COMPLETION, known: dict | None = None) -> list[str]:
+    """romanize_names() แบบ async"""
+    results, todo = _cached(th_names, known)
+    if not todo:
+        return results
+
+    if len(todo) == 1:
+        fresh = [await _aromanize_llm(todo[0], priority)]
+    else:
+        fresh = await _aromanize_llm_batch(todo, priority)
+    return _fill(th_names, results, todo, fresh)
+
+
+def _name_fields(data: dict) -> list[str]:
+    return [f for f in ("first_name", "last_name") if data.get(f)]
+
+
+def romanize_person(data: dict, known: dict | None = None, priority: int = PRIORITY_COMPLETION) -> dict:
     """
     Romanize first_name and last_name only when present.
+    known: names already romanized ahead of time ({thai: english})
     """
     new_data = data.copy()
 
-    if new_data.get("first_name"):
-        new_data["first_name"] = romanize_thai_name(new_data["first_name"])
+    fields = _name_fields(new_data)
+    if not fields:
+        return new_data
+
+    for field, value in zip(fields, romanize_names([new_data[f] for f in fields], priority, known=known)):
+        new_data[field] = value
+
+    return new_data
+
+
+async def aromanize_person(data: dict, known: dict | None = None, priority: int = PRIORITY_COMPLETION) -> dict:
+    """romanize_person() แบบ async"""
+    new_data = data.copy()
+
+    fields = _name_fields(new_data)
+    if not fields:
+        return new_data
 
-    if new_data.get("last_name"):
-        new_data["last_name"] = romanize_thai_name(new_data["last_name"])
+    for field, value in zip(fields, await aromanize_names([new_data[f] for f in fields], priority, known=known)):
+        new_data[field] = value
 
     return new_data
+
+
+# =====================
+# Romanize ล่วงหน้า
+# =====================
+def names_to_prefetch(data: dict, known: dict) -> list[str]:
+    """ชื่อ-นามสกุลที่ผ่าน validate_name แล้วแต่ยังไม่มีผลใน known (ส่งไป romanize ล่วงหน้าได้)"""
+    return [data[f] for f in _name_fields(data) if validate_name(data[f]) and data[f] not in known]
+
+
+def keep_current(known: dict, data: dict) -> dict:
+    """ทิ้งผลของชื่อที่ถูก merge_data เปลี่ยนไปแล้ว เหลือเฉพาะชื่อที่ยังอยู่ใน data"""
+    names = {data[f] for f in _name_fields(data)}
+    return {th: en for th, en in known.items() if th in names}
@@ -0,0 +1,173 @@
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+from plate_normalizer import THAI_SPELL_MAP, normalize_license_plate
+from validator import validate_phone, validate_gender, validate_license_plate
+
+# =====================
+# Config
+# =====================
+# field ที่ rule ให้ความมั่นใจถึงเกณฑ์นี้จะไม่ส่งไปให้ LLM
+RULE_CONFIDENCE_THRESHOLD = float(os.getenv("RULE_CONFIDENCE_THRESHOLD", "0.8"))
+
+ALL_FIELDS = ["first_name", "last_name", "gender", "phone", "license_plate"]
+
+# คำอ่านตัวเลข (ไทย / อังกฤษ) ตามกฎใน prompt ของ extract_fields
+THAI_DIGIT_WORDS = {
+    "ศูนย์": "0", "หนึ่ง": "1", "เอ็ด": "1", "สอง": "2", "โท": "2", "สาม": "3",
+    "สี่": "4", "ห้า": "5", "หก": "6", "เจ็ด": "7", "แปด": "8", "เก้า": "9",
+}
+ENGLISH_DIGIT_WORDS = {
+    "zero": "0", "oh": "0", "one": "1", "two": "2", "three": "3", "four": "4",
+    "five": "5", "six": "6", "seven": "7", "eight": "8", "nine": "9",
+}
+THAI_NUMERALS = str.maketrans("๐๑๒๓๔๕๖๗๘๙", "0123456789")
+
+# คำที่บอกเพศแบบชัดเจน (ตามกฎใน prompt) "ชาย"/"หญิง" เดี่ยว ๆ ชนกับชื่อคน เช่น "สมชาย"
+# จึงเชื่อเฉพาะตอนที่เป็นคำแยก หรือเป็นคำตอบทั้งประโยค
+GENDER_STRONG = {
+    "male": ["ผู้ชาย", "เพศชาย"],
+    "female": ["ผู้หญิง", "เพศหญิง"],
+}
+# "man" ไม่ใช้ ชนกับชื่อเล่น "Man" (เช่น "my name is Man")
+GENDER_ENGLISH = {
+    "male": ["male"],
+    "female": ["female", "woman"],
+}
+GENDER_BARE = {"male": "ชาย", "female": "หญิง"}
+
+POLITE_WORDS = ["ครับ", "ค่ะ", "คะ", "นะ", "เป็น", "เพศ", "คือ"]
+
+# คำอ่านไทยเขียนติดกับคำอื่นได้ และเป็นส่วนหนึ่งของคำทั่วไป (โท-รศัพท์, สาม-ี, ห้า-ม, เก้า-อี้)
+# จึงแปลงเฉพาะที่เรียงติดกับคำอ่าน/ตัวเลขอื่น หรือเป็นคำแยกที่ไม่มีอักษรไทยติดทั้งสองข้าง
+_THAI_DIGIT_WORD = "|".join(re.escape(w) for w in sorted(THAI_DIGIT_WORDS, key=len, reverse=True))
+_THAI_DIGIT_UNIT_RE = re.compile(rf"{_THAI_DIGIT_WORD}|\d")
+_THAI_DIGIT_RUN_RE = re.compile(rf"(?:{_THAI_DIGIT_WORD}|\d)(?:[\s\-]*(?:{_THAI_DIGIT_WORD}|\d))*")
+_THAI_CHAR_RE = re.compile(r"[\u0e00-\u0e7f]")
+_ENGLISH_DIGIT_WORD_RE = re.compile(
+    "|".join(rf"(?<![a-z]){w}(?![a-z])" for w in sorted(ENGLISH_DIGIT_WORDS, key=len, reverse=True))
+)
+_SPELL_RE = re.compile("|".join(re.escape(k) for k in sorted(THAI_SPELL_MAP, key=len, reverse=True)))
+
+# ตัวเลขที่ติดกัน คั่นด้วยช่องว่าง / ขีด / จุด ได้
+_DIGIT_RUN_RE = re.compile(r"\d(?:[\s\-\.,]*\d)*")
+
+# เลขนำหน้า (เช่น "1กข1234") validator ไม่รับ ห้ามตัดทิ้งแล้วเหลือ "กข1234"
+_TH_PLATE_RE = re.compile(r"(?<![ก-๙0-9])((?:[ก-ฮ][\s\.\-]*){1,3})((?:\d[\s\-]*){1,4})(?![\s\-]*\d)")
+_EN_PLATE_RE = re.compile(r"(?<![A-Za-z0-9])((?:[A-Z][\s\.\-]*){1,3})((?:\d[\s\-]*){1,4})(?![\s\-]*\d)")
+
+
+def _thai_digit_run(m: re.Match) -> str:
+    run = m.group(0)
+    if len(_THAI_DIGIT_UNIT_RE.findall(run)) == 1:
+        text = m.string
+        before = text[m.start() - 1] if m.start() > 0 else " "
+        after = text[m.end()] if m.end() < len(text) else " "
+        if _THAI_CHAR_RE.match(before) or _THAI_CHAR_RE.match(after):
+            return run
+    return _THAI_DIGIT_UNIT_RE.sub(lambda u: THAI_DIGIT_WORDS.get(u.group(0), u.group(0)), run)
+
+
+def digits_from_words(text: str) -> str:
+    """แปลงคำอ่านตัวเลข (ไทย/อังกฤษ) และเลขไทยเป็นตัวเลขอารบิก"""
+    text = text.translate(THAI_NUMERALS).lower()
+    text = _THAI_DIGIT_RUN_RE.sub(_thai_digit_run, text)
+    return _ENGLISH_DIGIT_WORD_RE.sub(lambda m: ENGLISH_DIGIT_WORDS[m.group(0)], text)
+
+
+def extract_phone(text: str) -> Tuple[Optional[str], float]:
+    digits_text = digits_from_words(text)
+    candidates = {re.sub(r"\D", "", m.group(0)) for m in _DIGIT_RUN_RE.finditer(digits_text)}
+    phones = {c for c in candidates if validate_phone(c)}
+
+    if len(phones) == 1:
+        return phones.pop(), 0.95
+    return None, 0.0
+
+
+def extract_gender(text: str) -> Tuple[Optional[str], float]:
+    lowered = text.lower()
+    found: Dict[str, float] = {}
+
+    for gender, words in GENDER_STRONG.items():
+        if any(w in lowered for w in words):
+            found[gender] = 0.95
+
+    for gender, words in GENDER_ENGLISH.items():
+        if any(re.search(rf"(?<![a-z]){w}(?![a-z])", lowered) for w in words):
+            found[gender] = max(found.get(gender, 0.0), 0.95)
+
+    # ทั้งประโยคเหลือแค่ "ชาย"/"หญิง" หลังตัดคำสุภาพ
+    stripped = lowered
+    for w in POLITE_WORDS:
+        stripped = stripped.replace(w, " ")
+    tokens = stripped.split()
+    for gender, word in GENDER_BARE.items():
+        if tokens == [word]:
+            found[gender] = max(found.get(gender, 0.0), 0.9)
+        elif word in tokens and gender not in found:
+            found[gender] = 0.7
+
+    if len(found) != 1:
+        return None, 0.0
+
+    gender, conf = found.popitem()
+    return (gender, conf) if validate_gender(gender) else (None, 0.0)
+
+
+def extract_license_plate(text: str) -> Tuple[Optional[str], float]:
+    spelled = _SPELL_RE.search(text) is not None
+    converted = _SPELL_RE.sub(lambda m: " " + THAI_SPELL_MAP[m.group(0)] + " ", text)
+    converted = digits_from_words(converted)
+
+    # เลข 10 หลัก (เบอร์โทร) ไม่ใช่ทะเบียน
+    converted = _DIGIT_RUN_RE.sub(
+        lambda m: " " if len(re.sub(r"\D", "", m.group(0))) > 4 else m.group(0), converted
+    )
+
+    candidates = set()
+    for m in _TH_PLATE_RE.finditer(converted):
+        candidates.add(normalize_license_plate(m.group(0)))
+    for m in _EN_PLATE_RE.finditer(converted.upper() if spelled else text):
+        candidates.add(normalize_license_plate(m.group(0)))
+    candidates = {c for c in candidates if validate_license_plate(c)}
+
+    if len(candidates) != 1:
+        return None, 0.0
+    return candidates.pop(), 0.9 if spelled else 0.85
+
+
+def extract_rule_based(
+    transcript: str,
+    expected_fields: Optional[List[str]] = None,
+) -> Dict[str, Tuple[Optional[str], float]]:
+    """
+    ดึง phone / gender / license_plate จาก transcript ด้วย rule ล้วน (ไม่เรียก LLM)
+    คืน {field: (value, confidence)} confidence 0 = หาไม่ได้หรือกำกวม
+    ชื่อ-นามสกุลไม่มีรูปแบบตายตัว จึงให้ LLM เป็นคนดึงเสมอ
+    """
+    fields = expected_fields or ALL_FIELDS
+    out: Dict[str, Tuple[Optional[str], float]] = {f: (None, 0.0) for f in fields}
+
+    if "phone" in fields:
+        out["phone"] = extract_phone(transcript)
+    if "gender" in fields:
+        out["gender"] = extract_gender(transcript)
+    if "license_plate" in fields:
+        out["license_plate"] = extract_license_plate(transcript)
+
+    return out
+
+
+def confident_fields(
+    transcript: str,
+    expected_fields: Optional[List[str]] = None,
+    threshold: float = RULE_CONFIDENCE_THRESHOLD,
+) -> Dict[str, str]:
+    """เฉพาะ field ที่ rule มั่นใจถึงเกณฑ์"""
+    return {
+        field: value
+        for field, (value, conf) in extract_rule_based(transcript, expected_fields).items()
+        if value is not None and conf >= threshold
+    }
@@ -0,0 +1,256 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+# =====================
+# Config
+# =====================
+# memory: เก็บใน process (ใช้ได้กับ uvicorn worker เดียว)
+# sqlite: ไฟล์ sqlite (WAL) ใช้ร่วมกันได้ทุก worker บนเครื่องเดียวกัน
+SESSION_STORE = os.getenv("SESSION_STORE", "memory")
+SESSION_STORE_PATH = os.getenv("SESSION_STORE_PATH", ".cache/sessions.sqlite3")
+SESSION_TTL = float(os.getenv("SESSION_TTL", "1800"))
+SESSION_MAX = int(os.getenv("SESSION_MAX", "10000"))
+
+
+def _encode(record: Dict[str, Any]) -> bytes:
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _decode(raw: bytes) -> Dict[str, Any]:
+    return json.loads(raw)
+
+
+class MemorySessionStore:
+    """
+    session ในหน่วยความจำ
+    - หมดอายุเมื่อไม่มีการใช้งานเกิน ttl วินาที
+    - เกิน max_entries จะ evict session ที่ไม่ได้ใช้นานที่สุด (LRU)
+    - เก็บแต่ละ session เป็น JSON bytes (เล็กกว่า dict และ get คืนสำเนาเสมอ)
+    """
+
+    def __init__(self, ttl: float = SESSION_TTL, max_entries: int = SESSION_MAX):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._items: "OrderedDict[str, tuple[float, bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.expired = 0
+        self.evicted = 0
+
+    def _purge_expired(self, now: float) -> None:
+        # เรียงตามเวลาใช้งานล่าสุด ตัวแรกคือเก่าที่สุด
+        while self._items:
+            session_id, (expires, _) = next(iter(self._items.items()))
+            if expires > now:
+                break
+            del self._items[session_id]
+            self.expired += 1
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            self._purge_expired(now)
+            item = self._items.get(session_id)
+            if item is None:
+                return None
+            self._items[session_id] = (now + self.ttl, item[1])
+            self._items.move_to_end(session_id)
+            return _decode(item[1])
+
+    def put(self, session_id: str, record: Dict[str, Any]) -> None:
+        now = time.time()
+        with self._lock:
+            self._items[session_id] = (now + self.ttl, _encode(record))
+            self._items.move_to_end(session_id)
+            self._purge_expired(now)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+                self.evicted += 1
+
+    def update(self, session_id: str, fn: Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]) -> bool:
+        """
+        แก้ record แบบ atomic: fn รับ record ปัจจุบัน คืน record ใหม่ (None = ไม่แก้)
+        session ที่ถูกลบ / หมดอายุไปแล้วจะไม่ถูกสร้างใหม่ ไม่ต่ออายุ session (ไม่ใช่การใช้งานของ user)
+        """
+        now = time.time()
+        with self._lock:
+            item = self._items.get(session_id)
+            if item is None or item[0] <= now:
+                return False
+            record = fn(_decode(item[1]))
+            if record is None:
+                return False
+            self._items[session_id] = (item[0], _encode(record))
+            return True
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._items.pop(session_id, None)
+
+    # ---------- async (เรียกจาก event loop) ----------
+    # อยู่ในหน่วยความจำ ไม่ block จึงเรียกตรง ๆ ได้
+    async def aget(self, session_id: str) -> Optional[Dict[str, Any]]:
+        return self.get(session_id)
+
+    async def aput(self, session_id: str, record: Dict[str, Any]) -> None:
+        self.put(session_id, record)
+
+    async def aupdate(self, session_id: str, fn: Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]) -> bool:
+        return self.update(session_id, fn)
+
+    async def adelete(self, session_id: str) -> None:
+        self.delete(session_id)
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._purge_expired(time.time())
+            return len(self._items)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "memory",
+            "active": len(self),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
+
+
+class SqliteSessionStore:
+    """
+    session ในไฟล์ sqlite (WAL) ใช้ร่วมกันได้หลาย process
+    ทำให้รัน uvicorn หลาย worker ได้โดยไม่ต้อง sticky routing
+    """
+
+    def __init__(self, path: str = SESSION_STORE_PATH, ttl: float = SESSION_TTL, max_entries: int = SESSION_MAX):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._writes_since_trim = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        db = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " id TEXT PRIMARY KEY,"
+            " record BLOB NOT NULL,"
+            " expires REAL NOT NULL)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS sessions_expires ON sessions(expires)")
+        db.commit()
+        self._db = db
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT record FROM sessions WHERE id = ? AND expires > ?", (session_id, now)
+            ).fetchone()
+            if row is None:
+                return None
+
+            self._db.execute("UPDATE sessions SET expires = ? WHERE id = ?", (now + self.ttl, session_id))
+            self._db.commit()
+            return _decode(row[0])
+
+    def put(self, session_id: str, record: Dict[str, Any]) -> None:
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO sessions (id, record, expires) VALUES (?, ?, ?)",
+                (session_id, _encode(record), now + self.ttl),
+            )
+
+            # ลบ session หมดอายุ / เกินจำนวน เป็นระยะ ไม่ต้องทำทุกครั้งที่เขียน
+            self._writes_since_trim += 1
+            if self._writes_since_trim >= 100:
+                self._writes_since_trim = 0
+                self._db.execute("DELETE FROM sessions WHERE expires <= ?", (now,))
+                self._db.execute(
+                    "DELETE FROM sessions WHERE id IN "
+                    "(SELECT id FROM sessions ORDER BY expires DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+            self._db.commit()
+
+    def update(self, session_id: str, fn: Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]) -> bool:
+        """
+        แก้ record แบบ atomic: fn รับ record ปัจจุบัน คืน record ใหม่ (None = ไม่แก้)
+        อ่านและเขียนใน transaction เดียว (BEGIN IMMEDIATE) worker อื่นเขียนแทรกระหว่างกลางไม่ได้
+        session ที่ถูกลบ / หมดอายุไปแล้วจะไม่ถูกสร้างใหม่ ไม่ต่ออายุ session (ไม่ใช่การใช้งานของ user)
+        """
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT record FROM sessions WHERE id = ? AND expires > ?", (session_id, time.time())
+                ).fetchone()
+                record = fn(_decode(row[0])) if row is not None else None
+                if record is None:
+                    self._db.rollback()
+                    return False
+                self._db.execute("UPDATE sessions SET record = ? WHERE id = ?", (_encode(record), session_id))
+                self._db.commit()
+                return True
+            except BaseException:
+                self._db.rollback()
+                raise
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            self._db.commit()
+
+    # ---------- async (เรียกจาก event loop) ----------
+    # เขียนที่ติด lock ของ worker อื่นรอได้ถึง timeout (10 วินาที) จึงรันใน thread ไม่ให้ event loop ค้าง
+    async def aget(self, session_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.get, session_id)
+
+    async def aput(self, session_id: str, record: Dict[str, Any]) -> None:
+        await asyncio.to_thread(self.put, session_id, record)
+
+    async def aupdate(self, session_id: str, fn: Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]) -> bool:
+        return await asyncio.to_thread(self.update, session_id, fn)
+
+    async def adelete(self, session_id: str) -> None:
+        await asyncio.to_thread(self.delete, session_id)
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            row = self._db.execute("SELECT COUNT(*) FROM sessions WHERE expires > ?", (time.time(),)).fetchone()
+            return row[0]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "active": len(self),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+        }
+
+
+def create_session_store(backend: str = SESSION_STORE):
+    if backend == "memory":
+        return MemorySessionStore()
+    if backend == "sqlite":
+        return SqliteSessionStore()
+    raise ValueError(f"unknown SESSION_STORE: {backend!r} (expected 'memory' or 'sqlite')")
@@ -0,0 +1,116 @@
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from rule_extractor import confident_fields
+
+# =====================
+# Config
+# =====================
+SAMPLE_RATE = 16000
+FRAME_MS = 30
+
+# energy VAD: RMS ที่ถือว่าเป็นเสียงพูด และช่วงเงียบที่ใช้ตัด segment
+STREAM_VAD_THRESHOLD = float(os.getenv("STREAM_VAD_THRESHOLD", "0.01"))
+STREAM_SILENCE_MS = int(os.getenv("STREAM_SILENCE_MS", "500"))
+STREAM_MIN_SPEECH_MS = int(os.getenv("STREAM_MIN_SPEECH_MS", "200"))
+STREAM_MAX_SEGMENT_SECONDS = float(os.getenv("STREAM_MAX_SEGMENT_SECONDS", "15"))
+
+# เก็บเสียงก่อนเริ่มพูดไว้นิดหน่อย กันพยางค์แรกหาย
+PRE_ROLL_MS = 200
+
+
+class SegmentBuffer:
+    """
+    รับ PCM 16-bit mono 16 kHz ทีละ frame แล้วตัดเป็น segment ตามช่วงเงียบ
+    - feed(): คืน list ของ segment (float32) ที่จบแล้ว
+    - flush(): คืน segment ที่ค้างอยู่ตอนปิด stream
+    """
+
+    def __init__(self):
+        self.frame_samples = SAMPLE_RATE * FRAME_MS // 1000
+        self._pending = np.zeros(0, dtype=np.float32)
+        self._pre_roll: List[np.ndarray] = []
+        self._speech: List[np.ndarray] = []
+        self._speech_frames = 0
+        self._silence_frames = 0
+        self.total_samples = 0
+
+    @property
+    def total_seconds(self) -> float:
+        return self.total_samples / SAMPLE_RATE
+
+    def feed(self, pcm: bytes) -> List[np.ndarray]:
+        usable = len(pcm) - (len(pcm) % 2)
+        samples = np.frombuffer(pcm[:usable], dtype="<i2").astype(np.float32) / 32768.0
+        self.total_samples += len(samples)
+        self._pending = np.concatenate([self._pending, samples])
+
+        ready = []
+        while len(self._pending) >= self.frame_samples:
+            frame = self._pending[:self.frame_samples]
+            self._pending = self._pending[self.frame_samples:]
+            segment = self._push_frame(frame)
+            if segment is not None:
+                ready.append(segment)
+        return ready
+
+    def _push_frame(self, frame: np.ndarray) -> Optional[np.ndarray]:
+        is_speech = float(np.sqrt(np.mean(frame ** 2))) >= STREAM_VAD_THRESHOLD
+
+        if not self._speech:
+            if is_speech:
+                self._speech = self._pre_roll + [frame]
+                self._pre_roll = []
+                self._speech_frames = 1
+                self._silence_frames = 0
+            else:
+                self._pre_roll.append(frame)
+                self._pre_roll = self._pre_roll[-(PRE_ROLL_MS // FRAME_MS):]
+            return None
+
+        self._speech.append(frame)
+        if is_speech:
+            self._speech_frames += 1
+            self._silence_frames = 0
+        else:
+            self._silence_frames += 1
+
+        seg_ms = len(self._speech) * FRAME_MS
+        if (
+            self._silence_frames * FRAME_MS >= STREAM_SILENCE_MS
+            or seg_ms >= STREAM_MAX_SEGMENT_SECONDS * 1000
+        ):
+            return self._cut()
+        return None
+
+    def _cut(self) -> Optional[np.ndarray]:
+        speech, speech_frames = self._speech, self._speech_frames
+        self._speech = []
+        self._speech_frames = 0
+        self._silence_frames = 0
+
+        # สั้นเกินไป (เสียงคลิก / ลมหายใจ) -> ทิ้ง
+        if speech_frames * FRAME_MS < STREAM_MIN_SPEECH_MS:
+            return None
+        return np.concatenate(speech)
+
+    def flush(self) -> Optional[np.ndarray]:
+        if self._speech:
+            if len(self._pending):
+                self._speech.append(self._pending)
+            self._pending = np.zeros(0, dtype=np.float32)
+            return self._cut()
+        return None
+
+
+# =====================
+# Provisional fields
+# =====================
+def provisional_fields(transcript: str, expected_fields: Optional[List[str]] = None) -> Dict[str, str]:
+    """
+    เดาค่า field ระหว่าง stream ด้วย rule-based extractor (ไม่เรียก LLM)
+    คืนเฉพาะค่าที่ rule มั่นใจ ค่าจริงจะได้ตอนปิด stream
+    """
+    return confident_fields(transcript, expected_fields)
@@ -0,0 +1,198 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# =====================
+# Config
+# =====================
+# ขนาด batch สูงสุด (1 = ปิด batching ใช้ transcribe ทีละ request แบบเดิม)
+STT_BATCH_MAX_SIZE = int(os.getenv("STT_BATCH_MAX_SIZE", "1"))
+
+# เวลารอเก็บ request เข้า batch (ms) ยิ่งมากยิ่งได้ batch ใหญ่ แต่ latency เพิ่ม
+STT_BATCH_MAX_WAIT_MS = float(os.getenv("STT_BATCH_MAX_WAIT_MS", "30"))
+
+SAMPLE_RATE = 16000
+
+# Whisper encoder รับได้ครั้งละ 30 วินาที เสียงที่ยาวกว่านี้ไม่เข้า batch
+MAX_BATCH_AUDIO_SECONDS = 30.0
+
+# เกณฑ์ตัดผลที่เป็นความเงียบ (ค่าเดียวกับ default ของ faster-whisper)
+NO_SPEECH_THRESHOLD = 0.6
+LOG_PROB_THRESHOLD = -1.0
+
+
+class WhisperBatcher:
+    """
+    รวม request ที่เข้ามาพร้อมกันเป็น batch เดียว แล้ว encode/decode ครั้งเดียว
+    - เก็บ request ภายใน max_wait_ms หรือจนครบ max_batch_size
+    - แต่ละ request ได้ transcript ของตัวเองกลับไปผ่าน Future
+    ใช้กับเสียงสั้น (<= 30 วินาที) ซึ่งเป็นเคสหลักของระบบ (ชื่อ / เบอร์ / ทะเบียน)
+    """
+
+    def __init__(
+        self,
+        model,
+        beam_size: int = 10,
+        max_batch_size: int = STT_BATCH_MAX_SIZE,
+        max_wait_ms: float = STT_BATCH_MAX_WAIT_MS,
+    ):
+        self.model = model
+        self.beam_size = beam_size
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._queue: "queue.Queue[Tuple[np.ndarray, Future, float]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.batch_size_counts: Dict[int, int] = {}
+        self._wait_seconds_total = 0.0
+
+        self._thread = threading.Thread(target=self._loop, name="stt-batcher", daemon=True)
+        self._thread.start()
+
+    def accepts(self, audio: np.ndarray) -> bool:
+        return len(audio) <= MAX_BATCH_AUDIO_SECONDS * SAMPLE_RATE
+
+    def submit(self, audio: np.ndarray) -> Future:
+        fut: Future = Future()
+        self._queue.put((audio, fut, time.perf_counter()))
+        return fut
+
+    def transcribe(self, audio: np.ndarray) -> str:
+        return self.submit(audio).result()[0]
+
+    def transcribe_with_language(self, audio: np.ndarray) -> Tuple[str, str]:
+        """คืน (transcript, ภาษาที่ detect ได้)"""
+        return self.submit(audio).result()
+
+    # ---------- batching loop ----------
+    def _collect(self) -> List[Tuple[np.ndarray, Future, float]]:
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _loop(self) -> None:
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            audios = [item[0] for item in batch]
+
+            try:
+                results = self._decode_batch(audios)
+            except Exception as e:
+                for _, fut, _ in batch:
+                    fut.set_exception(e)
+                continue
+
+            with self._lock:
+                self.batches += 1
+                self.items += len(batch)
+                self.batch_size_counts[len(batch)] = self.batch_size_counts.get(len(batch), 0) + 1
+                self._wait_seconds_total += sum(started - enqueued for _, _, enqueued in batch)
+
+            for (_, fut, _), result in zip(batch, results):
+                fut.set_result(result)
+
+    def _decode_batch(self, audios: List[np.ndarray]) -> List[Tuple[str, str]]:
+        from faster_whisper.audio import pad_or_trim
+        from faster_whisper.tokenizer import Tokenizer
+        from faster_whisper.transcribe import get_suppressed_tokens
+
+        model = self.model
+        features = np.stack([
+            pad_or_trim(model.feature_extractor(audio), model.feature_extractor.nb_max_frames)
+            for audio in audios
+        ])
+        encoder_output = model.encode(features)
+
+        # ใช้ tokenizer ตั้งต้นสร้าง prompt แล้วค่อยแทน token ภาษาตามที่ detect ได้ทีละรายการ
+        tokenizer = Tokenizer(
+            model.hf_tokenizer,
+            model.model.is_multilingual,
+            task="transcribe",
+            language="en",
+        )
+        prompt = model.get_prompt(tokenizer, [], without_timestamps=True)
+        prompts = [list(prompt) for _ in audios]
+        languages = ["en"] * len(audios)
+
+        if model.model.is_multilingual:
+            lang_index = prompt.index(tokenizer.language)
+            for i, langs in enumerate(model.model.detect_language(encoder_output)):
+                prompts[i][lang_index] = tokenizer.tokenizer.token_to_id(langs[0][0])
+                languages[i] = langs[0][0][2:-2]  # "<|th|>" -> "th"
+
+        results = model.model.generate(
+            encoder_output,
+            prompts,
+            beam_size=self.beam_size,
+            max_length=model.max_length,
+            suppress_blank=True,
+            suppress_tokens=get_suppressed_tokens(tokenizer, [-1]),
+            return_scores=True,
+            return_no_speech_prob=True,
+        )
+
+        texts = []
+        for result, language in zip(results, languages):
+            tokens = result.sequences_ids[0]
+            avg_logprob = result.scores[0] * len(tokens) / (len(tokens) + 1)
+            # ความเงียบล้วน -> ข้อความว่าง (แทน vad_filter ของ path ปกติ)
+            if result.no_speech_prob > NO_SPEECH_THRESHOLD and avg_logprob < LOG_PROB_THRESHOLD:
+                texts.append(("", language))
+            else:
+                texts.append((tokenizer.decode(tokens).strip(), language))
+        return texts
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            avg_size = self.items / self.batches if self.batches else 0.0
+            avg_wait_ms = self._wait_seconds_total * 1000 / self.items if self.items else 0.0
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+                "batches": self.batches,
+                "items": self.items,
+                "avg_batch_size": round(avg_size, 2),
+                "avg_queue_wait_ms": round(avg_wait_ms, 1),
+                "batch_size_counts": dict(sorted(self.batch_size_counts.items())),
+                "pending": self._queue.qsize(),
+            }
+
+
+_batcher: Optional[WhisperBatcher] = None
+_batcher_lock = threading.Lock()
+
+
+def get_batcher() -> Optional[WhisperBatcher]:
+    """คืน batcher เมื่อเปิดใช้ (STT_BATCH_MAX_SIZE > 1) ไม่งั้นคืน None"""
+    global _batcher
+    if STT_BATCH_MAX_SIZE <= 1:
+        return None
+
+    with _batcher_lock:
+        if _batcher is None:
+            from model_loader import CONFIG, get_model
+
+            _batcher = WhisperBatcher(get_model(), beam_size=CONFIG["beam_size"])
+        return _batcher
+
+
+def batcher_stats() -> Optional[Dict[str, Any]]:
+    return _batcher.stats() if _batcher is not None else None
@@ -0,0 +1,236 @@
+import asyncio
+import math
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+# =====================
+# Config
+# =====================
+# จำนวน worker ที่ decode พร้อมกัน (ค่า default อิงจำนวน core)
+# faster-whisper/ctranslate2 ปล่อย GIL ระหว่าง decode จึงใช้ thread ได้
+STT_WORKERS = int(os.getenv("STT_WORKERS", "0")) or max(1, (os.cpu_count() or 2) // 4)
+
+# จำนวนงานที่รอคิวได้ก่อนจะปฏิเสธ (ไม่นับงานที่กำลัง decode อยู่)
+STT_QUEUE_SIZE = int(os.getenv("STT_QUEUE_SIZE", str(STT_WORKERS * 4)))
+
+# job แบบ async: จำนวน job ที่ค้างได้ และเก็บผลไว้นานแค่ไหน (วินาที)
+STT_MAX_JOBS = int(os.getenv("STT_MAX_JOBS", str(STT_QUEUE_SIZE * 2)))
+STT_JOB_TTL = float(os.getenv("STT_JOB_TTL", "600"))
+
+
+class STTQueueFull(Exception):
+    """คิว STT เต็ม ให้ client ลองใหม่ภายหลัง"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"STT queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class JobStoreFull(Exception):
+    """มี job ค้างเกินกำหนด"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"too many pending jobs, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+# =====================
+# Worker pool
+# =====================
+class STTWorkerPool:
+    """
+    Pool สำหรับงาน decode เสียงที่กิน CPU
+    - จำกัดจำนวน decode พร้อมกันเท่ากับ workers
+    - มีคิวแบบจำกัดขนาด ถ้าเต็มจะ raise STTQueueFull ทันที (backpressure)
+    """
+
+    def __init__(self, workers: int = STT_WORKERS, queue_size: int = STT_QUEUE_SIZE):
+        self.workers = workers
+        self.queue_size = queue_size
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="stt")
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._lock = threading.Lock()
+        self._inflight = 0
+        # ค่าเฉลี่ยเวลา decode แบบ EWMA ใช้ประมาณ Retry-After
+        self._avg_seconds = 5.0
+        self.completed = 0
+        self.rejected = 0
+
+    @property
+    def depth(self) -> int:
+        """จำนวนงานที่อยู่ในระบบ (รอคิว + กำลัง decode)"""
+        return self._inflight
+
+    def retry_after(self) -> int:
+        waves = math.ceil((self._inflight + 1) / self.workers)
+        return max(1, math.ceil(waves * self._avg_seconds))
+
+    def run(self, fn: Callable[..., Any], *args, block: bool = False, **kwargs) -> Any:
+        """
+        รัน fn ใน worker แล้วรอผล
+        block=False: คิวเต็มจะ raise STTQueueFull (ใช้กับ request แบบ sync)
+        block=True: รอจนมีที่ว่าง (ใช้กับ job ที่รับเข้ามาแล้ว)
+        """
+        if not self._slots.acquire(blocking=block):
+            self.rejected += 1
+            raise STTQueueFull(self.retry_after())
+
+        try:
+            return self._submit(fn, args, kwargs).result()
+        finally:
+            self._done()
+
+    async def arun(self, fn: Callable[..., Any], *args, block: bool = False, **kwargs) -> Any:
+        """
+        run() สำหรับ coroutine: รอผลโดยไม่ถือ thread ของ event loop ไว้
+        ถ้า coroutine ถูกยกเลิก (client หลุด) งานที่ยังไม่เริ่ม decode จะถูกถอนออกจากคิว
+        ส่วนงานที่ decode อยู่แล้วจะรันจนจบ แต่ไม่มีใครรอผล
+        """
+        if not self._slots.acquire(blocking=False):
+            if not block:
+                self.rejected += 1
+                raise STTQueueFull(self.retry_after())
+            # คิวเต็ม: รอ slot แบบ poll เพื่อไม่ block event loop (ยกเลิกระหว่างรอได้)
+            while not self._slots.acquire(blocking=False):
+                await asyncio.sleep(0.05)
+
+        future = self._submit(fn, args, kwargs)
+        # คืน slot เมื่องานจบจริง (หรือถูกถอนจากคิว) ไม่ใช่ตอน coroutine เลิกรอ
+        future.add_done_callback(lambda _: self._done())
+        # wrap_future ส่งต่อการ cancel ไปที่ future ของ executor ด้วย
+        return await asyncio.wrap_future(future)
+
+    def _submit(self, fn: Callable[..., Any], args: tuple, kwargs: Dict[str, Any]):
+        with self._lock:
+            self._inflight += 1
+
+        def _task():
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                with self._lock:
+                    self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * elapsed
+                    self.completed += 1
+
+        return self._executor.submit(_task)
+
+    def _done(self) -> None:
+        with self._lock:
+            self._inflight -= 1
+        self._slots.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "depth": self._inflight,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_decode_seconds": round(self._avg_seconds, 3),
+        }
+
+
+# =====================
+# Async jobs
+# =====================
+class Job:
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.status = "queued"
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.done = threading.Event()
+
+    def to_dict(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"job_id": self.job_id, "status": self.status}
+        if self.result is not None:
+            out["result"] = self.result
+        if self.error is not None:
+            out["error"] = self.error
+        return out
+
+
+class JobStore:
+    """
+    เก็บ job แบบ submit แล้ว poll/wait ด้วย job_id
+    ตัว job รันบน thread แยก ส่วน STT ข้างในยังผ่าน STTWorkerPool เหมือนเดิม
+    """
+
+    def __init__(self, max_jobs: int = STT_MAX_JOBS, ttl: float = STT_JOB_TTL):
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix="stt-job")
+
+    def _purge(self) -> None:
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished_at is not None and now - job.finished_at > self.ttl
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def pending(self) -> int:
+        return sum(1 for job in self._jobs.values() if not job.done.is_set())
+
+    def submit(self, fn: Callable[..., Dict[str, Any]], *args, **kwargs) -> Job:
+        with self._lock:
+            self._purge()
+            if self.pending() >= self.max_jobs:
+                raise JobStoreFull(get_stt_pool().retry_after())
+            job = Job(str(uuid.uuid4()))
+            self._jobs[job.job_id] = job
+
+        def _task():
+            job.status = "running"
+            try:
+                job.result = fn(*args, **kwargs)
+                job.status = "done"
+            except Exception as e:
+                job.error = str(getattr(e, "detail", None) or e)
+                job.status = "failed"
+            finally:
+                job.finished_at = time.time()
+                job.done.set()
+
+        self._executor.submit(_task)
+        return job
+
+    def get(self, job_id: str, wait: float = 0.0) -> Optional[Job]:
+        with self._lock:
+            self._purge()
+            job = self._jobs.get(job_id)
+        if job is not None and wait > 0:
+            job.done.wait(wait)
+        return job
+
+
+_pool: Optional[STTWorkerPool] = None
+_jobs: Optional[JobStore] = None
+_init_lock = threading.Lock()
+
+
+def get_stt_pool() -> STTWorkerPool:
+    global _pool
+    with _init_lock:
+        if _pool is None:
+            _pool = STTWorkerPool()
+        return _pool
+
+
+def get_job_store() -> JobStore:
+    global _jobs
+    with _init_lock:
+        if _jobs is None:
+            _jobs = JobStore()
+        return _jobs
@@ -0,0 +1,67 @@
+import json
+import os
+import tempfile
+import unittest
+
+from batch_cli import load_checkpoint, repair_checkpoint, run_batch
+
+
+def _row(item_id: str, **extra) -> str:
+    return json.dumps({"id": item_id, "status": "complete", **extra}, ensure_ascii=False) + "\n"
+
+
+class CheckpointTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.output = os.path.join(self.dir.name, "results.jsonl")
+
+    def _write(self, text: str) -> None:
+        with open(self.output, "w", encoding="utf-8") as f:
+            f.write(text)
+
+    def _read(self) -> str:
+        with open(self.output, "r", encoding="utf-8") as f:
+            return f.read()
+
+    def test_done_ids_skip_errors_and_partial_line(self):
+        self._write(_row("a") + _row("b", error="stt: boom") + '{"id": "c", "sta')
+        self.assertEqual(load_checkpoint(self.output), {"a"})
+
+    def test_missing_file(self):
+        self.assertEqual(load_checkpoint(self.output), set())
+        repair_checkpoint(self.output)
+        self.assertFalse(os.path.exists(self.output))
+
+    def test_repair_drops_partial_last_line(self):
+        self._write(_row("a") + _row("ชื่อ") + '{"id": "c", "sta')
+        repair_checkpoint(self.output)
+        self.assertEqual(self._read(), _row("a") + _row("ชื่อ"))
+
+    def test_repair_keeps_complete_file(self):
+        self._write(_row("a"))
+        repair_checkpoint(self.output)
+        self.assertEqual(self._read(), _row("a"))
+
+    def test_repair_partial_only_line(self):
+        self._write('{"id": "a"')
+        repair_checkpoint(self.output)
+        self.assertEqual(self._read(), "")
+
+    def test_resume_appends_on_a_clean_line(self):
+        manifest = os.path.join(self.dir.name, "manifest.jsonl")
+        with open(manifest, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"id": "a", "audio": "a.wav"}) + "\n")
+            f.write(json.dumps({"id": "b", "audio": "b.wav"}) + "\n")
+        self._write(_row("a") + '{"id": "b", "sta')
+
+        # limit=0: ไม่ต้องโหลด Whisper แค่เช็คว่าเตรียม checkpoint ก่อนเขียนต่อ
+        summary = run_batch(manifest, self.output, stt_workers=1, llm_workers=1, limit=0)
+        self.assertEqual(summary["skipped"], 1)
+        with open(self.output, "a", encoding="utf-8") as f:
+            f.write(_row("b"))
+        self.assertEqual(load_checkpoint(self.output), {"a", "b"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+
+from plate_normalizer import normalize_license_plate, normalize_many
+
+# ผลของ normalizer เดิม (ก่อนรวมเป็น regex ชุดเดียว) ต้องได้เหมือนเดิมทุกค่า
+CASES = [
+    (None, None),
+    ("", None),
+    ("กข1234", "กข1234"),
+    ("กข 1234", "กข1234"),
+    ("ก ข 1 2 3 4", "กข1234"),
+    ("กอไก่ขอไข่1234", "กข1234"),
+    ("ทะเบียน กอไก่ ขอไข่ หนึ่งสองสามสี่", None),
+    ("ทะเบียนรถ 1กข 1234 กรุงเทพ", None),
+    ("AB-1234", "AB1234"),
+    ("ab 1234", "AB1234"),
+    ("1กข1234", None),
+    ("กขค 12345", None),
+    ("กทม 3กก 555", None),
+    ("ขข-12", "ขข12"),
+    ("ทะเบียน ABC 12 ค่ะ", "ABC12"),
+    ("ฮ1", "ฮ1"),
+    ("ไม่รู้ครับ", None),
+    ("กข1234 กค5678", None),
+]
+
+
+class NormalizeLicensePlateTest(unittest.TestCase):
+    def test_known_outputs(self):
+        for text, expected in CASES:
+            with self.subTest(text=text):
+                self.assertEqual(normalize_license_plate(text), expected)
+
+
+class NormalizeManyTest(unittest.TestCase):
+    def test_parity_with_single_calls(self):
+        texts = [text for text, _ in CASES]
+        self.assertEqual(normalize_many(texts), [normalize_license_plate(t) for t in texts])
+
+    def test_duplicates_and_order(self):
+        texts = ["กข 1234", None, "AB-1234", "กข 1234", "ไม่รู้ครับ", "AB-1234"]
+        self.assertEqual(normalize_many(texts), ["กข1234", None, "AB1234", "กข1234", None, "AB1234"])
+
+    def test_accepts_any_iterable(self):
+        self.assertEqual(normalize_many(t for t in ["ขข-12", "ฮ1"]), ["ขข12", "ฮ1"])
+        self.assertEqual(normalize_many([]), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
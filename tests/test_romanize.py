@@ -0,0 +1,39 @@
+import unittest
+from unittest import mock
+
+import romanize
+from kv_cache import TieredCache
+
+
+class RomanizeCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = TieredCache("romanize", max_entries=64)
+        patcher = mock.patch.object(romanize, "romanize_cache", self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_romanized_name_is_cached(self):
+        with mock.patch.object(romanize, "chat", return_value="Somchai") as chat:
+            self.assertEqual(romanize.romanize_names(["สมชาย"]), ["Somchai"])
+            self.assertEqual(romanize.romanize_names(["สมชาย"]), ["Somchai"])
+        self.assertEqual(chat.call_count, 1)
+
+    def test_fallback_is_not_cached(self):
+        # LLM ไม่แน่ใจคืนชื่อไทยเดิม / ผลใช้ไม่ได้ -> ได้ชื่อไทยกลับ แต่ไม่เก็บใน cache
+        for reply in ["สมชาย", "", '{"name": "Somchai"}']:
+            with mock.patch.object(romanize, "chat", return_value=reply):
+                self.assertEqual(romanize.romanize_names(["สมชาย"]), ["สมชาย"])
+            self.assertIsNone(self.cache.get(romanize._cache_key("สมชาย")))
+
+        with mock.patch.object(romanize, "chat", return_value="Somchai"):
+            self.assertEqual(romanize.romanize_names(["สมชาย"]), ["Somchai"])
+
+    def test_batch_caches_only_romanized_names(self):
+        with mock.patch.object(romanize, "chat", return_value='["Somchai", "ใจดี"]'):
+            self.assertEqual(romanize.romanize_names(["สมชาย", "ใจดี"]), ["Somchai", "ใจดี"])
+        self.assertEqual(self.cache.get(romanize._cache_key("สมชาย")), "Somchai")
+        self.assertIsNone(self.cache.get(romanize._cache_key("ใจดี")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import asyncio
+import json
+import unittest
+from unittest import mock
+
+import api_server
+import llm_scheduler
+import romanize
+from kv_cache import TieredCache
+from llm_scheduler import PRIORITY_COMPLETION, PRIORITY_FIRST_TURN, PRIORITY_NAMES, LLMScheduler
+
+DATA = {"first_name": "สมชาย", "last_name": "ใจดี", "gender": "male", "phone": "0812345678", "license_plate": None}
+
+
+class RomanizeAheadTest(unittest.IsolatedAsyncioTestCase):
+    """รอบที่ครบต้องไม่รอ romanize ล่วงหน้าที่ยังไม่ได้ slot ขณะ LLM เต็ม"""
+
+    async def asyncSetUp(self):
+        # LLM ส่งได้ทีละงาน และมีงานของ user อื่นถือ slot อยู่
+        self.scheduler = LLMScheduler(max_inflight=1)
+        self.calls: list[str] = []
+        self.hog_release = asyncio.Event()
+        patches = [
+            mock.patch.object(llm_scheduler, "_scheduler", self.scheduler),
+            mock.patch.object(romanize, "achat", self._fake_achat),
+            mock.patch.object(api_server, "ROMANIZE_AHEAD", True),
+            mock.patch.object(romanize, "romanize_cache", TieredCache("romanize", max_entries=64)),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        api_server.sessions.put("s1", {"data": dict(DATA), "missing_fields": ["license_plate"], "romanized": {}})
+        self.addCleanup(api_server.sessions.delete, "s1")
+
+    async def _fake_achat(self, messages, priority=PRIORITY_FIRST_TURN):
+        async with self.scheduler.aslot(priority):
+            self.calls.append(PRIORITY_NAMES[priority])
+            await asyncio.sleep(0.01)
+        names = json.loads(messages[-1]["content"])
+        return json.dumps([f"EN-{len(name)}" for name in names])
+
+    async def _hold_slot(self):
+        async with self.scheduler.aslot(PRIORITY_FIRST_TURN):
+            await self.hog_release.wait()
+
+    async def _first_turn(self):
+        async with self.scheduler.aslot(PRIORITY_FIRST_TURN):
+            self.calls.append("first_turn")
+            await asyncio.sleep(0.01)
+
+    async def _complete(self):
+        known = await api_server._romanized_so_far("s1", DATA)
+        return await api_server.aromanize_person(DATA, known=known, priority=PRIORITY_COMPLETION)
+
+    async def test_completion_skips_queued_speculative_task(self):
+        hog = asyncio.create_task(self._hold_slot())
+        await asyncio.sleep(0)
+        api_server._romanize_ahead("s1", DATA, {})
+        speculative = api_server._romanize_tasks["s1"][1]
+        others = [asyncio.create_task(self._first_turn()) for _ in range(3)]
+        await asyncio.sleep(0.05)
+
+        completion = asyncio.create_task(self._complete())
+        await asyncio.sleep(0.05)
+        self.hog_release.set()
+        result = await asyncio.wait_for(completion, 5)
+        await asyncio.gather(hog, *others)
+
+        self.assertTrue(speculative.cancelled())
+        self.assertEqual(self.calls[0], "completion")
+        self.assertNotIn("speculative", self.calls)
+        self.assertEqual(result["first_name"], "EN-5")
+
+    async def test_completion_waits_for_running_speculative_task(self):
+        api_server._romanize_ahead("s1", DATA, {})
+        speculative = api_server._romanize_tasks["s1"][1]
+        await asyncio.sleep(0.001)
+        self.assertTrue(api_server._romanize_tasks["s1"][2].is_set())
+
+        # request ที่รอผลหลุดไป ต้องไม่ยกเลิกงานที่ได้ slot แล้ว
+        dropped = asyncio.create_task(api_server._romanized_so_far("s1", DATA))
+        await asyncio.sleep(0)
+        dropped.cancel()
+        await asyncio.sleep(0)
+        self.assertFalse(speculative.cancelled())
+
+        result = await asyncio.wait_for(self._complete(), 5)
+        self.assertEqual(self.calls, ["speculative"])
+        self.assertEqual(result["last_name"], "EN-4")
+
+
+if __name__ == "__main__":
+    unittest.main()
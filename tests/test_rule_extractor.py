@@ -0,0 +1,61 @@
+import unittest
+
+from rule_extractor import confident_fields, digits_from_words, extract_gender, extract_license_plate, extract_phone
+
+
+class DigitWordsTest(unittest.TestCase):
+    def test_spoken_run(self):
+        self.assertEqual(digits_from_words("ศูนย์แปดหนึ่ง สองสามสี่"), "081 234")
+
+    def test_digit_words_inside_ordinary_words_are_kept(self):
+        self.assertEqual(digits_from_words("เบอร์โทรศัพท์"), "เบอร์โทรศัพท์")
+        self.assertEqual(digits_from_words("สามีห้ามนั่งเก้าอี้"), "สามีห้ามนั่งเก้าอี้")
+
+    def test_single_word_at_token_boundary(self):
+        self.assertEqual(digits_from_words("กข หนึ่ง"), "กข 1")
+
+
+class PhoneTest(unittest.TestCase):
+    def test_spoken_phone_after_phone_word(self):
+        text = "เบอร์โทรศัพท์ศูนย์แปดหนึ่งสองสามสี่ห้าหกเจ็ดแปดครับ"
+        self.assertEqual(extract_phone(text), ("0812345678", 0.95))
+
+    def test_two_different_numbers_are_ambiguous(self):
+        self.assertEqual(extract_phone("0812345678 หรือ 0899999999"), (None, 0.0))
+
+
+class GenderTest(unittest.TestCase):
+    def test_nickname_man_is_not_a_gender(self):
+        self.assertEqual(extract_gender("my name is Man"), (None, 0.0))
+
+    def test_name_containing_chai_is_not_a_gender(self):
+        self.assertEqual(extract_gender("ชื่อสมชาย")[0], None)
+
+    def test_strong_word(self):
+        self.assertEqual(extract_gender("เพศชายครับ"), ("male", 0.95))
+
+
+class LicensePlateTest(unittest.TestCase):
+    def test_thai_plate(self):
+        self.assertEqual(extract_license_plate("ทะเบียน กข 1234 ครับ"), ("กข1234", 0.85))
+
+    def test_spelled_plate(self):
+        self.assertEqual(extract_license_plate("กอไก่ขอไข่หนึ่งสองสามสี่"), ("กข1234", 0.9))
+
+    def test_leading_province_digit_is_not_dropped(self):
+        self.assertEqual(extract_license_plate("1กข1234"), (None, 0.0))
+        self.assertEqual(extract_license_plate("ทะเบียน 1กข1234 ครับ"), (None, 0.0))
+
+    def test_phone_is_not_a_plate(self):
+        self.assertEqual(extract_license_plate("0812345678"), (None, 0.0))
+
+
+class ConfidentFieldsTest(unittest.TestCase):
+    def test_only_requested_fields(self):
+        text = "เบอร์ 0812345678 ทะเบียน กข1234"
+        self.assertEqual(confident_fields(text, ["phone"]), {"phone": "0812345678"})
+        self.assertEqual(confident_fields(text), {"phone": "0812345678", "license_plate": "กข1234"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import os
+import tempfile
+import unittest
+
+from session_store import MemorySessionStore, SqliteSessionStore
+
+
+def _add_romanized(record):
+    return {**record, "romanized": {"สมชาย": "Somchai"}}
+
+
+class _StoreUpdateTests:
+    def make_store(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.store = self.make_store()
+
+    def test_update_changes_only_what_fn_returns(self):
+        self.store.put("s1", {"data": {"first_name": "สมชาย"}, "romanized": {}})
+        self.assertTrue(self.store.update("s1", _add_romanized))
+        self.assertEqual(self.store.get("s1"), {"data": {"first_name": "สมชาย"}, "romanized": {"สมชาย": "Somchai"}})
+
+    def test_update_does_not_recreate_deleted_session(self):
+        self.store.put("s1", {"data": {}, "romanized": {}})
+        self.store.delete("s1")
+        self.assertFalse(self.store.update("s1", _add_romanized))
+        self.assertIsNone(self.store.get("s1"))
+
+    def test_update_none_is_a_no_op(self):
+        self.store.put("s1", {"data": {}, "romanized": {}})
+        self.assertFalse(self.store.update("s1", lambda record: None))
+        self.assertEqual(self.store.get("s1"), {"data": {}, "romanized": {}})
+
+
+class MemoryStoreTest(_StoreUpdateTests, unittest.TestCase):
+    def make_store(self):
+        return MemorySessionStore(ttl=60, max_entries=10)
+
+
+class SqliteStoreTest(_StoreUpdateTests, unittest.TestCase):
+    def make_store(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "sessions.sqlite3")
+        return SqliteSessionStore(self.path, ttl=60, max_entries=10)
+
+    def test_update_sees_write_from_another_worker(self):
+        other = SqliteSessionStore(self.path, ttl=60, max_entries=10)
+        self.store.put("s1", {"data": {"phone": None}, "romanized": {}})
+        other.put("s1", {"data": {"phone": "0812345678"}, "romanized": {}})
+        self.assertTrue(self.store.update("s1", _add_romanized))
+        self.assertEqual(other.get("s1")["data"], {"phone": "0812345678"})
+
+    def test_update_after_delete_by_another_worker(self):
+        other = SqliteSessionStore(self.path, ttl=60, max_entries=10)
+        self.store.put("s1", {"data": {}, "romanized": {}})
+        other.delete("s1")
+        self.assertFalse(self.store.update("s1", _add_romanized))
+        self.assertIsNone(other.get("s1"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+
+from api_server import UploadSizeLimit
+
+
+def _make_client(max_bytes: int) -> tuple[TestClient, list]:
+    app = FastAPI()
+    reached = []
+
+    @app.post("/process-audio")
+    async def process_audio(audio: UploadFile = File(...)):
+        reached.append(audio.filename)
+        return {"size": len(await audio.read())}
+
+    app.add_middleware(UploadSizeLimit, max_bytes=max_bytes)
+    return TestClient(app), reached
+
+
+class UploadSizeLimitTest(unittest.TestCase):
+    def test_small_upload_passes(self):
+        client, reached = _make_client(4096)
+        r = client.post("/process-audio", files={"audio": ("a.wav", b"x" * 1000, "audio/wav")})
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json(), {"size": 1000})
+        self.assertEqual(reached, ["a.wav"])
+
+    def test_content_length_over_limit_is_rejected_before_the_endpoint(self):
+        client, reached = _make_client(4096)
+        r = client.post("/process-audio", files={"audio": ("a.wav", b"x" * 10000, "audio/wav")})
+        self.assertEqual(r.status_code, 413)
+        self.assertEqual(reached, [])
+
+    def test_chunked_body_over_limit_is_rejected_while_reading(self):
+        client, reached = _make_client(4096)
+        boundary = "limit"
+        head = (
+            f'--{boundary}\r\nContent-Disposition: form-data; name="audio"; filename="a.wav"\r\n'
+            "Content-Type: audio/wav\r\n\r\n"
+        ).encode()
+
+        def body():
+            yield head
+            for _ in range(10):
+                yield b"x" * 1000
+            yield f"\r\n--{boundary}--\r\n".encode()
+
+        r = client.post(
+            "/process-audio",
+            content=body(),
+            headers={"Content-Type": f"multipart/form-data; boundary={boundary}"},
+        )
+        self.assertEqual(r.status_code, 413)
+        self.assertEqual(reached, [])
+
+    def test_other_paths_are_not_limited(self):
+        app = FastAPI()
+
+        @app.post("/echo")
+        async def echo(audio: UploadFile = File(...)):
+            return {"size": len(await audio.read())}
+
+        app.add_middleware(UploadSizeLimit, max_bytes=10)
+        r = TestClient(app).post("/echo", files={"audio": ("a.wav", b"x" * 1000, "audio/wav")})
+        self.assertEqual(r.status_code, 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -70,6 +70,9 @@ FIELD_THAI = {
     "license_plate": "ทะเบียนรถ"
 }
 
+# ตอบทันทีเมื่อไฟล์เสียงเงียบ / ว่าง (ไม่ต้องถอดเสียง)
+NO_SPEECH_MESSAGE = "ระบบไม่ได้ยินเสียงพูด รบกวนพูดอีกครั้ง"
+
 def build_message(missing_fields: List[str]) -> str:
     fields_th = [FIELD_THAI[f] for f in missing_fields]
     return (
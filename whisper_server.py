@@ -0,0 +1,226 @@
+"""
+Whisper model server: process เดียวถือ WhisperModel ไว้ ให้ API worker หลายตัวใช้ร่วมกันผ่าน Unix socket
+
+แต่ละ uvicorn worker ที่โหลด model เองจะกิน RAM หลาย GB (large int8)
+ตั้ง WHISPER_SERVER_SOCKET แล้ว transcribe_audio / speech_to_text จะส่งเสียงมาที่นี่แทน
+(ไม่ตั้ง = โหลด model ใน process เหมือนเดิม)
+
+Protocol (ต่อ connection ส่งได้หลาย request):
+    request:  <u32 ความยาว header> <header JSON> <PCM float32 little-endian จำนวน header["bytes"]>
+    response: <u32 ความยาว body> <body JSON> (ถ้าพังจะมี key "exception")
+header: {"op": "transcribe", "profile": {...}, "bytes": n} หรือ {"op": "state"}
+
+PCM ส่งจาก buffer ของ NumPy array ตรง ๆ (sendall(memoryview)) และฝั่ง server
+recv_into เข้า array ปลายทางเลย ไม่มีการ copy ผ่าน bytes กลางทาง
+
+รัน: python whisper_server.py [--socket /tmp/whisper.sock]
+ตัว server ใช้ config เดียวกับ model_loader (WHISPER_MODEL_SIZE, WHISPER_NUM_WORKERS, ...)
+และใช้ batching / เสียงยาว / cache ของ pipeline_full ร่วมกันทุก worker
+"""
+import argparse
+import json
+import logging
+import os
+import socket
+import socketserver
+import struct
+import threading
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# =====================
+# Config
+# =====================
+# path ของ Unix socket (ว่าง = โหลด Whisper ใน process เอง)
+WHISPER_SERVER_SOCKET = os.getenv("WHISPER_SERVER_SOCKET", "")
+
+# timeout ของ client ต่อ request (วินาที) รวมเวลารอคิวฝั่ง server
+WHISPER_SERVER_TIMEOUT = float(os.getenv("WHISPER_SERVER_TIMEOUT", "300"))
+
+_LEN = struct.Struct("<I")
+
+
+class WhisperServerError(RuntimeError):
+    """model server ตอบ error หรือเชื่อมต่อไม่ได้"""
+
+
+# =====================
+# Framing
+# =====================
+def _recv_into(sock: socket.socket, view: memoryview) -> None:
+    while len(view):
+        n = sock.recv_into(view)
+        if n == 0:
+            raise ConnectionError("socket closed")
+        view = view[n:]
+
+
+def _recv_exact(sock: socket.socket, n: int) -> bytes:
+    buf = bytearray(n)
+    _recv_into(sock, memoryview(buf))
+    return bytes(buf)
+
+
+def _send_json(sock: socket.socket, message: Dict[str, Any]) -> None:
+    body = json.dumps(message, ensure_ascii=False).encode("utf-8")
+    sock.sendall(_LEN.pack(len(body)) + body)
+
+
+def _recv_json(sock: socket.socket) -> Optional[Dict[str, Any]]:
+    head = sock.recv(_LEN.size, socket.MSG_WAITALL)
+    if not head:
+        return None
+    if len(head) < _LEN.size:
+        head += _recv_exact(sock, _LEN.size - len(head))
+    (length,) = _LEN.unpack(head)
+    return json.loads(_recv_exact(sock, length))
+
+
+# =====================
+# Server
+# =====================
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        sock = self.request
+        while True:
+            try:
+                header = _recv_json(sock)
+            except (ConnectionError, OSError):
+                return
+            if header is None:
+                return
+
+            try:
+                response = self._dispatch(sock, header)
+            except (ConnectionError, OSError):
+                return
+            except Exception as e:
+                logger.exception("transcription failed")
+                response = {"exception": str(e)}
+
+            try:
+                _send_json(sock, response)
+            except OSError:
+                return
+
+    def _dispatch(self, sock: socket.socket, header: Dict[str, Any]) -> Dict[str, Any]:
+        op = header.get("op")
+        if op == "state":
+            from model_loader import model_state
+
+            return model_state()
+
+        if op == "transcribe":
+            from pipeline_full import transcribe_local
+
+            # รับ PCM ลง array ปลายทางโดยตรง
+            audio = np.empty(header["bytes"] // 4, dtype="<f4")
+            _recv_into(sock, memoryview(audio).cast("B"))
+            result = transcribe_local(audio, header.get("profile"))
+            return {"text": result["text"], "language": result["language"], "skipped_seconds": result.get("skipped_seconds", 0.0)}
+
+        return {"exception": f"unknown op {op!r}"}
+
+
+class WhisperServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """thread ต่อ connection ตัว decode จำกัดด้วย WHISPER_NUM_WORKERS / batcher เหมือนใน process"""
+
+    daemon_threads = True
+
+    def __init__(self, path: str):
+        if os.path.exists(path):
+            os.unlink(path)
+        super().__init__(path, _Handler)
+        # ให้ process อื่นของ user / group เดียวกันเชื่อมต่อได้เท่านั้น
+        os.chmod(path, 0o660)
+
+
+def serve(path: str) -> None:
+    from model_loader import CONFIG, get_model
+
+    get_model()
+    server = WhisperServer(path)
+    logger.info("whisper server ready on %s (model=%s)", path, CONFIG["model_size"])
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+# =====================
+# Client
+# =====================
+_local = threading.local()
+
+
+def _connection() -> socket.socket:
+    """connection ต่อ thread (ใช้ซ้ำข้าม request)"""
+    sock = getattr(_local, "sock", None)
+    if sock is None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(WHISPER_SERVER_TIMEOUT)
+        sock.connect(WHISPER_SERVER_SOCKET)
+        _local.sock = sock
+    return sock
+
+
+def _drop_connection() -> None:
+    sock = getattr(_local, "sock", None)
+    _local.sock = None
+    if sock is not None:
+        sock.close()
+
+
+def _request(header: Dict[str, Any], payload: Optional[memoryview] = None) -> Dict[str, Any]:
+    # connection ที่ค้างไว้อาจถูก server ปิดไปแล้ว (restart) ลองใหม่ด้วย connection ใหม่หนึ่งครั้ง
+    for attempt in range(2):
+        try:
+            sock = _connection()
+            _send_json(sock, header)
+            if payload is not None:
+                sock.sendall(payload)
+            response = _recv_json(sock)
+            if response is None:
+                raise ConnectionError("whisper server closed the connection")
+            break
+        except (ConnectionError, OSError) as e:
+            _drop_connection()
+            if attempt == 1 or isinstance(e, socket.timeout):
+                raise WhisperServerError(f"whisper server at {WHISPER_SERVER_SOCKET}: {e}")
+
+    if "exception" in response:
+        raise WhisperServerError(response["exception"])
+    return response
+
+
+def remote_transcribe(audio: np.ndarray, profile: Dict[str, Any]) -> Dict[str, Any]:
+    """ส่ง PCM float32 16 kHz mono ไปถอดเสียงที่ model server คืน {"text", "language", "skipped_seconds"}"""
+    audio = np.ascontiguousarray(audio, dtype="<f4")
+    payload = memoryview(audio).cast("B")
+    return _request({"op": "transcribe", "profile": profile, "bytes": payload.nbytes}, payload)
+
+
+def remote_model_state() -> Dict[str, Any]:
+    """model_state() ของ server (ใช้ตอบ /readyz) เชื่อมต่อไม่ได้ = ยังไม่พร้อม"""
+    try:
+        return _request({"op": "state"})
+    except WhisperServerError as e:
+        return {"status": "unavailable", "error": str(e), "socket": WHISPER_SERVER_SOCKET}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--socket", default=WHISPER_SERVER_SOCKET or "/tmp/whisper.sock")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    serve(args.socket)
+
+
+if __name__ == "__main__":
+    main()